@@ -0,0 +1,173 @@
+"""Benchmark de inicialização da interface Streamlit: primeira pintura e latência de rerun.
+
+Exemplo::
+
+    python benchmarks/benchmark_inicializacao.py --execucoes 5 --reruns 20 --com-resultados
+
+Cada execução é um processo Python novo (partida a frio, sem módulos já
+importados) que roda ``test_proxy_mutum.py`` pelo ``AppTest`` do Streamlit,
+com os bancos SQLite numa pasta temporária, e mede:
+
+- tempo até a primeira pintura: do início do processo até o primeiro
+  elemento enviado ao navegador (o título), incluindo a importação do
+  Streamlit e do roteirizador;
+- tempo da primeira execução completa do script (recursos compartilhados
+  criados, barra lateral e entrada de dados desenhadas);
+- latência p50/p95 de ``--reruns`` reexecuções sem mudança na página e,
+  com ``--com-resultados``, também com o dashboard do lote de exemplo
+  da inserção manual, estimado contra o ORS simulado;
+- quais módulos pesados (pandas, folium, openrouteservice, geopy...) já
+  estavam carregados na primeira pintura e no fim da primeira execução.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+INICIO_PROCESSO = time.perf_counter()
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_APP = os.path.join(RAIZ, 'test_proxy_mutum.py')
+MODULOS_PESADOS = ('pandas', 'numpy', 'requests', 'openrouteservice', 'geopy', 'folium', 'folium.plugins',
+                   'streamlit_folium')
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def carregados():
+    return [nome for nome in MODULOS_PESADOS if nome in sys.modules]
+
+
+def cronometrar_reruns(at, reruns):
+    tempos = []
+    for _ in range(reruns):
+        inicio = time.perf_counter()
+        at.run()
+        tempos.append(time.perf_counter() - inicio)
+    return {
+        "p50 (ms)": round(1000 * percentil(tempos, 50), 1),
+        "p95 (ms)": round(1000 * percentil(tempos, 95), 1),
+    }
+
+
+def medir_processo(args):
+    """Uma partida a frio (roda no processo filho); devolve o dicionário de medidas."""
+    sys.path.insert(0, RAIZ)
+    from streamlit.runtime.scriptrunner_utils.script_run_context import ScriptRunContext
+    from streamlit.testing.v1 import AppTest
+
+    primeira_pintura = {}
+    enqueue_original = ScriptRunContext.enqueue
+
+    def enqueue(self, msg):
+        # O primeiro delta é o primeiro elemento que o navegador desenharia
+        if not primeira_pintura and msg.WhichOneof('type') == 'delta':
+            primeira_pintura['s'] = time.perf_counter() - INICIO_PROCESSO
+            primeira_pintura['modulos'] = carregados()
+        return enqueue_original(self, msg)
+
+    ScriptRunContext.enqueue = enqueue
+
+    at = AppTest.from_file(SCRIPT_APP, default_timeout=args.timeout)
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"O app falhou na primeira execução: {at.exception[0].message}")
+    primeira_execucao = time.perf_counter() - INICIO_PROCESSO
+    modulos_execucao = carregados()
+
+    resultado = {
+        "Primeira Pintura (ms)": round(1000 * primeira_pintura['s'], 1),
+        "Primeira Execução (ms)": round(1000 * primeira_execucao, 1),
+        "Módulos na Primeira Pintura": primeira_pintura['modulos'],
+        "Módulos após a Primeira Execução": modulos_execucao,
+        "Rerun sem Resultados": cronometrar_reruns(at, args.reruns),
+    }
+
+    if args.com_resultados:
+        from roteirizador.ors_simulado import ServidorORSSimulado
+
+        with ServidorORSSimulado(semente=1) as servidor:
+            [s for s in at.selectbox if s.label == "Servidor de rotas"][0].set_value('ors-local').run()
+            [t for t in at.text_input if t.label == "URL do servidor"][0].set_value(servidor.url).run()
+            [r for r in at.radio if r.label == "Modo de cálculo"][0].set_value("Estimativa rápida (matriz)").run()
+            [b for b in at.button if 'Calcular' in b.label][0].click().run()
+            if at.exception:
+                raise RuntimeError(f"O app falhou ao calcular o lote: {at.exception[0].message}")
+            resultado["Cargas no Dashboard"] = len(at.session_state['dados_rota'] or {})
+            resultado["Rerun com Resultados"] = cronometrar_reruns(at, args.reruns)
+            resultado["Módulos com Resultados"] = carregados()
+    return resultado
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização da interface Streamlit.")
+    parser.add_argument("--execucoes", type=int, default=5, help="Partidas a frio (um processo novo cada)")
+    parser.add_argument("--reruns", type=int, default=20, help="Reexecuções cronometradas por partida")
+    parser.add_argument("--com-resultados", action="store_true",
+                        help="Também mede reruns com o dashboard do lote de exemplo, estimado no ORS simulado")
+    parser.add_argument("--timeout", type=float, default=120, help="Limite por execução do script (s)")
+    parser.add_argument("--json", default=None, help="Grava os resultados neste arquivo JSON")
+    parser.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def resumir(execucoes):
+    def mediana(chave, sub=None):
+        valores = [e[chave][sub] if sub else e[chave] for e in execucoes if chave in e]
+        return round(percentil(valores, 50), 1) if valores else None
+
+    resumo = {
+        "Execuções": len(execucoes),
+        "Primeira Pintura - mediana (ms)": mediana("Primeira Pintura (ms)"),
+        "Primeira Execução - mediana (ms)": mediana("Primeira Execução (ms)"),
+        "Rerun sem Resultados p50 - mediana (ms)": mediana("Rerun sem Resultados", "p50 (ms)"),
+        "Rerun sem Resultados p95 - mediana (ms)": mediana("Rerun sem Resultados", "p95 (ms)"),
+    }
+    if any("Rerun com Resultados" in e for e in execucoes):
+        resumo["Rerun com Resultados p50 - mediana (ms)"] = mediana("Rerun com Resultados", "p50 (ms)")
+        resumo["Rerun com Resultados p95 - mediana (ms)"] = mediana("Rerun com Resultados", "p95 (ms)")
+    resumo["Módulos na Primeira Pintura"] = execucoes[0]["Módulos na Primeira Pintura"]
+    return resumo
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.filho:
+        print(json.dumps(medir_processo(args), ensure_ascii=False))
+        return 0
+
+    execucoes = []
+    for i in range(args.execucoes):
+        with tempfile.TemporaryDirectory() as pasta:
+            # Bancos vazios a cada partida: mede a inicialização, não o tamanho do histórico
+            ambiente = dict(os.environ, ROTEIRIZADOR_DADOS=pasta, PYTHONWARNINGS='ignore')
+            comando = [sys.executable, os.path.abspath(__file__), "--filho", "--reruns", str(args.reruns),
+                       "--timeout", str(args.timeout)]
+            if args.com_resultados:
+                comando.append("--com-resultados")
+            processo = subprocess.run(comando, env=ambiente, capture_output=True, text=True, cwd=RAIZ)
+        if processo.returncode != 0:
+            sys.stderr.write(processo.stderr)
+            return processo.returncode
+        medida = json.loads(processo.stdout.strip().splitlines()[-1])
+        execucoes.append(medida)
+        print(f"Execução {i + 1}: {json.dumps(medida, ensure_ascii=False)}")
+
+    resumo = resumir(execucoes)
+    print(json.dumps(resumo, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"execucoes": execucoes, "resumo": resumo}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+"""Benchmark de ponta a ponta do roteamento contra o ORS simulado (sem rede e sem cota).
+
+Exemplo::
+
+    python benchmarks/benchmark_roteirizacao.py --linhas 10 1000 100000 --latencia 0.05
+
+Para cada tamanho gera uma planilha sintética (cargas de ``--paradas``
+pontos no Mato Grosso do Sul, com vírgula decimal misturada), sobe o
+``ServidorORSSimulado`` e mede:
+
+- cargas por segundo (tempo de parede do roteamento);
+- latência p50/p95 de ``processar_rota`` por carga;
+- divisão do tempo entre leitura (planilha + coordenadas), chamada ao ORS,
+  cálculo de distâncias/classificação (resto de ``processar_rota``) e
+  renderização do mapa (amostra de ``--mapas`` cargas);
+- RSS máximo do processo e, com ``--tracemalloc``, o pico de memória
+  alocada pelo Python (o rastreamento deixa tudo bem mais lento, por isso
+  não é o padrão).
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from roteirizador.despacho import MAX_WORKERS_PADRAO, processar_cargas  # noqa: E402
+from roteirizador.ors_simulado import ServidorORSSimulado  # noqa: E402
+from roteirizador.planilha import agrupar_cargas, ler_cargas, validar_coordenadas  # noqa: E402
+from roteirizador.rotas import processar_rota  # noqa: E402
+
+TAMANHOS_PADRAO = (10, 1000, 100000)
+AREA_MS = (-57.5, -22.0, -53.0, -18.0)  # min_lon, min_lat, max_lon, max_lat
+
+
+class ClienteCronometrado:
+    """Envolve o cliente ORS e soma o tempo gasto em ``directions``."""
+
+    def __init__(self, client):
+        self.client = client
+        self.segundos = 0.0
+        self.chamadas = 0
+        self._lock = threading.Lock()
+
+    def directions(self, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return self.client.directions(**kwargs)
+        finally:
+            decorrido = time.perf_counter() - inicio
+            with self._lock:
+                self.segundos += decorrido
+                self.chamadas += 1
+
+
+def gerar_planilha(caminho, linhas, paradas, semente=42):
+    aleatorio = random.Random(semente)
+    min_lon, min_lat, max_lon, max_lat = AREA_MS
+    with open(caminho, 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["Número Carga", "Coordenadas", "KM Adicional"])
+        for i in range(linhas):
+            lat = aleatorio.uniform(min_lat, max_lat)
+            lon = aleatorio.uniform(min_lon, max_lon)
+            if i % 3 == 0:
+                coordenada = f"{lat:.6f}, {lon:.6f}".replace('.', ',').replace(', ', '; ')
+            else:
+                coordenada = f"{lat:.6f}, {lon:.6f}"
+            escritor.writerow([f"C{i // paradas:06d}", coordenada, aleatorio.choice((0, 0, 0, 5))])
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(linhas, args, url):
+    import openrouteservice
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, f"cargas_{linhas}.csv")
+        gerar_planilha(caminho, linhas, args.paradas)
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        df_validado, _ = validar_coordenadas(ler_cargas(caminho, caminho))
+        grupos = agrupar_cargas(df_validado)
+        t_leitura = time.perf_counter() - inicio
+
+        client = ClienteCronometrado(openrouteservice.Client(key='simulado', base_url=url, retry_timeout=5))
+        latencias = []
+        lock = threading.Lock()
+
+        def rotear(df_carga):
+            inicio_carga = time.perf_counter()
+            resultado = processar_rota(client, df_carga)
+            with lock:
+                latencias.append(time.perf_counter() - inicio_carga)
+            return resultado
+
+        inicio = time.perf_counter()
+        resultados = processar_cargas(grupos, rotear, max_workers=args.paralelo)
+        t_roteamento = time.perf_counter() - inicio
+
+        from roteirizador.mapas import html_mapa
+
+        amostra = [r for r in resultados.values() if r.ok][:args.mapas]
+        inicio = time.perf_counter()
+        for resultado in amostra:
+            html_mapa(resultado.rota, resultado.paradas)
+        t_mapas = time.perf_counter() - inicio
+
+        pico = None
+        if args.tracemalloc:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    cargas = len(resultados)
+    erros = sum(1 for r in resultados.values() if not r.ok)
+    t_cargas = sum(latencias)
+    return {
+        "Linhas": linhas,
+        "Cargas": cargas,
+        "Cargas com Erro": erros,
+        "Cargas/s": round(cargas / t_roteamento, 1) if t_roteamento else 0.0,
+        "p50 por Carga (ms)": round(1000 * percentil(latencias, 50), 1),
+        "p95 por Carga (ms)": round(1000 * percentil(latencias, 95), 1),
+        "Leitura (s)": round(t_leitura, 3),
+        "Roteamento - parede (s)": round(t_roteamento, 3),
+        "Chamadas ORS": client.chamadas,
+        "ORS - soma (s)": round(client.segundos, 3),
+        "Distâncias/Classificação - soma (s)": round(max(0.0, t_cargas - client.segundos), 3),
+        "Mapa por Carga (ms)": round(1000 * t_mapas / len(amostra), 1) if amostra else None,
+        "Pico tracemalloc (MB)": round(pico / (1024 * 1024), 1) if pico is not None else None,
+        "RSS Máximo até aqui (MB)": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Benchmark do roteamento contra o ORS simulado.")
+    parser.add_argument("--linhas", type=int, nargs='+', default=list(TAMANHOS_PADRAO),
+                        help="Tamanhos de planilha (linhas) a medir")
+    parser.add_argument("--paradas", type=int, default=4, help="Paradas por carga")
+    parser.add_argument("--paralelo", type=int, default=MAX_WORKERS_PADRAO)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência simulada do ORS (s)")
+    parser.add_argument("--variacao-latencia", type=float, default=0.0)
+    parser.add_argument("--taxa-2004", type=float, default=0.0)
+    parser.add_argument("--mapas", type=int, default=20, help="Cargas na amostra de renderização de mapa")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mede o pico de alocação do Python (mais lento)")
+    parser.add_argument("--json", default=None, help="Grava os resultados neste arquivo JSON")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    resultados = []
+    with ServidorORSSimulado(latencia_s=args.latencia, variacao_latencia_s=args.variacao_latencia,
+                             taxa_2004=args.taxa_2004, semente=1) as servidor:
+        for linhas in args.linhas:
+            resultado = medir(linhas, args, servidor.url)
+            resultados.append(resultado)
+            print(json.dumps(resultado, ensure_ascii=False, indent=2))
+        print(json.dumps(servidor.estatisticas(), ensure_ascii=False))
+
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"RSS máximo do processo: {rss_mb:.0f} MB")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"resultados": resultados, "rss_maximo_mb": round(rss_mb, 1)}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,2 @@
+# test_proxy_mutum.py é o app Streamlit, não um módulo de testes
+collect_ignore = ["test_proxy_mutum.py"]
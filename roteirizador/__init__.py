@@ -0,0 +1 @@
+"""Núcleo de roteirização do Roteirizador Híbrido (Asfalto vs Chão)."""
@@ -0,0 +1,5 @@
+import sys
+
+from roteirizador.cli import main
+
+sys.exit(main())
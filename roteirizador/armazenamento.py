@@ -0,0 +1,26 @@
+"""Local dos arquivos persistentes (SQLite) usados pelos caches do roteirizador.
+
+O diretório padrão pode ser trocado pela variável de ambiente
+``ROTEIRIZADOR_DADOS``; assim o cache sobrevive a reinícios do Streamlit e é
+compartilhado entre sessões e processos na mesma máquina.
+"""
+import os
+import sqlite3
+
+DIRETORIO_DADOS = os.environ.get(
+    'ROTEIRIZADOR_DADOS',
+    os.path.join(os.path.expanduser('~'), '.cache', 'roteirizador')
+)
+
+
+def caminho_dados(nome_arquivo):
+    os.makedirs(DIRETORIO_DADOS, exist_ok=True)
+    return os.path.join(DIRETORIO_DADOS, nome_arquivo)
+
+
+def conectar(caminho):
+    """Abre uma conexão SQLite em modo WAL, utilizável por várias threads (com lock externo)."""
+    conn = sqlite3.connect(caminho, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
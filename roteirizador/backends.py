@@ -0,0 +1,208 @@
+"""Servidores de rotas intercambiáveis por trás das chamadas ``client.directions``.
+
+O resto do roteirizador fala a interface do ``openrouteservice.Client``
+(``directions`` e ``distance_matrix`` com respostas no formato do ORS); cada
+``Backend`` diz como criar esse cliente e o que o servidor aceita:
+
+- ``ors``: API pública. Tem cota por minuto/dia e recusa ``avoid_polygons``
+  em rotas de mais de 150 km (erro 2004, escada de fallback);
+- ``ors-local``: ORS próprio com o grafo do Mato Grosso do Sul. Mesma API,
+  sem cota e sem o limite de 150 km;
+- ``osrm``: OSRM próprio, por ``ClienteOSRM``, que traduz as respostas para o
+  formato do ORS. Não aceita polígonos, então as zonas de restrição são
+  contornadas pelos waypoints de desvio.
+
+Nos servidores locais o lote fica limitado pela CPU, e não mais pela rede ou
+pela cota. O limitador de taxa não é usado e o paralelismo pode subir até o
+número de núcleos do servidor.
+
+Montagem dos grafos a partir do extrato do Centro-Oeste da Geofabrik, recortado
+para o MS::
+
+    osmium extract -p ms.poly centro-oeste-latest.osm.pbf -o ms.osm.pbf
+
+ORS (``openrouteservice/openrouteservice``): ``ors.engine.source_file:
+ms.osm.pbf``, perfil ``driving-hgv`` com ``ext_storages: {WaySurfaceType: {}}``
+(para o ``extra_info=surface``) e ``ors.endpoints.routing.
+maximum_distance_avoid_areas`` acima da maior rota do lote.
+
+OSRM (``osrm/osrm-backend``), com o perfil ``osrm_superficies.lua`` deste
+pacote copiado para ``/opt`` (ao lado do ``car.lua``)::
+
+    osrm-extract -p /opt/osrm_superficies.lua ms.osm.pbf
+    osrm-partition ms.osrm && osrm-customize ms.osrm
+    osrm-routed --algorithm mld --max-table-size 1000 ms.osrm
+"""
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from roteirizador.cliente_ors import (
+    CONEXOES_POR_CHAVE, TIMEOUT_HTTP_PADRAO, ErroConexao, ErroRequisicao, ErroRotaImpossivel, ErroServidorORS,
+    ErroTempoEsgotado, criar_cliente_http
+)
+from roteirizador.zonas import LIMITE_POLIGONOS_M
+
+Backend = namedtuple('Backend', [
+    'nome', 'descricao', 'limite_poligonos_m', 'aceita_poligonos', 'limitar_taxa', 'url_padrao',
+])
+
+BACKEND_ORS = Backend('ors', "ORS público (openrouteservice.org)", LIMITE_POLIGONOS_M, True, True, None)
+BACKEND_ORS_LOCAL = Backend('ors-local', "ORS próprio (grafo do MS)", None, True, False, 'http://localhost:8080/ors')
+BACKEND_OSRM = Backend('osrm', "OSRM próprio (grafo do MS)", None, False, False, 'http://localhost:5000')
+
+BACKENDS = {b.nome: b for b in (BACKEND_ORS, BACKEND_ORS_LOCAL, BACKEND_OSRM)}
+
+# avoid_features do ORS -> classes excluíveis do OSRM (car.lua)
+EXCLUSOES_OSRM = {'ferries': 'ferry', 'tollways': 'toll', 'highways': 'motorway'}
+# Classes de superfície declaradas em osrm_superficies.lua; trechos sem nenhuma ficam 'unknown', como no ORS
+CLASSES_SUPERFICIE_OSRM = ('compacted', 'gravel', 'unpaved')
+CODIGOS_ROTA_IMPOSSIVEL_OSRM = ('NoRoute', 'NoSegment', 'NoMatch', 'NoTrips')
+
+
+def backend_do_cliente(client):
+    """``Backend`` de um cliente (os envoltórios repassam o atributo); sem atributo, o ORS público."""
+    return getattr(client, 'backend', BACKEND_ORS)
+
+
+def criar_cliente_backend(backend, api_key=None, url=None, timeout=TIMEOUT_HTTP_PADRAO):
+    """Cliente HTTP do ``backend``, com o atributo ``backend`` para o resto do roteamento consultar."""
+    url = url or backend.url_padrao
+    if backend is BACKEND_OSRM:
+        client = ClienteOSRM(url, timeout)
+    else:
+        client = criar_cliente_http(api_key, url, timeout)
+    client.backend = backend
+    return client
+
+
+# --- OSRM ---
+
+
+def _superficie_osrm(classes):
+    for classe in CLASSES_SUPERFICIE_OSRM:
+        if classe in classes:
+            return classe
+    return 'unknown'
+
+
+def _juntar(coords, novos):
+    """Acrescenta ``novos`` a ``coords`` sem repetir o vértice de junção; retorna o índice do primeiro."""
+    if coords and novos and coords[-1] == novos[0]:
+        novos = novos[1:]
+        inicio = len(coords) - 1
+    else:
+        inicio = len(coords)
+    coords.extend(novos)
+    return inicio
+
+
+def rota_osrm_para_ors(resposta):
+    """Converte a resposta do ``/route`` do OSRM (com ``steps``) num FeatureCollection do ORS.
+
+    A superfície vem das ``classes`` de cada interseção, que valem do vértice
+    da interseção até a próxima; os trechos vizinhos de mesma superfície são
+    unidos, como no ``extras['surface']`` do ORS.
+    """
+    rota = resposta['routes'][0]
+    coords = []
+    superficies = []  # (índice inicial, superfície)
+    way_points = [0]
+    for perna in rota['legs']:
+        for passo in perna['steps']:
+            if passo['maneuver']['type'] == 'arrive':
+                continue  # geometria de um ponto só, o fim do passo anterior
+            geometria = [list(p) for p in passo['geometry']['coordinates']]
+            inicio = _juntar(coords, geometria)
+            busca = inicio
+            for intersecao in passo.get('intersections', []):
+                local = list(intersecao['location'])
+                # As interseções são vértices da geometria do passo, em ordem
+                while busca < len(coords) - 1 and coords[busca] != local:
+                    busca += 1
+                superficies.append((busca, _superficie_osrm(intersecao.get('classes', ()))))
+        way_points.append(len(coords) - 1)
+
+    valores = []
+    for k, (inicio, superficie) in enumerate(superficies):
+        fim = superficies[k + 1][0] if k + 1 < len(superficies) else len(coords) - 1
+        if fim <= inicio:
+            continue
+        if valores and valores[-1][2] == superficie and valores[-1][1] == inicio:
+            valores[-1][1] = fim
+        else:
+            valores.append([inicio, fim, superficie])
+
+    lons = [c[0] for c in coords]
+    lats = [c[1] for c in coords]
+    return {
+        "type": "FeatureCollection",
+        "bbox": [min(lons), min(lats), max(lons), max(lats)],
+        "features": [{
+            "type": "Feature",
+            "bbox": [min(lons), min(lats), max(lons), max(lats)],
+            "geometry": {"type": "LineString", "coordinates": coords},
+            "properties": {
+                "summary": {"distance": rota['distance'], "duration": rota['duration']},
+                "way_points": way_points,
+                "extras": {"surface": {"values": valores}},
+            },
+        }],
+    }
+
+
+class ClienteOSRM:
+    """Cliente de um ``osrm-routed`` com a interface do ``openrouteservice.Client`` usada pelo roteirizador."""
+
+    def __init__(self, base_url, timeout=TIMEOUT_HTTP_PADRAO, conexoes=CONEXOES_POR_CHAVE, perfil='driving'):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.perfil = perfil
+        self._session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=conexoes)
+        self._session.mount('https://', adaptador)
+        self._session.mount('http://', adaptador)
+
+    def _get(self, servico, coordenadas, parametros):
+        caminho = ";".join(f"{lon},{lat}" for lon, lat in coordenadas)
+        url = f"{self.base_url}/{servico}/v1/{self.perfil}/{caminho}"
+        try:
+            resposta = self._session.get(url, params=parametros, timeout=self.timeout)
+        except requests.exceptions.Timeout as e:
+            raise ErroTempoEsgotado("Tempo esgotado na requisição ao OSRM.") from e
+        except requests.exceptions.ConnectionError as e:
+            raise ErroConexao(f"Sem conexão com o OSRM: {e}") from e
+        try:
+            corpo = resposta.json()
+        except ValueError as e:
+            raise ErroServidorORS("Resposta do OSRM não é JSON.", resposta.status_code) from e
+
+        codigo = corpo.get('code')
+        if resposta.status_code >= 500:
+            raise ErroServidorORS(corpo.get('message', codigo), resposta.status_code, codigo)
+        if codigo in CODIGOS_ROTA_IMPOSSIVEL_OSRM:
+            raise ErroRotaImpossivel(corpo.get('message', codigo), resposta.status_code, codigo)
+        if resposta.status_code != 200 or codigo != 'Ok':
+            raise ErroRequisicao(corpo.get('message', codigo), resposta.status_code, codigo)
+        return corpo
+
+    def directions(self, coordinates, profile=None, format='geojson', extra_info=None, options=None, **kwargs):
+        options = options or {}
+        if 'avoid_polygons' in options:
+            # Não deve acontecer: tentativas_rota não gera o degrau de polígonos para este backend
+            raise ErroRequisicao("O OSRM não aceita avoid_polygons; use os desvios das zonas.")
+        parametros = {'overview': 'false', 'steps': 'true', 'geometries': 'geojson'}
+        exclusoes = [EXCLUSOES_OSRM[f] for f in options.get('avoid_features', []) if f in EXCLUSOES_OSRM]
+        if exclusoes:
+            parametros['exclude'] = ",".join(exclusoes)
+        return rota_osrm_para_ors(self._get('route', coordinates, parametros))
+
+    def distance_matrix(self, locations, profile=None, sources=None, destinations=None, metrics=None, **kwargs):
+        parametros = {'annotations': 'distance'}
+        if sources is not None:
+            parametros['sources'] = ";".join(str(i) for i in sources)
+        if destinations is not None:
+            parametros['destinations'] = ";".join(str(i) for i in destinations)
+        corpo = self._get('table', locations, parametros)
+        return {"distances": corpo['distances']}
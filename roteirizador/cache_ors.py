@@ -0,0 +1,160 @@
+"""Cache persistente das respostas do ``client.directions`` do ORS.
+
+As respostas ficam num SQLite, comprimidas com zlib e endereçadas pelo hash da
+requisição normalizada (coordenadas arredondadas + perfil + formato +
+``extra_info`` + ``options``). Entradas expiram por TTL e, quando o arquivo
+passa do tamanho máximo, as menos usadas recentemente são descartadas (LRU).
+"""
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+from roteirizador.armazenamento import caminho_dados, conectar
+from roteirizador.backends import BACKEND_ORS, backend_do_cliente
+
+ARQUIVO_CACHE = 'cache_ors.sqlite3'
+PRECISAO_PADRAO = 5  # casas decimais (~1 m)
+TTL_PADRAO = 30 * 24 * 3600  # 30 dias
+MAX_BYTES_PADRAO = 256 * 1024 * 1024
+
+
+def _arredondar(valor, precisao):
+    if isinstance(valor, float):
+        return round(valor, precisao)
+    if isinstance(valor, (list, tuple)):
+        return [_arredondar(v, precisao) for v in valor]
+    return valor
+
+
+def chave_requisicao(parametros, precisao=PRECISAO_PADRAO):
+    """Hash SHA-256 da requisição com as coordenadas arredondadas para ``precisao`` casas."""
+    normalizado = dict(parametros)
+    if 'coordinates' in normalizado:
+        normalizado['coordinates'] = _arredondar(
+            [[float(lon), float(lat)] for lon, lat in normalizado['coordinates']], precisao
+        )
+    texto = json.dumps(normalizado, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class CacheRotas:
+    """Cache de respostas em SQLite com TTL, despejo LRU por tamanho e contadores de acerto."""
+
+    def __init__(self, caminho=None, precisao=PRECISAO_PADRAO, ttl_segundos=TTL_PADRAO,
+                 max_bytes=MAX_BYTES_PADRAO):
+        self.caminho = caminho or caminho_dados(ARQUIVO_CACHE)
+        self.precisao = precisao
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+        self._lock = threading.Lock()
+        self._conn = conectar(self.caminho)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS respostas (
+                   chave TEXT PRIMARY KEY,
+                   resposta BLOB NOT NULL,
+                   tamanho INTEGER NOT NULL,
+                   criado REAL NOT NULL,
+                   acessado REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acessado ON respostas (acessado)")
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(tamanho), 0) FROM respostas"
+        ).fetchone()[0]
+
+    def chave(self, parametros):
+        return chave_requisicao(parametros, self.precisao)
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT resposta, tamanho, criado FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return None
+            resposta, tamanho, criado = linha
+            if self.ttl_segundos is not None and agora - criado > self.ttl_segundos:
+                self._conn.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._total_bytes -= tamanho
+                self.falhas += 1
+                return None
+            self._conn.execute("UPDATE respostas SET acessado = ? WHERE chave = ?", (agora, chave))
+            self.acertos += 1
+        return json.loads(zlib.decompress(resposta))
+
+    def guardar(self, chave, resposta):
+        dados = zlib.compress(json.dumps(resposta, separators=(',', ':')).encode('utf-8'))
+        agora = time.time()
+        with self._lock:
+            anterior = self._conn.execute(
+                "SELECT tamanho FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respostas (chave, resposta, tamanho, criado, acessado) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (chave, dados, len(dados), agora, agora)
+            )
+            self._total_bytes += len(dados) - (anterior[0] if anterior else 0)
+            self._despejar()
+
+    def _despejar(self):
+        # Remove as entradas menos usadas recentemente até caber no limite (chamado com lock)
+        while self.max_bytes is not None and self._total_bytes > self.max_bytes:
+            antigas = self._conn.execute(
+                "SELECT chave, tamanho FROM respostas ORDER BY acessado LIMIT 32"
+            ).fetchall()
+            if not antigas:
+                self._total_bytes = 0
+                break
+            for chave, tamanho in antigas:
+                self._conn.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._total_bytes -= tamanho
+                self.despejos += 1
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def limpar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM respostas")
+            self._total_bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            entradas = self._conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+        consultas = self.acertos + self.falhas
+        return {
+            "Acertos": self.acertos,
+            "Falhas": self.falhas,
+            "Taxa de Acerto (%)": round(100 * self.acertos / consultas, 1) if consultas else 0.0,
+            "Entradas": entradas,
+            "Tamanho (MB)": round(self._total_bytes / (1024 * 1024), 2),
+            "Despejos (LRU)": self.despejos,
+        }
+
+
+class ClienteComCache:
+    """Envolve um cliente ORS e serve ``directions`` a partir do cache quando possível."""
+
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+
+    def directions(self, **kwargs):
+        backend = backend_do_cliente(self.client)
+        # Respostas de servidores diferentes não se misturam; as do ORS público mantêm a chave de antes
+        chave = self.cache.chave(kwargs if backend is BACKEND_ORS else {**kwargs, 'backend': backend.nome})
+        resposta = self.cache.obter(chave)
+        if resposta is None:
+            resposta = self.client.directions(**kwargs)
+            self.cache.guardar(chave, resposta)
+        return resposta
+
+    def __getattr__(self, nome):
+        return getattr(self.client, nome)
@@ -0,0 +1,289 @@
+"""Modo lote pela linha de comando, sem Streamlit.
+
+Exemplo::
+
+    ORS_API_KEY=... python -m roteirizador cargas.csv -o resultado.csv
+
+    # Servidor próprio (ver roteirizador.backends): sem cota e sem o limite de 150 km dos polígonos
+    python -m roteirizador cargas.csv -o resultado.csv --backend osrm --url-ors http://localhost:5000
+
+Cada carga é gravada no arquivo de saída (CSV ou Parquet) assim que termina.
+Sai com 1 se alguma carga teve erro, 2 em erro de entrada e 3 se a cota
+diária da chave acabou (o lote para; as cargas já gravadas ficam na saída).
+"""
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+
+from roteirizador.backends import BACKEND_ORS, BACKENDS
+from roteirizador.cache_ors import PRECISAO_PADRAO
+from roteirizador.despacho import MAX_WORKERS_PADRAO
+from roteirizador.distancias import MODOS_DISTANCIA, MODO_ELIPSOIDE
+from roteirizador.exportacao import FORMATOS
+from roteirizador.otimizacao import PRAZO_PADRAO_S
+from roteirizador.planilha import TAMANHO_BLOCO_PADRAO
+
+CARGAS_POR_LOTE_ESTIMATIVA = 500
+
+COLUNAS_SAIDA = [
+    "Carga", "Distância Total (km)", "Asfalto (km)", "Chão (km)", "% Chão",
+    "Custo Estimado (pts)", "Link Google Maps", "Aviso", "Erro",
+]
+
+
+class EscritorCSV:
+    def __init__(self, caminho):
+        self._arquivo = open(caminho, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._arquivo, fieldnames=COLUNAS_SAIDA)
+        self._writer.writeheader()
+
+    def escrever(self, linha):
+        self._writer.writerow(linha)
+        self._arquivo.flush()
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+class EscritorParquet:
+    """Grava um row group por carga; exige pyarrow."""
+
+    def __init__(self, caminho):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Saída Parquet requer o pacote 'pyarrow' (pip install pyarrow).") from e
+        self._pa = pa
+        self._schema = pa.schema([
+            (coluna, pa.string() if coluna in ("Carga", "Link Google Maps", "Aviso", "Erro") else pa.float64())
+            for coluna in COLUNAS_SAIDA
+        ])
+        self._writer = pq.ParquetWriter(caminho, self._schema)
+
+    def escrever(self, linha):
+        tabela = self._pa.Table.from_pylist([linha], schema=self._schema)
+        self._writer.write_table(tabela)
+
+    def fechar(self):
+        self._writer.close()
+
+
+def linha_saida(carga_id, resultado):
+    from roteirizador.rotas import linha_resumo
+
+    linha = dict.fromkeys(COLUNAS_SAIDA)
+    linha["Carga"] = str(carga_id)
+    resumo = linha_resumo(carga_id, resultado)
+    if resumo is None:
+        linha["Erro"] = resultado.erro
+    else:
+        linha.update(resumo)
+        avisos = [resultado.detalhes.get(chave) for chave in ("⚠️ AVISO", "ℹ️ ESTIMATIVA", "🔀 SEQUÊNCIA")]
+        linha["Aviso"] = " | ".join(a for a in avisos if a) or None
+    return linha
+
+
+def montar_cliente(api_key, usar_cache=True, precisao_cache=PRECISAO_PADRAO, url_ors=None, prazo_lote_s=None,
+                   backend=BACKEND_ORS):
+    from roteirizador.backends import criar_cliente_backend
+    from roteirizador.cache_ors import CacheRotas, ClienteComCache
+    from roteirizador.cliente_ors import ClienteResiliente
+    from roteirizador.despacho import ClienteLimitado, LimitadorTaxa
+
+    client = criar_cliente_backend(backend, api_key, url_ors)
+    if backend.limitar_taxa:
+        # As retentativas ficam por fora do limitador: cada repetição também espera a sua ficha
+        client = ClienteLimitado(client, LimitadorTaxa(chave=api_key))
+    client = ClienteResiliente(client)
+    if prazo_lote_s is not None:
+        client = client.para_lote(prazo_lote_s)
+    if usar_cache:
+        client = ClienteComCache(client, CacheRotas(precisao=precisao_cache))
+    return client
+
+
+def estimar_em_lotes(client, grupos, historico, ao_concluir, cargas_por_lote=CARGAS_POR_LOTE_ESTIMATIVA):
+    """Modo ``--estimativa``: agrupa as cargas em lotes e estima cada lote com poucas chamadas à matriz."""
+    from roteirizador.estimativa import estimar_cargas
+
+    concluidas = 0
+    lote = []
+    for grupo in itertools.chain(grupos, [None]):
+        if grupo is not None:
+            lote.append(grupo)
+            if len(lote) < cargas_por_lote:
+                continue
+        if not lote:
+            break
+        resultados, _ = estimar_cargas(client, lote, historico)
+        for carga_id, resultado in resultados.items():
+            concluidas += 1
+            ao_concluir(carga_id, resultado, concluidas)
+        lote = []
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m roteirizador",
+        description="Calcula rotas Asfalto vs Chão para cada carga de uma planilha, sem Streamlit."
+    )
+    parser.add_argument("entrada", help="Planilha .csv ou .xlsx com as colunas Coordenadas e Carga")
+    parser.add_argument("-o", "--saida", required=True, help="Arquivo de saída (.csv ou .parquet)")
+    parser.add_argument("--api-key", default=os.environ.get("ORS_API_KEY"),
+                        help="Chave do OpenRouteService (padrão: variável ORS_API_KEY)")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=BACKEND_ORS.nome,
+                        help="Servidor de rotas: ORS público, ORS próprio ou OSRM próprio (ver roteirizador.backends)")
+    parser.add_argument("--url-ors", default=os.environ.get("ORS_URL"),
+                        help="URL base do servidor de rotas (ex.: ORS/OSRM próprio ou python -m roteirizador.ors_simulado)")
+    parser.add_argument("--prazo-lote", type=float, default=None,
+                        help="Segundos para rotear a planilha inteira; depois disso as cargas restantes falham")
+    parser.add_argument("--modo-distancia", choices=MODOS_DISTANCIA, default=MODO_ELIPSOIDE)
+    parser.add_argument("--zonas", default=None,
+                        help="GeoJSON com as zonas de restrição e os desvios (padrão: o do pacote ou ROTEIRIZADOR_ZONAS)")
+    parser.add_argument("--otimizar", action="store_true",
+                        help="Reordena as paradas intermediárias de cada carga pelo custo Asfalto/Chão")
+    parser.add_argument("--prazo-otimizacao", type=float, default=PRAZO_PADRAO_S,
+                        help="Segundos de busca da melhor sequência por carga")
+    parser.add_argument("--paralelo", type=int, default=None,
+                        help=f"Cargas processadas em paralelo (padrão: {MAX_WORKERS_PADRAO} no ORS público, "
+                             "um por núcleo nos servidores próprios)")
+    parser.add_argument("--sem-cache", action="store_true", help="Não usa o cache persistente de rotas")
+    parser.add_argument("--precisao-cache", type=int, default=PRECISAO_PADRAO,
+                        help="Casas decimais das coordenadas na chave do cache")
+    parser.add_argument("--tamanho-bloco", type=int, default=TAMANHO_BLOCO_PADRAO,
+                        help="Linhas lidas por bloco da planilha")
+    parser.add_argument("--exportar", default=None,
+                        help="Grava também as rotas (uma por carga, colorida por superfície) neste .zip")
+    parser.add_argument("--formatos", nargs='+', choices=FORMATOS, default=list(FORMATOS),
+                        help="Formatos do --exportar (padrão: todos)")
+    parser.add_argument("--casas", type=int, default=None,
+                        help="Casas decimais das coordenadas exportadas (padrão: precisão completa)")
+    parser.add_argument("--sem-totais", action="store_true",
+                        help="Não grava os metros por superfície de cada carga (usados para recalcular custos sem o ORS)")
+    parser.add_argument("--sem-historico", action="store_true",
+                        help="Não grava o resumo de cada carga no histórico do dashboard")
+    parser.add_argument("--metricas", default=None,
+                        help="Coleta métricas de desempenho e grava no arquivo (.json ou .prom)")
+    parser.add_argument("--estimativa", action="store_true",
+                        help="Só km estimados pela matriz do ORS e pelo histórico de trechos (poucas chamadas, sem geometria)")
+    parser.add_argument("--trechos", action="store_true",
+                        help="Roteia uma vez só os trechos repetidos entre as cargas (lê a planilha inteira antes de rotear)")
+    parser.add_argument("--trechos-reversiveis", action="store_true",
+                        help="Com --trechos, o trecho B -> A reaproveita A -> B invertido (vias de mão dupla)")
+    parser.add_argument("--ordenado", action="store_true",
+                        help="Planilha agrupada por Carga: cada carga é roteada assim que termina de ser lida")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    backend = BACKENDS[args.backend]
+    if args.paralelo is None:
+        # Servidor próprio: sem cota, o limite passa a ser a CPU
+        args.paralelo = MAX_WORKERS_PADRAO if backend.limitar_taxa else (os.cpu_count() or MAX_WORKERS_PADRAO)
+    if backend is BACKEND_ORS and not args.api_key:
+        print("Informe a chave da API com --api-key ou ORS_API_KEY.", file=sys.stderr)
+        return 2
+
+    from roteirizador.custos import TotaisSuperficies, novo_lote
+    from roteirizador.despacho import CotaDiariaEsgotada, processar_cargas
+    from roteirizador.estimativa import HistoricoCorredores
+    from roteirizador.estrategias import MemoriaEstrategias
+    from roteirizador.historico import HistoricoLotes
+    from roteirizador.metricas import METRICAS
+    from roteirizador.planilha import iterar_cargas
+    from roteirizador.rotas import processar_rota
+    from roteirizador.zonas import RegistroZonas, registro_padrao
+
+    def reportar_erros(df_erros):
+        for erro in df_erros.itertuples(index=False):
+            print(f"Coordenada inválida (Carga {erro.Carga}, linha {erro.Linha}): {erro.Coordenada}", file=sys.stderr)
+
+    # As cargas são lidas em blocos e o roteamento começa antes do fim do arquivo
+    grupos = iterar_cargas(args.entrada, args.entrada, args.tamanho_bloco, args.ordenado, reportar_erros)
+    client = montar_cliente(args.api_key, not args.sem_cache, args.precisao_cache, args.url_ors, args.prazo_lote,
+                            backend)
+    memoria_estrategias = MemoriaEstrategias()
+    historico_corredores = HistoricoCorredores()
+    zonas = RegistroZonas.carregar(args.zonas) if args.zonas else registro_padrao()
+    totais_superficies = None if args.sem_totais else TotaisSuperficies()
+    historico_lotes = None if args.sem_historico else HistoricoLotes()
+    lote = novo_lote()
+
+    if args.metricas:
+        METRICAS.habilitado = True
+
+    arquivo_rotas = None
+    if args.exportar:
+        from roteirizador.exportacao import ArquivoRotas
+        arquivo_rotas = ArquivoRotas(args.exportar, args.formatos, args.casas)
+
+    escritor = EscritorParquet(args.saida) if args.saida.lower().endswith('.parquet') else EscritorCSV(args.saida)
+    cliente_trechos = None
+    inicio = time.perf_counter()
+    falhas = 0
+    total = 0
+
+    def gravar(carga_id, resultado, concluidas):
+        nonlocal falhas, total
+        total = concluidas
+        linha = linha_saida(carga_id, resultado)
+        escritor.escrever(linha)
+        if arquivo_rotas is not None:
+            arquivo_rotas.adicionar(carga_id, resultado)
+        if totais_superficies is not None:
+            totais_superficies.registrar_lote(lote, {carga_id: resultado}, os.path.basename(args.entrada))
+        if historico_lotes is not None:
+            historico_lotes.registrar_lote(lote, {carga_id: resultado}, os.path.basename(args.entrada))
+        if linha["Erro"]:
+            falhas += 1
+        print(f"[{concluidas}] Carga {carga_id}: {linha['Erro'] or 'ok'}", file=sys.stderr)
+
+    try:
+        if args.estimativa:
+            estimar_em_lotes(client, grupos, historico_corredores, gravar)
+        else:
+            if args.trechos:
+                from roteirizador.trechos import ClienteTrechos, planejar_trechos
+
+                # O plano precisa do lote inteiro: a planilha é lida toda antes de rotear
+                grupos = list(grupos)
+                client = cliente_trechos = ClienteTrechos(client, planejar_trechos(grupos, args.trechos_reversiveis), zonas)
+            processar_cargas(
+                grupos,
+                lambda df_carga: processar_rota(client, df_carga, args.modo_distancia, memoria_estrategias,
+                                                historico_corredores=historico_corredores,
+                                                otimizar_sequencia=args.otimizar,
+                                                prazo_otimizacao_s=args.prazo_otimizacao,
+                                                zonas=zonas),
+                max_workers=args.paralelo,
+                ao_concluir=gravar,
+                manter_resultados=False
+            )
+    except ValueError as e:
+        print(f"Erro na planilha: {e}", file=sys.stderr)
+        return 2
+    except CotaDiariaEsgotada as e:
+        # As cargas já concluídas estão gravadas; as demais ficam para quando a cota renovar
+        print(f"{e} Lote interrompido após {total} carga(s) -> {args.saida}", file=sys.stderr)
+        return 3
+    finally:
+        escritor.fechar()
+        if arquivo_rotas is not None:
+            arquivo_rotas.fechar()
+        if args.metricas:
+            with open(args.metricas, 'w', encoding='utf-8') as f:
+                f.write(METRICAS.exportar_prometheus() if args.metricas.endswith('.prom') else METRICAS.exportar_json())
+
+    print(f"{total} cargas em {time.perf_counter() - inicio:.1f}s ({falhas} com erro) -> {args.saida}",
+          file=sys.stderr)
+    if cliente_trechos is not None:
+        est_trechos = cliente_trechos.estatisticas()
+        print(f"Trechos: {est_trechos['Partes Roteadas']} chamada(s) de rota, "
+              f"{est_trechos['Trechos Reaproveitados'] + est_trechos['Trechos Invertidos']} trecho(s) reaproveitado(s)",
+              file=sys.stderr)
+    return 1 if falhas else 0
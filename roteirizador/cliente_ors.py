@@ -0,0 +1,248 @@
+"""Camada de cliente do ORS: conexões reaproveitadas, erros tipados, retentativas e prazos.
+
+- ``criar_cliente_http`` monta o ``openrouteservice.Client`` com um pool de
+  conexões HTTP (keep-alive) dimensionado para várias threads; a interface
+  guarda um por chave da API, compartilhado entre as sessões.
+- ``classificar_erro`` converte as exceções do openrouteservice/requests em
+  subclasses de ``ErroORS`` (limite de distância 2004, rota impossível, cota,
+  servidor, tempo esgotado...), no lugar de procurar texto na mensagem.
+- ``ClienteResiliente`` repete as chamadas que falharam por erro transitório
+  (429, 5xx, timeout, conexão) com espera exponencial e jitter, sem passar do
+  prazo da chamada nem do prazo do lote (``para_lote``).
+"""
+import random
+import re
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from roteirizador.metricas import METRICAS
+
+TIMEOUT_HTTP_PADRAO = 30  # s por requisição HTTP
+PRAZO_CHAMADA_PADRAO = 90  # s por chamada, somando as retentativas
+PRAZO_LOTE_PADRAO = 30 * 60  # s para rotear uma planilha inteira
+MAX_TENTATIVAS_PADRAO = 4
+ESPERA_BASE_S = 0.5
+ESPERA_MAXIMA_S = 8.0
+CONEXOES_POR_CHAVE = 16
+
+CODIGO_LIMITE_DISTANCIA = 2004
+CODIGOS_ROTA_IMPOSSIVEL = (2009, 2010)  # rota não encontrada / ponto fora da malha
+
+# Clientes que só levantam Exception com o texto da resposta, ex.: '400 ({"error": {"code": 2004, ...}})'
+_PADRAO_STATUS = re.compile(r'^\s*(\d{3})\b')
+_PADRAO_CODIGO = re.compile(r'["\']code["\']\s*:\s*(\d+)')
+
+
+# --- ERROS TIPADOS ---
+
+
+class ErroORS(Exception):
+    """Falha de uma chamada ao ORS, já classificada."""
+
+    retentavel = False
+
+    def __init__(self, mensagem, status=None, codigo=None):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.status = status
+        self.codigo = codigo
+
+    def __str__(self):
+        prefixo = " ".join(str(p) for p in (self.status, self.codigo) if p is not None)
+        return f"{prefixo} ({self.mensagem})" if prefixo else str(self.mensagem)
+
+
+class ErroLimiteDistancia(ErroORS):
+    """Código 2004: a rota passa do limite de distância do servidor (dispara a escada de fallback)."""
+
+
+class ErroRotaImpossivel(ErroORS):
+    """Códigos 2009/2010: não há rota entre as paradas ou uma parada está fora da malha."""
+
+
+class ErroAutenticacao(ErroORS):
+    """401/403: chave inválida ou cota diária da chave esgotada no servidor."""
+
+
+class ErroRequisicao(ErroORS):
+    """Demais erros 4xx: parâmetros que o ORS recusou."""
+
+
+class ErroCotaExcedida(ErroORS):
+    """429: mais requisições por minuto que o plano permite."""
+
+    retentavel = True
+
+
+class ErroServidorORS(ErroORS):
+    """5xx ou resposta que não é JSON."""
+
+    retentavel = True
+
+
+class ErroTempoEsgotado(ErroORS):
+    """A requisição HTTP passou do timeout."""
+
+    retentavel = True
+
+
+class ErroConexao(ErroORS):
+    """Falha de rede antes de haver resposta."""
+
+    retentavel = True
+
+
+class PrazoEsgotado(ErroORS):
+    """O prazo da chamada ou do lote acabou antes de uma resposta."""
+
+
+class CotaDiariaEsgotada(ErroORS):
+    """O limitador local consumiu a cota diária da chave: o lote para (não é erro da carga)."""
+
+
+def _codigo_e_mensagem(corpo):
+    if isinstance(corpo, dict):
+        erro = corpo.get('error', corpo)
+        if isinstance(erro, dict):
+            return erro.get('code'), erro.get('message', str(erro))
+        return None, str(erro)
+    return None, corpo
+
+
+def _erro_por_status(status, codigo, mensagem):
+    if codigo == CODIGO_LIMITE_DISTANCIA:
+        return ErroLimiteDistancia(mensagem, status, codigo)
+    if codigo in CODIGOS_ROTA_IMPOSSIVEL:
+        return ErroRotaImpossivel(mensagem, status, codigo)
+    if status == 429:
+        return ErroCotaExcedida(mensagem, status, codigo)
+    if status is not None and status >= 500:
+        return ErroServidorORS(mensagem, status, codigo)
+    if status in (401, 403):
+        return ErroAutenticacao(mensagem, status, codigo)
+    return ErroRequisicao(mensagem, status, codigo)
+
+
+def classificar_erro(e):
+    """``ErroORS`` correspondente à exceção ``e``, ou None se ela não veio do ORS."""
+    if isinstance(e, ErroORS):
+        return e
+    # Importado só aqui e em ``criar_cliente_http``: com o OSRM o openrouteservice nem é carregado
+    from openrouteservice import exceptions as excecoes_ors
+
+    if isinstance(e, excecoes_ors.ApiError):
+        codigo, mensagem = _codigo_e_mensagem(e.message)
+        return _erro_por_status(e.status, codigo, mensagem)
+    if isinstance(e, excecoes_ors.HTTPError):
+        return ErroServidorORS("Resposta do ORS não é JSON.", e.status_code)
+    if isinstance(e, (excecoes_ors.Timeout, requests.exceptions.Timeout)):
+        return ErroTempoEsgotado("Tempo esgotado na requisição ao ORS.")
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return ErroConexao(f"Sem conexão com o ORS: {e}")
+
+    texto = str(e)
+    status = _PADRAO_STATUS.match(texto)
+    if status is None:
+        return None
+    codigo = _PADRAO_CODIGO.search(texto)
+    return _erro_por_status(int(status.group(1)), int(codigo.group(1)) if codigo else None, texto)
+
+
+# --- CLIENTE HTTP E RETENTATIVAS ---
+
+
+def criar_cliente_http(api_key, base_url=None, timeout=TIMEOUT_HTTP_PADRAO, conexoes=CONEXOES_POR_CHAVE):
+    """``openrouteservice.Client`` com keep-alive e pool de ``conexoes`` por host.
+
+    As retentativas de 429 ficam com o ``ClienteResiliente`` (que passa pelo
+    limitador de taxa a cada tentativa); as internas do openrouteservice, que
+    só cobrem o 503, ficam limitadas ao ``timeout``.
+    """
+    import openrouteservice
+
+    parametros = dict(key=api_key, timeout=timeout, retry_timeout=timeout, retry_over_query_limit=False)
+    if base_url:
+        parametros['base_url'] = base_url
+    client = openrouteservice.Client(**parametros)
+    # O Session do cliente já reaproveita conexões, mas o adaptador padrão só guarda 10 por host
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=conexoes)
+    client._session.mount('https://', adaptador)
+    client._session.mount('http://', adaptador)
+    return client
+
+
+class ClienteResiliente:
+    """Envolve um cliente ORS: erros tipados e retentativas com espera exponencial e jitter."""
+
+    def __init__(self, client, max_tentativas=MAX_TENTATIVAS_PADRAO, prazo_chamada_s=PRAZO_CHAMADA_PADRAO,
+                 espera_base_s=ESPERA_BASE_S, espera_maxima_s=ESPERA_MAXIMA_S,
+                 relogio=time.monotonic, dormir=time.sleep, semente=None):
+        self.client = client
+        self.max_tentativas = max_tentativas
+        self.prazo_chamada_s = prazo_chamada_s
+        self.espera_base_s = espera_base_s
+        self.espera_maxima_s = espera_maxima_s
+        self._relogio = relogio
+        self._dormir = dormir
+        self._aleatorio = random.Random(semente)
+
+    def espera(self, tentativa):
+        # "Full jitter": sorteia entre 0 e o teto exponencial, para as threads não repetirem em bloco
+        teto = min(self.espera_maxima_s, self.espera_base_s * 2 ** (tentativa - 1))
+        return self._aleatorio.uniform(0, teto)
+
+    def chamar(self, metodo, parametros, limite_lote=None):
+        limite = self._relogio() + self.prazo_chamada_s
+        if limite_lote is not None:
+            limite = min(limite, limite_lote)
+
+        tentativa = 0
+        while True:
+            if self._relogio() >= limite:
+                raise PrazoEsgotado(f"Prazo esgotado antes de {metodo} responder ({tentativa} tentativa(s)).")
+            tentativa += 1
+            try:
+                return getattr(self.client, metodo)(**parametros)
+            except Exception as e:
+                erro = classificar_erro(e)
+                if erro is None:
+                    raise
+                if not erro.retentavel or tentativa >= self.max_tentativas:
+                    raise erro from e
+                espera = self.espera(tentativa)
+                if self._relogio() + espera >= limite:
+                    raise erro from e
+                METRICAS.contar("roteirizador_retentativas_ors_total", tipo=type(erro).__name__)
+                self._dormir(espera)
+
+    def directions(self, **kwargs):
+        return self.chamar('directions', kwargs)
+
+    def distance_matrix(self, **kwargs):
+        return self.chamar('distance_matrix', kwargs)
+
+    def para_lote(self, prazo_s=PRAZO_LOTE_PADRAO):
+        """Visão deste cliente (mesmo pool) cujas chamadas respeitam um prazo comum a partir de agora."""
+        return ClienteLote(self, self._relogio() + prazo_s)
+
+    def __getattr__(self, nome):
+        return getattr(self.client, nome)
+
+
+class ClienteLote:
+    """Chamadas de um lote (uma planilha) sobre um ``ClienteResiliente`` compartilhado."""
+
+    def __init__(self, cliente, limite):
+        self.cliente = cliente
+        self.limite = limite
+
+    def directions(self, **kwargs):
+        return self.cliente.chamar('directions', kwargs, self.limite)
+
+    def distance_matrix(self, **kwargs):
+        return self.cliente.chamar('distance_matrix', kwargs, self.limite)
+
+    def __getattr__(self, nome):
+        return getattr(self.cliente, nome)
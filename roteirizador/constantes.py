@@ -0,0 +1,17 @@
+"""Constantes de classificação de superfície, cores e do desvio pela Ponte BR-262."""
+
+UNPAVED_TYPES = ['unpaved', 'compacted', 'dirt', 'earth', 'gravel', 'fine_gravel', 'grass', 'ground', 'sand', 'wood', 'mud', 'clay', 'salt', 'ice', 'snow']
+
+# Cores do mapa, do gráfico e dos arquivos exportados
+COR_ASFALTO = '#555555'
+COR_CHAO = '#8B4513'
+
+ORS_SURFACE_MAPPING = {
+    0: "unknown", 1: "paved", 2: "unpaved", 3: "asphalt", 4: "concrete",
+    5: "cobblestone", 6: "metal", 7: "wood", 8: "compacted", 9: "fine_gravel",
+    10: "gravel", 11: "dirt", 12: "earth", 13: "ice", 14: "salt", 15: "sand",
+    16: "woodchips", 17: "grass", 18: "grass_paver"
+}
+
+# PONTO DE DESVIO ESTRATÉGICO (Ponte BR-262 / Porto Morrinho)
+PONTE_BR262 = [-57.129748, -19.246586]
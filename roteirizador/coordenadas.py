@@ -0,0 +1,79 @@
+"""Limpeza e conversão das coordenadas vindas da planilha (decimal ou DMS).
+
+``limpar_e_converter`` trata uma célula; ``converter_coluna`` trata a coluna
+inteira de uma vez e devolve uma máscara com todas as linhas inválidas.
+"""
+import re
+
+# Padrões compilados uma única vez por processo
+PADRAO_INDICA_DMS = re.compile(r"[SWNEO°º]")
+PADRAO_DMS = re.compile(r"[\d\.,]+[°º\s]+[\d\.,]+[′'\s]+[\d\.,]+[″\"\s]*[NSEWO]")
+PADRAO_NUMERO = re.compile(r'-?\d+\.\d+|-?\d+')
+PADRAO_PARTES_DMS = re.compile(r'[\d\.]+')
+
+
+def dms_para_decimal(dms_str):
+    dms_str = dms_str.replace(',', '.')
+    dms_str = dms_str.upper().strip()
+    sign = -1 if 'S' in dms_str or 'W' in dms_str or 'O' in dms_str else 1
+    
+    parts = [float(x) for x in PADRAO_PARTES_DMS.findall(dms_str)]
+    
+    if len(parts) >= 3:
+        return sign * (parts[0] + (parts[1] / 60) + (parts[2] / 3600))
+    elif len(parts) >= 2:
+        return sign * (parts[0] + (parts[1] / 60))
+    elif len(parts) == 1:
+        return sign * float(parts[0])
+    return None
+
+
+def limpar_e_converter(texto):
+    texto = str(texto).strip().upper()
+    try:
+        if PADRAO_INDICA_DMS.search(texto):
+            matches = PADRAO_DMS.findall(texto)
+            if len(matches) >= 2:
+                lat = dms_para_decimal(matches[0])
+                lon = dms_para_decimal(matches[1])
+                return lat, lon
+            return None, None
+
+        numeros = PADRAO_NUMERO.findall(texto.replace(',', '.'))
+        
+        if len(numeros) >= 2:
+            lat = float(numeros[0])
+            lon = float(numeros[1])
+            if abs(lat) <= 90 and abs(lon) <= 180:
+                return lat, lon
+    except ValueError:
+        # Partes DMS malformadas (ex.: '1.2.3°'): a célula conta como inválida
+        pass
+    return None, None
+
+
+def converter_coluna(valores):
+    """Converte uma coluna inteira de coordenadas.
+
+    Os valores são fatorados primeiro (as mesmas fazendas e bases se repetem
+    muito), então cada texto distinto passa pelos padrões compilados uma
+    única vez. Retorna ``(lat, lon, erros)``: arrays float com NaN nas linhas
+    inválidas e uma máscara booleana com todas elas.
+    """
+    import numpy as np
+    import pandas as pd
+
+    codigos, unicos = pd.factorize(pd.Series(valores, dtype=object))
+
+    # A última posição fica NaN e atende as células vazias (código -1 do factorize)
+    lat_unicos = np.full(len(unicos) + 1, np.nan)
+    lon_unicos = np.full(len(unicos) + 1, np.nan)
+    for i, texto in enumerate(unicos):
+        lat, lon = limpar_e_converter(texto)
+        if lat is not None:
+            lat_unicos[i] = lat
+            lon_unicos[i] = lon
+
+    lat = lat_unicos[codigos]
+    lon = lon_unicos[codigos]
+    return lat, lon, np.isnan(lat) | np.isnan(lon)
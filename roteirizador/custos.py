@@ -0,0 +1,274 @@
+"""Modelo de custo Asfalto/Chão e recálculo de lotes inteiros sem chamar o ORS.
+
+O intermediário canônico de cada carga roteada são os metros por tipo de
+superfície (``RotaCompacta.resumo_tipos``) e a distância oficial da rota.
+``TotaisSuperficies`` guarda esses totais num SQLite, por lote e carga; com
+eles, mudar um fator ou reclassificar uma superfície (ex.: ``compacted`` como
+asfalto) é uma passada vetorizada do pandas (``reprecificar``), sem rotear de
+novo. ``comparar_modelos`` põe vários modelos lado a lado para a simulação
+do dashboard.
+
+Cargas do modo estimativa (sem geometria) não têm totais por superfície e
+não entram nos lotes gravados.
+
+O pandas só é importado pelas funções de recálculo: ``ModeloCusto`` é usado
+também por ``roteirizador.rotas``, que não depende dele.
+"""
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from roteirizador.armazenamento import caminho_dados, conectar
+from roteirizador.constantes import ORS_SURFACE_MAPPING, UNPAVED_TYPES
+
+ARQUIVO_TOTAIS = 'totais_superficies.sqlite3'
+LOTE_CONSULTA = 900
+
+
+@dataclass(frozen=True)
+class ModeloCusto:
+    """Fatores por quilômetro e o conjunto de superfícies que contam como chão."""
+
+    nome: str = "Padrão"
+    fator_asfalto: float = 1.03
+    fator_chao: float = 1.09
+    superficies_chao: frozenset = frozenset(UNPAVED_TYPES)
+
+    def eh_chao(self, superficie):
+        return superficie in self.superficies_chao
+
+    def custo(self, km_asfalto, km_chao):
+        """Custo ponderado; aceita números ou Series/arrays."""
+        return km_asfalto * self.fator_asfalto + km_chao * self.fator_chao
+
+    def km_por_classe(self, metros_por_tipo, distancia_oficial_m):
+        """(km asfalto, km chão) de uma carga a partir dos metros por tipo, normalizados pela distância oficial."""
+        chao = sum(m for tipo, m in metros_por_tipo.items() if self.eh_chao(tipo))
+        total = sum(metros_por_tipo.values())
+        fator = distancia_oficial_m / total if total > 0 else 0.0
+        return (total - chao) * fator / 1000, chao * fator / 1000
+
+
+MODELO_PADRAO = ModeloCusto()
+
+
+def superficies_conhecidas():
+    """Nomes de superfície que o ORS devolve, para montar reclassificações."""
+    return sorted(set(ORS_SURFACE_MAPPING.values()) | set(UNPAVED_TYPES))
+
+
+# --- RECÁLCULO VETORIZADO ---
+
+
+def reprecificar(totais, cargas, modelo=MODELO_PADRAO):
+    """Resumo por carga (mesmas colunas de ``linha_resumo``) recalculado com ``modelo``.
+
+    ``totais``: colunas Lote, Carga, Superficie, Metros (uma linha por tipo);
+    ``cargas``: colunas Lote, Carga, Distancia_Oficial_m, Adicional_km.
+    """
+    import pandas as pd
+
+    chave = ['Lote', 'Carga']
+    eh_chao = totais['Superficie'].isin(modelo.superficies_chao)
+    metros = pd.DataFrame({
+        'Lote': totais['Lote'],
+        'Carga': totais['Carga'],
+        'Total_m': totais['Metros'],
+        'Chao_m': totais['Metros'].where(eh_chao, 0.0),
+    }).groupby(chave, sort=False).sum()
+
+    df = cargas.set_index(chave).join(metros, how='inner')
+    # Mesma normalização do roteamento: a soma dos trechos bate com a distância oficial
+    fator = (df['Distancia_Oficial_m'] / df['Total_m']).where(df['Total_m'] > 0, 0.0)
+    km_chao = df['Chao_m'] * fator / 1000
+    km_asfalto = (df['Total_m'] - df['Chao_m']) * fator / 1000
+    km_total = km_asfalto + km_chao
+    custo = modelo.custo(km_asfalto, km_chao)
+
+    return pd.DataFrame({
+        "Distância Total (km)": (custo + df['Adicional_km']).round(2),
+        "Asfalto (km)": km_asfalto.round(2),
+        "Chão (km)": km_chao.round(2),
+        "% Chão": (km_chao / km_total * 100).where(km_total > 0, 0.0).round(1),
+        "Custo Estimado (pts)": custo.round(2),
+    }).reset_index()
+
+
+def comparar_modelos(totais, cargas, modelos):
+    """Custo por carga em cada modelo, lado a lado, e a variação em relação ao primeiro.
+
+    Retorna (por_carga, resumo): ``por_carga`` tem uma coluna de custo por
+    modelo; ``resumo`` tem uma linha por modelo com km, % chão e custo total.
+    """
+    import pandas as pd
+
+    por_carga = None
+    linhas = []
+    base = None
+    for modelo in modelos:
+        df = reprecificar(totais, cargas, modelo)
+        custo_total = float(df["Custo Estimado (pts)"].sum())
+        km_chao = float(df["Chão (km)"].sum())
+        km_total = km_chao + float(df["Asfalto (km)"].sum())
+        if base is None:
+            base = custo_total
+        linhas.append({
+            "Modelo": modelo.nome,
+            "Cargas": len(df),
+            "Asfalto (km)": round(km_total - km_chao, 2),
+            "Chão (km)": round(km_chao, 2),
+            "% Chão": round(km_chao / km_total * 100, 1) if km_total > 0 else 0.0,
+            "Custo Total (pts)": round(custo_total, 2),
+            "Variação (%)": round((custo_total - base) / base * 100, 2) if base else 0.0,
+        })
+        coluna = df[['Lote', 'Carga', "Custo Estimado (pts)"]].rename(
+            columns={"Custo Estimado (pts)": f"Custo ({modelo.nome})"}
+        )
+        por_carga = coluna if por_carga is None else por_carga.merge(coluna, on=['Lote', 'Carga'], how='outer')
+    return por_carga, pd.DataFrame(linhas)
+
+
+def totais_de_resultados(lote, resultados):
+    """(totais, cargas) de um dict carga_id -> ``ResultadoRota`` em memória, no formato de ``reprecificar``."""
+    import pandas as pd
+
+    linhas_totais = []
+    linhas_cargas = []
+    for carga_id, resultado in resultados.items():
+        if resultado.rota is None:
+            continue
+        carga = str(carga_id)
+        for superficie, metros in resultado.rota.resumo_tipos().items():
+            linhas_totais.append((lote, carga, superficie, metros))
+        linhas_cargas.append((lote, carga, resultado.rota.distancia_oficial_m,
+                              resultado.detalhes.get("Adicional (KM)", 0.0)))
+    return (
+        pd.DataFrame(linhas_totais, columns=['Lote', 'Carga', 'Superficie', 'Metros']),
+        pd.DataFrame(linhas_cargas, columns=['Lote', 'Carga', 'Distancia_Oficial_m', 'Adicional_km']),
+    )
+
+
+# --- PERSISTÊNCIA ---
+
+
+def novo_lote():
+    """Identificador de um lote: data e hora de início e um sufixo aleatório."""
+    return f"{time.strftime('%Y-%m-%d %H:%M:%S')} {uuid.uuid4().hex[:6]}"
+
+
+class TotaisSuperficies:
+    """Metros por tipo de superfície de cada carga roteada, por lote, em SQLite."""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or caminho_dados(ARQUIVO_TOTAIS)
+        self._lock = threading.Lock()
+        self._conn = conectar(self.caminho)
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS lotes (
+                   lote TEXT PRIMARY KEY,
+                   descricao TEXT,
+                   criado REAL NOT NULL
+               );
+               CREATE TABLE IF NOT EXISTS cargas (
+                   lote TEXT NOT NULL,
+                   carga TEXT NOT NULL,
+                   distancia_oficial_m REAL NOT NULL,
+                   adicional_km REAL NOT NULL,
+                   PRIMARY KEY (lote, carga)
+               );
+               CREATE TABLE IF NOT EXISTS totais (
+                   lote TEXT NOT NULL,
+                   carga TEXT NOT NULL,
+                   superficie TEXT NOT NULL,
+                   metros REAL NOT NULL,
+                   PRIMARY KEY (lote, carga, superficie)
+               );"""
+        )
+
+    def registrar_lote(self, lote, resultados, descricao=None):
+        """Grava (ou substitui) as cargas roteadas de ``resultados``; retorna quantas foram gravadas."""
+        totais, cargas = totais_de_resultados(lote, resultados)
+        if cargas.empty:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO lotes (lote, descricao, criado) VALUES (?, ?, ?) "
+                    "ON CONFLICT(lote) DO UPDATE SET descricao = COALESCE(excluded.descricao, descricao)",
+                    (lote, descricao, time.time())
+                )
+                # Superfícies que sumiram da rota nova não podem sobrar: apaga as linhas antigas em blocos
+                ids = cargas['Carga'].tolist()
+                for i in range(0, len(ids), LOTE_CONSULTA):
+                    bloco = ids[i:i + LOTE_CONSULTA]
+                    marcadores = ",".join("?" * len(bloco))
+                    self._conn.execute(f"DELETE FROM totais WHERE lote = ? AND carga IN ({marcadores})", (lote, *bloco))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cargas (lote, carga, distancia_oficial_m, adicional_km) VALUES (?, ?, ?, ?)",
+                    cargas.itertuples(index=False, name=None)
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO totais (lote, carga, superficie, metros) VALUES (?, ?, ?, ?)",
+                    totais.itertuples(index=False, name=None)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(cargas)
+
+    def lotes(self):
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT l.lote, l.descricao, l.criado, COUNT(c.carga) FROM lotes l "
+                "LEFT JOIN cargas c ON c.lote = l.lote GROUP BY l.lote ORDER BY l.criado DESC"
+            ).fetchall()
+        return [
+            {"Lote": lote, "Descrição": descricao or "", "Criado": time.strftime('%Y-%m-%d %H:%M', time.localtime(criado)),
+             "Cargas": n}
+            for lote, descricao, criado, n in linhas
+        ]
+
+    def carregar(self, lotes=None):
+        """(totais, cargas) dos ``lotes`` pedidos (todos se None), prontos para ``reprecificar``."""
+        import pandas as pd
+
+        consultas_totais = []
+        consultas_cargas = []
+        with self._lock:
+            if lotes is None:
+                consultas_totais.append(self._conn.execute("SELECT lote, carga, superficie, metros FROM totais").fetchall())
+                consultas_cargas.append(self._conn.execute(
+                    "SELECT lote, carga, distancia_oficial_m, adicional_km FROM cargas").fetchall())
+            else:
+                lotes = list(lotes)
+                for i in range(0, len(lotes), LOTE_CONSULTA):
+                    bloco = lotes[i:i + LOTE_CONSULTA]
+                    marcadores = ",".join("?" * len(bloco))
+                    consultas_totais.append(self._conn.execute(
+                        f"SELECT lote, carga, superficie, metros FROM totais WHERE lote IN ({marcadores})", bloco
+                    ).fetchall())
+                    consultas_cargas.append(self._conn.execute(
+                        "SELECT lote, carga, distancia_oficial_m, adicional_km FROM cargas "
+                        f"WHERE lote IN ({marcadores})", bloco
+                    ).fetchall())
+        return (
+            pd.DataFrame([l for c in consultas_totais for l in c], columns=['Lote', 'Carga', 'Superficie', 'Metros']),
+            pd.DataFrame([l for c in consultas_cargas for l in c],
+                         columns=['Lote', 'Carga', 'Distancia_Oficial_m', 'Adicional_km']),
+        )
+
+    def estatisticas(self):
+        with self._lock:
+            lotes = self._conn.execute("SELECT COUNT(*) FROM lotes").fetchone()[0]
+            cargas = self._conn.execute("SELECT COUNT(*) FROM cargas").fetchone()[0]
+            tipos = self._conn.execute("SELECT COUNT(DISTINCT superficie) FROM totais").fetchone()[0]
+        return {"lotes": lotes, "cargas": cargas, "tipos_superficie": tipos}
+
+    def limpar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM totais")
+            self._conn.execute("DELETE FROM cargas")
+            self._conn.execute("DELETE FROM lotes")
@@ -0,0 +1,225 @@
+"""Despacho concorrente de cargas com limite de taxa para a API do ORS.
+
+As cargas são roteadas em paralelo num pool de threads de tamanho fixo. Cada
+chamada a ``client.directions`` (inclusive as tentativas de fallback do erro
+2004) consome uma ficha de um balde de fichas (token bucket) que respeita as
+cotas por minuto e por dia da chave da API.
+
+A cota diária do ORS vira à meia-noite UTC. Com ``chave``, o contador do
+dia fica em SQLite no diretório de dados e é somado entre a interface, o CLI
+e os trabalhadores da fila de tarefas; sem ``chave`` ele vale só para o
+processo. O balde por minuto é sempre local.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timezone
+
+from roteirizador.armazenamento import caminho_dados, conectar
+from roteirizador.cliente_ors import CotaDiariaEsgotada
+
+# Cotas do plano gratuito do ORS para o endpoint de directions
+COTA_POR_MINUTO = 40
+COTA_POR_DIA = 2000
+
+ARQUIVO_COTA = 'cota.sqlite3'
+MAX_WORKERS_PADRAO = 4
+
+
+def dia_utc():
+    """Dia corrente da cota do ORS ('AAAA-MM-DD' em UTC)."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+class UsoDiario:
+    """Chamadas do dia por chave da API, em SQLite, somadas entre processos.
+
+    A chave é guardada só como hash. O incremento é um único ``UPDATE``
+    condicionado ao limite, atômico no SQLite mesmo com vários processos.
+    """
+
+    def __init__(self, chave, caminho=None):
+        self.chave = hashlib.sha256(str(chave).encode('utf-8')).hexdigest()[:16]
+        self.caminho = caminho or caminho_dados(ARQUIVO_COTA)
+        self._lock = threading.Lock()
+        self._conn = conectar(self.caminho)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS uso_diario (
+                   chave TEXT NOT NULL,
+                   dia TEXT NOT NULL,
+                   usadas INTEGER NOT NULL,
+                   PRIMARY KEY (chave, dia)
+               )"""
+        )
+
+    def consumir(self, dia, limite):
+        """Conta uma chamada no ``dia`` se ainda houver cota; retorna False se ela acabou."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO uso_diario (chave, dia, usadas) VALUES (?, ?, 0)", (self.chave, dia)
+            )
+            if limite is None:
+                cursor = self._conn.execute(
+                    "UPDATE uso_diario SET usadas = usadas + 1 WHERE chave = ? AND dia = ?", (self.chave, dia)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE uso_diario SET usadas = usadas + 1 WHERE chave = ? AND dia = ? AND usadas < ?",
+                    (self.chave, dia, limite)
+                )
+            return cursor.rowcount == 1
+
+    def usadas(self, dia):
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT usadas FROM uso_diario WHERE chave = ? AND dia = ?", (self.chave, dia)
+            ).fetchone()
+        return linha[0] if linha else 0
+
+    def descartar_anteriores(self, dia):
+        with self._lock:
+            self._conn.execute("DELETE FROM uso_diario WHERE chave = ? AND dia < ?", (self.chave, dia))
+
+
+class LimitadorTaxa:
+    """Balde de fichas por minuto somado a um contador diário (UTC), seguro entre threads.
+
+    Com ``chave`` o contador diário é o ``UsoDiario`` compartilhado entre
+    processos (``caminho`` troca o arquivo); sem ela, é um contador em memória.
+    """
+
+    def __init__(self, por_minuto=COTA_POR_MINUTO, por_dia=COTA_POR_DIA, relogio=time.monotonic,
+                 chave=None, caminho=None):
+        self.por_minuto = por_minuto
+        self.por_dia = por_dia
+        self._relogio = relogio
+        self._lock = threading.Lock()
+        self._fichas = float(por_minuto)
+        self._ultima_recarga = relogio()
+        self._dia = dia_utc()
+        self._usadas_hoje = 0
+        self._uso = UsoDiario(chave, caminho) if chave is not None else None
+        if self._uso is not None:
+            self._uso.descartar_anteriores(self._dia)
+
+    def _recarregar(self):
+        agora = self._relogio()
+        decorrido = agora - self._ultima_recarga
+        self._ultima_recarga = agora
+        self._fichas = min(float(self.por_minuto), self._fichas + decorrido * self.por_minuto / 60.0)
+
+        hoje = dia_utc()
+        if hoje != self._dia:
+            self._dia = hoje
+            self._usadas_hoje = 0
+            if self._uso is not None:
+                self._uso.descartar_anteriores(hoje)
+
+    def _consumir_dia(self):
+        if self._uso is not None:
+            return self._uso.consumir(self._dia, self.por_dia)
+        if self.por_dia is not None and self._usadas_hoje >= self.por_dia:
+            return False
+        self._usadas_hoje += 1
+        return True
+
+    def adquirir(self):
+        """Bloqueia até haver uma ficha disponível e a consome."""
+        while True:
+            with self._lock:
+                self._recarregar()
+                if self._fichas >= 1:
+                    if not self._consumir_dia():
+                        raise CotaDiariaEsgotada(
+                            f"Cota diária do ORS esgotada ({self.por_dia} chamadas, renova à meia-noite UTC)."
+                        )
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) * 60.0 / self.por_minuto
+            time.sleep(espera)
+
+    @property
+    def restantes_hoje(self):
+        with self._lock:
+            self._recarregar()
+            if self.por_dia is None:
+                return None
+            usadas = self._uso.usadas(self._dia) if self._uso is not None else self._usadas_hoje
+            return max(0, self.por_dia - usadas)
+
+
+class ClienteLimitado:
+    """Envolve um cliente ORS e faz cada ``directions`` (e ``distance_matrix``) esperar pelo limitador."""
+
+    def __init__(self, client, limitador):
+        self.client = client
+        self.limitador = limitador
+
+    def directions(self, **kwargs):
+        self.limitador.adquirir()
+        return self.client.directions(**kwargs)
+
+    def distance_matrix(self, **kwargs):
+        self.limitador.adquirir()
+        return self.client.distance_matrix(**kwargs)
+
+    def __getattr__(self, nome):
+        return getattr(self.client, nome)
+
+
+def processar_cargas(grupos, funcao, max_workers=MAX_WORKERS_PADRAO, ao_concluir=None, manter_resultados=True):
+    """Executa ``funcao(dados)`` para cada ``(carga_id, dados)`` de ``grupos`` em paralelo.
+
+    Retorna um dict com os resultados na ordem original das cargas. Se
+    informado, ``ao_concluir(carga_id, resultado, concluidas)`` é chamado na
+    thread de quem chamou a função, à medida que cada carga termina, o que
+    permite atualizar a interface de forma incremental.
+
+    ``grupos`` pode ser um gerador (leitura da planilha em blocos): as cargas
+    começam a ser roteadas enquanto o arquivo ainda está sendo lido, e no
+    máximo ``4 * max_workers`` cargas ficam aguardando na fila. Com
+    ``manter_resultados=False`` (saída em fluxo) cada resultado só é repassado
+    ao ``ao_concluir`` e descartado, e o dict retornado fica vazio.
+
+    Uma exceção de ``funcao`` (ex.: ``CotaDiariaEsgotada``) interrompe o lote:
+    as cargas ainda na fila são canceladas e a exceção sobe para quem chamou.
+    """
+    max_workers = max(1, int(max_workers))
+    limite_fila = 4 * max_workers
+    resultados = {}
+    pendentes = {}
+    concluidas = 0
+
+    def coletar(futuros):
+        nonlocal concluidas
+        for futuro in futuros:
+            carga_id = pendentes.pop(futuro)
+            resultado = futuro.result()
+            concluidas += 1
+            if manter_resultados:
+                resultados[carga_id] = resultado
+            if ao_concluir is not None:
+                ao_concluir(carga_id, resultado, concluidas)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for carga_id, dados in grupos:
+                # Reserva a posição para preservar a ordem de entrada no dict final
+                if manter_resultados:
+                    resultados[carga_id] = None
+                pendentes[executor.submit(funcao, dados)] = carga_id
+
+                prontos = [futuro for futuro in pendentes if futuro.done()]
+                if len(pendentes) - len(prontos) >= limite_fila:
+                    prontos = wait(pendentes, return_when=FIRST_COMPLETED).done
+                coletar(prontos)
+
+            coletar(as_completed(list(pendentes)))
+        except BaseException:
+            # Nada mais é despachado; só as cargas já em execução terminam
+            for futuro in pendentes:
+                futuro.cancel()
+            raise
+
+    return resultados
@@ -0,0 +1,147 @@
+"""Motor vetorizado de distâncias para geometrias no formato [lon, lat].
+
+Calcula o comprimento de todos os segmentos de uma rota numa única operação
+de arrays e expõe somas acumuladas (prefix sums), de forma que a distância de
+qualquer trecho ``[inicio, fim]`` de ``extras['surface']['values']`` seja uma
+consulta O(1).
+"""
+import numpy as np
+
+# Modos de precisão disponíveis:
+# - 'elipsoide': Vincenty inverso no WGS-84 (paridade com geopy.distance.geodesic)
+# - 'haversine': esfera de raio médio, mais rápido e com erro típico < 0,5%
+MODO_ELIPSOIDE = 'elipsoide'
+MODO_HAVERSINE = 'haversine'
+MODOS_DISTANCIA = (MODO_ELIPSOIDE, MODO_HAVERSINE)
+
+RAIO_MEDIO_TERRA_M = 6371008.8
+
+# Elipsoide WGS-84
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+
+def _como_array(coords):
+    arr = np.asarray(coords, dtype=np.float64)
+    if arr.ndim != 2 or arr.shape[0] == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    # Ignora a elevação caso a geometria venha com 3 dimensões
+    return arr[:, :2]
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    """Distância em metros na esfera (aceita escalares ou arrays, em graus)."""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lon1, lat1, lon2, lat2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * RAIO_MEDIO_TERRA_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def vincenty_m(lon1, lat1, lon2, lat2, tolerancia=1e-12, max_iteracoes=200):
+    """Distância em metros no elipsoide WGS-84 (Vincenty inverso vetorizado).
+
+    Pontos quase antipodais, onde a iteração não converge, caem para haversine.
+    """
+    lon1, lat1, lon2, lat2 = (np.asarray(v, dtype=np.float64) for v in (lon1, lat1, lon2, lat2))
+    a, b, f = WGS84_A, WGS84_B, WGS84_F
+
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L
+    convergiu = np.zeros(np.shape(L), dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iteracoes):
+            sinLam, cosLam = np.sin(lam), np.cos(lam)
+            sinSigma = np.hypot(cosU2 * sinLam, cosU1 * sinU2 - sinU1 * cosU2 * cosLam)
+            cosSigma = sinU1 * sinU2 + cosU1 * cosU2 * cosLam
+            sigma = np.arctan2(sinSigma, cosSigma)
+            sinAlpha = np.where(sinSigma == 0, 0.0, cosU1 * cosU2 * sinLam / sinSigma)
+            cos2Alpha = 1 - sinAlpha ** 2
+            # Linhas equatoriais (cos2Alpha == 0) têm cos2SigmaM indefinido; usa 0
+            cos2SigmaM = np.where(cos2Alpha == 0, 0.0, cosSigma - 2 * sinU1 * sinU2 / cos2Alpha)
+            C = f / 16 * cos2Alpha * (4 + f * (4 - 3 * cos2Alpha))
+            lam_anterior = lam
+            lam = L + (1 - C) * f * sinAlpha * (
+                sigma + C * sinSigma * (cos2SigmaM + C * cosSigma * (-1 + 2 * cos2SigmaM ** 2))
+            )
+            convergiu = np.abs(lam - lam_anterior) < tolerancia
+            if np.all(convergiu):
+                break
+
+        uSq = cos2Alpha * (a ** 2 - b ** 2) / b ** 2
+        A = 1 + uSq / 16384 * (4096 + uSq * (-768 + uSq * (320 - 175 * uSq)))
+        B = uSq / 1024 * (256 + uSq * (-128 + uSq * (74 - 47 * uSq)))
+        deltaSigma = B * sinSigma * (
+            cos2SigmaM + B / 4 * (
+                cosSigma * (-1 + 2 * cos2SigmaM ** 2)
+                - B / 6 * cos2SigmaM * (-3 + 4 * sinSigma ** 2) * (-3 + 4 * cos2SigmaM ** 2)
+            )
+        )
+        s = b * A * (sigma - deltaSigma)
+
+    s = np.where(sinSigma == 0, 0.0, s)
+    if not np.all(convergiu):
+        s = np.where(convergiu, s, haversine_m(lon1, lat1, lon2, lat2))
+    return s
+
+
+def distancia_pontos_m(p1, p2, modo=MODO_ELIPSOIDE):
+    """Distância em metros entre dois pontos [lon, lat]."""
+    funcao = haversine_m if modo == MODO_HAVERSINE else vincenty_m
+    return float(funcao(p1[0], p1[1], p2[0], p2[1]))
+
+
+def distancias_segmentos(coords, modo=MODO_ELIPSOIDE):
+    """Comprimento (m) de cada segmento consecutivo de uma geometria [lon, lat]."""
+    if modo not in MODOS_DISTANCIA:
+        raise ValueError(f"Modo de distância desconhecido: {modo}")
+
+    arr = _como_array(coords)
+    if len(arr) < 2:
+        return np.zeros(0, dtype=np.float64)
+
+    lon, lat = arr[:, 0], arr[:, 1]
+    funcao = haversine_m if modo == MODO_HAVERSINE else vincenty_m
+    return funcao(lon[:-1], lat[:-1], lon[1:], lat[1:])
+
+
+def distancias_acumuladas(coords, modo=MODO_ELIPSOIDE):
+    """Soma acumulada (m) das distâncias; ``acumulado[i]`` é a distância do vértice 0 ao i."""
+    segmentos = distancias_segmentos(coords, modo)
+    acumulado = np.empty(len(segmentos) + 1, dtype=np.float64)
+    acumulado[0] = 0.0
+    np.cumsum(segmentos, out=acumulado[1:])
+    return acumulado
+
+
+def distancia_trecho(acumulado, inicio, fim):
+    """Distância (m) entre os vértices ``inicio`` e ``fim`` em O(1)."""
+    return float(acumulado[fim] - acumulado[inicio])
+
+
+def distancias_trechos(acumulado, inicios, fins):
+    """Versão vetorizada de :func:`distancia_trecho` para vários trechos."""
+    return acumulado[np.asarray(fins, dtype=np.intp)] - acumulado[np.asarray(inicios, dtype=np.intp)]
+
+
+def comparar_com_geodesic(coords, modo=MODO_ELIPSOIDE):
+    """Checagem de paridade contra o cálculo por par do geopy.
+
+    Retorna ``(total_motor_m, total_geodesic_m, maior_diferenca_segmento_m)``.
+    """
+    from geopy.distance import geodesic
+
+    arr = _como_array(coords)
+    referencia = np.array([
+        geodesic((p1[1], p1[0]), (p2[1], p2[0])).meters
+        for p1, p2 in zip(arr[:-1], arr[1:])
+    ])
+    motor = distancias_segmentos(arr, modo)
+    maior_diferenca = float(np.max(np.abs(motor - referencia))) if len(motor) else 0.0
+    return float(motor.sum()), float(referencia.sum()), maior_diferenca
@@ -0,0 +1,258 @@
+"""Modo estimativa: km por carga pela matriz do ORS, sem geometria nem superfícies.
+
+Para cotação basta o total de km. Em vez de um ``directions`` por carga, os
+trechos (parada -> parada seguinte) de todas as cargas são agrupados em
+poucas chamadas ao endpoint de matriz, e a divisão Asfalto/Chão de cada
+trecho vem da proporção histórica do corredor, aprendida das rotas completas
+(``HistoricoCorredores``). Cada carga vira um ``ResultadoRota`` com os mesmos
+``detalhes`` de ``processar_rota`` (fatores do ``MODELO_PADRAO``), com ``rota`` None:
+a rota completa só é buscada para as cargas que o usuário abrir.
+
+Limitação: a matriz do ORS não aceita ``avoid_polygons``, então a distância
+estimada não desvia das zonas de restrição.
+"""
+import threading
+import time
+
+from roteirizador.armazenamento import caminho_dados, conectar
+from roteirizador.cliente_ors import CotaDiariaEsgotada
+from roteirizador.constantes import UNPAVED_TYPES
+from roteirizador.estrategias import chave_corredor
+from roteirizador.memo_rotas import RotaBase
+from roteirizador.pontos_controle import indices_paradas, link_google_maps
+from roteirizador.resultado import ResultadoRota
+from roteirizador.rotas import compor_resultado, extrair_paradas, somar_km_adicional
+from roteirizador.superficies import nome_superficie
+
+ARQUIVO_CORREDORES = 'corredores.sqlite3'
+PRECISAO_TRECHO = 2  # casas decimais (~1 km), como a memória de estratégias
+PRECISAO_REGIAO = 1  # casas decimais (~11 km), usada quando o trecho exato não tem histórico
+LOTE_CONSULTA = 900  # chaves por consulta IN (o SQLite limita os parâmetros por comando)
+
+# Limites do endpoint de matriz do plano público do ORS
+MAX_LOCAIS_MATRIZ = 50
+MAX_ELEMENTOS_MATRIZ = 2500
+
+
+# --- HISTÓRICO ASFALTO/CHÃO POR TRECHO ---
+
+
+def km_por_trecho(geometry, paradas, valores, lookup_surface, acumulado, way_points=None):
+    """(km_total, km_chao) de cada trecho entre paradas consecutivas de uma rota completa."""
+    indices = indices_paradas(geometry, paradas, way_points)
+    trechos = []
+    for inicio, fim in zip(indices[:-1], indices[1:]):
+        total = float(acumulado[fim] - acumulado[inicio])
+        chao = 0.0
+        for start, end, surf in valores:
+            a, b = max(start, inicio), min(end, fim)
+            if a < b and nome_superficie(surf, lookup_surface) in UNPAVED_TYPES:
+                chao += float(acumulado[b] - acumulado[a])
+        trechos.append((total / 1000, chao / 1000))
+    return trechos
+
+
+class HistoricoCorredores:
+    """Proporção de chão acumulada por trecho (par de paradas), em SQLite."""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or caminho_dados(ARQUIVO_CORREDORES)
+        self._lock = threading.Lock()
+        self._conn = conectar(self.caminho)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS trechos (
+                   chave TEXT PRIMARY KEY,
+                   km_total REAL NOT NULL,
+                   km_chao REAL NOT NULL,
+                   rotas INTEGER NOT NULL,
+                   atualizado REAL NOT NULL
+               )"""
+        )
+
+    @staticmethod
+    def _chaves(origem, destino):
+        return (chave_corredor([origem, destino], PRECISAO_TRECHO),
+                "~" + chave_corredor([origem, destino], PRECISAO_REGIAO))
+
+    def registrar(self, paradas, trechos):
+        """Soma os km de cada trecho de uma rota completa (ver ``km_por_trecho``)."""
+        agora = time.time()
+        linhas = []
+        for origem, destino, (km_total, km_chao) in zip(paradas[:-1], paradas[1:], trechos):
+            if km_total <= 0:
+                continue
+            for chave in self._chaves(origem, destino):
+                linhas.append((chave, km_total, km_chao, agora))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                """INSERT INTO trechos (chave, km_total, km_chao, rotas, atualizado) VALUES (?, ?, ?, 1, ?)
+                   ON CONFLICT(chave) DO UPDATE SET
+                       km_total = km_total + excluded.km_total,
+                       km_chao = km_chao + excluded.km_chao,
+                       rotas = rotas + 1,
+                       atualizado = excluded.atualizado""",
+                linhas
+            )
+            self._conn.execute("COMMIT")
+
+    def registrar_rota(self, paradas, geometry, valores, lookup_surface, acumulado, way_points=None):
+        """Atalho usado por ``rotear_carga`` a cada rota completa."""
+        self.registrar(paradas, km_por_trecho(geometry, paradas, valores, lookup_surface, acumulado, way_points))
+
+    def proporcao_chao(self, origem, destino):
+        """(fração de chão, origem da estimativa) do trecho: exato, região ou média geral."""
+        return self.proporcoes_chao([(origem, destino)])[0]
+
+    def proporcoes_chao(self, pares):
+        """``proporcao_chao`` de cada par (origem, destino), com poucas consultas.
+
+        As chaves exatas e de região de todos os pares saem em consultas
+        ``IN`` de até ``LOTE_CONSULTA`` chaves, e a média geral (que soma a
+        tabela inteira) só é calculada uma vez, se algum par não tiver histórico.
+        """
+        chaves = [self._chaves(origem, destino) for origem, destino in pares]
+        unicas = list(dict.fromkeys(chave for par in chaves for chave in par))
+        conhecidas = {}
+        with self._lock:
+            for i in range(0, len(unicas), LOTE_CONSULTA):
+                lote = unicas[i:i + LOTE_CONSULTA]
+                marcadores = ",".join("?" * len(lote))
+                for chave, km_total, km_chao in self._conn.execute(
+                    f"SELECT chave, km_total, km_chao FROM trechos WHERE chave IN ({marcadores}) AND km_total > 0",
+                    lote
+                ):
+                    conhecidas[chave] = km_chao / km_total
+
+            geral = None
+            if any(exata not in conhecidas and regiao not in conhecidas for exata, regiao in chaves):
+                km_total, km_chao = self._conn.execute(
+                    "SELECT SUM(km_total), SUM(km_chao) FROM trechos WHERE chave NOT LIKE '~%'"
+                ).fetchone()
+                geral = (km_chao / km_total, "média geral") if km_total else (0.0, "sem histórico")
+
+        proporcoes = []
+        for exata, regiao in chaves:
+            if exata in conhecidas:
+                proporcoes.append((conhecidas[exata], "trecho"))
+            elif regiao in conhecidas:
+                proporcoes.append((conhecidas[regiao], "região"))
+            else:
+                proporcoes.append(geral)
+        return proporcoes
+
+    def estatisticas(self):
+        with self._lock:
+            trechos, km_total, km_chao = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(km_total), 0), COALESCE(SUM(km_chao), 0) "
+                "FROM trechos WHERE chave NOT LIKE '~%'"
+            ).fetchone()
+        return {
+            "Trechos Conhecidos": trechos,
+            "KM Observados": round(km_total, 1),
+            "% Chão Médio": round(100 * km_chao / km_total, 1) if km_total else 0.0,
+        }
+
+    def limpar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM trechos")
+
+
+# --- DISTÂNCIAS PELA MATRIZ ---
+
+
+def _lotes_trechos(pares, max_locais=MAX_LOCAIS_MATRIZ, max_elementos=MAX_ELEMENTOS_MATRIZ):
+    """Agrupa pares (origem, destino) únicos em lotes que respeitam os limites da matriz."""
+    lote, origens, destinos = [], [], []
+    for origem, destino in pares:
+        novas_origens = origens if origem in origens else origens + [origem]
+        novos_destinos = destinos if destino in destinos else destinos + [destino]
+        locais = len(set(novas_origens) | set(novos_destinos))
+        if lote and (locais > max_locais or len(novas_origens) * len(novos_destinos) > max_elementos):
+            yield lote, origens, destinos
+            lote, novas_origens, novos_destinos = [], [origem], [destino]
+        lote.append((origem, destino))
+        origens, destinos = novas_origens, novos_destinos
+    if lote:
+        yield lote, origens, destinos
+
+
+def distancias_matriz(client, pares, profile='driving-hgv'):
+    """Distância (m) de cada par ((lon, lat), (lon, lat)) em poucas chamadas à matriz.
+
+    Retorna ``(distancias, chamadas)``; pares sem rota ficam como None.
+    """
+    distancias = {}
+    chamadas = 0
+    for lote, origens, destinos in _lotes_trechos(dict.fromkeys(pares)):
+        locais = list(dict.fromkeys(origens + destinos))
+        posicao = {local: i for i, local in enumerate(locais)}
+        resposta = client.distance_matrix(
+            locations=[list(local) for local in locais],
+            profile=profile,
+            sources=[posicao[o] for o in origens],
+            destinations=[posicao[d] for d in destinos],
+            metrics=['distance'],
+        )
+        chamadas += 1
+        linhas = resposta['distances']
+        for origem, destino in lote:
+            distancias[(origem, destino)] = linhas[origens.index(origem)][destinos.index(destino)]
+    return distancias, chamadas
+
+
+# --- ESTIMATIVA POR CARGA ---
+
+
+def estimar_cargas(client, grupos, historico=None):
+    """Estimativa de todas as cargas de ``grupos`` ((carga_id, dados)) com a matriz do ORS.
+
+    Retorna um dict carga_id -> ``ResultadoRota`` (com ``rota`` None) e o
+    número de chamadas à matriz.
+    """
+    cargas = []
+    pares = []
+    for carga_id, dados in grupos:
+        coords_ors, erro = extrair_paradas(dados)
+        cargas.append((carga_id, dados, coords_ors, erro))
+        if erro is None:
+            pares.extend(zip(map(tuple, coords_ors[:-1]), map(tuple, coords_ors[1:])))
+
+    try:
+        distancias, chamadas = distancias_matriz(client, pares) if pares else ({}, 0)
+        erro_matriz = None
+    except CotaDiariaEsgotada:
+        raise
+    except Exception as e:
+        distancias, chamadas, erro_matriz = {}, 0, f"Erro API (matriz): {e}"
+
+    resultados = {}
+    for carga_id, dados, coords_ors, erro in cargas:
+        if erro is None:
+            erro = erro_matriz
+        if erro is not None:
+            resultados[carga_id] = ResultadoRota.falha(erro)
+            continue
+
+        km_asfalto = km_chao = 0.0
+        origens_estimativa = set()
+        sem_rota = False
+        trechos = list(zip(map(tuple, coords_ors[:-1]), map(tuple, coords_ors[1:])))
+        proporcoes = historico.proporcoes_chao(trechos) if historico else [(0.0, "sem histórico")] * len(trechos)
+        for (origem, destino), (fracao, origem_estimativa) in zip(trechos, proporcoes):
+            metros = distancias.get((origem, destino))
+            if metros is None:
+                sem_rota = True
+                break
+            origens_estimativa.add(origem_estimativa)
+            km_chao += metros / 1000 * fracao
+            km_asfalto += metros / 1000 * (1 - fracao)
+        if sem_rota:
+            resultados[carga_id] = ResultadoRota.falha("Erro: a matriz do ORS não encontrou rota para um dos trechos.")
+            continue
+
+        avisos = {"ℹ️ ESTIMATIVA": "Distância pela matriz do ORS (sem desvio das zonas de restrição); "
+                                  f"proporção de chão por {', '.join(sorted(origens_estimativa))}."}
+        base = RotaBase(km_asfalto, km_chao, link_google_maps(coords_ors), avisos, None, coords_ors)
+        resultados[carga_id] = compor_resultado(base, somar_km_adicional(dados))
+    return resultados, chamadas
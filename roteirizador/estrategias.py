@@ -0,0 +1,112 @@
+"""Memória de estratégias da escada de fallback do erro 2004.
+
+Quando o ORS recusa o polígono de bloqueio (erro 2004), ``processar_rota``
+desce uma escada de tentativas: polígonos das zonas, desvio pelos waypoints
+das zonas (ex.: Ponte BR-262), só evitar balsas e, por fim, sem restrições. Esta memória guarda, por corredor,
+qual degrau funcionou, para que as próximas requisições comecem direto nele.
+
+Política de invalidação:
+- cada entrada expira após ``ttl_segundos`` (o degrau mais restritivo volta a
+  ser testado periodicamente);
+- se o degrau memorizado falhar, a entrada é apagada e a escada completa roda
+  (exceto em falha transitória, como ORS fora do ar ou prazo esgotado: aí a
+  carga termina com erro e a entrada fica);
+- ``limpar()`` zera tudo manualmente.
+"""
+import threading
+import time
+
+from roteirizador.armazenamento import caminho_dados, conectar
+
+ARQUIVO_ESTRATEGIAS = 'estrategias.sqlite3'
+TTL_PADRAO = 7 * 24 * 3600  # 7 dias
+PRECISAO_CORREDOR = 2  # casas decimais (~1 km)
+
+# Degraus da escada de fallback, do mais restritivo ao mais livre
+DEGRAU_POLIGONO = 0
+DEGRAU_PONTE = 1
+DEGRAU_BALSAS = 2
+DEGRAU_LIVRE = 3
+
+NOMES_DEGRAUS = {
+    DEGRAU_POLIGONO: "Polígonos de restrição",
+    DEGRAU_PONTE: "Desvio por waypoints",
+    DEGRAU_BALSAS: "Apenas evitar balsas",
+    DEGRAU_LIVRE: "Sem restrições",
+}
+
+
+def chave_corredor(coords_ors, precisao=PRECISAO_CORREDOR):
+    """Identifica o corredor pela sequência de paradas [lon, lat] arredondada (~1 km)."""
+    return "|".join(f"{round(lon, precisao)},{round(lat, precisao)}" for lon, lat in coords_ors)
+
+
+class MemoriaEstrategias:
+    """Guarda em SQLite o degrau da escada de fallback que funcionou para cada corredor."""
+
+    def __init__(self, caminho=None, ttl_segundos=TTL_PADRAO):
+        self.caminho = caminho or caminho_dados(ARQUIVO_ESTRATEGIAS)
+        self.ttl_segundos = ttl_segundos
+        self.atalhos = 0
+        self.invalidacoes = 0
+        self._lock = threading.Lock()
+        self._conn = conectar(self.caminho)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS estrategias (
+                   corredor TEXT PRIMARY KEY,
+                   degrau INTEGER NOT NULL,
+                   sucessos INTEGER NOT NULL DEFAULT 1,
+                   atualizado REAL NOT NULL
+               )"""
+        )
+
+    def consultar(self, corredor):
+        """Retorna o degrau memorizado para o corredor, ou None se não houver (ou expirou)."""
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT degrau, atualizado FROM estrategias WHERE corredor = ?", (corredor,)
+            ).fetchone()
+            if linha is None:
+                return None
+            degrau, atualizado = linha
+            if self.ttl_segundos is not None and time.time() - atualizado > self.ttl_segundos:
+                self._conn.execute("DELETE FROM estrategias WHERE corredor = ?", (corredor,))
+                return None
+            self.atalhos += 1
+            return degrau
+
+    def registrar(self, corredor, degrau):
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO estrategias (corredor, degrau, sucessos, atualizado) VALUES (?, ?, 1, ?)
+                   ON CONFLICT(corredor) DO UPDATE SET
+                       sucessos = CASE WHEN degrau = excluded.degrau THEN sucessos + 1 ELSE 1 END,
+                       degrau = excluded.degrau,
+                       atualizado = excluded.atualizado""",
+                (corredor, degrau, time.time())
+            )
+
+    def invalidar(self, corredor):
+        with self._lock:
+            self._conn.execute("DELETE FROM estrategias WHERE corredor = ?", (corredor,))
+            self.invalidacoes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM estrategias")
+
+    def listar(self):
+        """Entradas atuais para inspeção, da mais recente para a mais antiga."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT corredor, degrau, sucessos, atualizado FROM estrategias ORDER BY atualizado DESC"
+            ).fetchall()
+        return [
+            {
+                "Corredor": corredor,
+                "Degrau": NOMES_DEGRAUS.get(degrau, str(degrau)),
+                "Sucessos": sucessos,
+                "Atualizado": time.strftime("%Y-%m-%d %H:%M", time.localtime(atualizado)),
+            }
+            for corredor, degrau, sucessos, atualizado in linhas
+        ]
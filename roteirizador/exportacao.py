@@ -0,0 +1,228 @@
+"""Exportação das rotas em KML, GeoJSON e GPX, uma carga ou o lote inteiro num zip.
+
+Cada rota é dividida nos mesmos trechos de superfície do mapa (vizinhos de
+mesma superfície unidos) e cada trecho leva a cor do mapa: cinza para asfalto
+e marrom para chão. Os documentos são escritos aos pedaços direto no arquivo
+de destino (``ArquivoRotas`` grava cada carga no zip assim que ela chega),
+então nem o lote nem um documento inteiro precisam ficar em memória.
+
+``casas`` reduz a precisão das coordenadas (5 casas ~ 1 m) e descarta os
+vértices consecutivos que ficam iguais depois do arredondamento.
+"""
+import io
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from roteirizador.constantes import COR_ASFALTO, COR_CHAO, UNPAVED_TYPES
+from roteirizador.geometria import trechos_simplificados
+
+FORMATO_KML = 'kml'
+FORMATO_GEOJSON = 'geojson'
+FORMATO_GPX = 'gpx'
+FORMATOS = (FORMATO_KML, FORMATO_GEOJSON, FORMATO_GPX)
+
+MIME_FORMATOS = {
+    FORMATO_KML: 'application/vnd.google-earth.kml+xml',
+    FORMATO_GEOJSON: 'application/geo+json',
+    FORMATO_GPX: 'application/gpx+xml',
+}
+
+VERTICES_POR_ESCRITA = 1000
+
+
+def _cor_kml(cor_hex, alfa='ff'):
+    # KML usa aabbggrr
+    r, g, b = cor_hex[1:3], cor_hex[3:5], cor_hex[5:7]
+    return f"{alfa}{b}{g}{r}".lower()
+
+
+def _tipo(superficie):
+    return "Chão" if superficie in UNPAVED_TYPES else "Asfalto"
+
+
+def _nome_arquivo(carga_id):
+    return re.sub(r'[^\w.-]+', '_', str(carga_id)).strip('_') or 'carga'
+
+
+def _arredondar(coords, casas):
+    """Coordenadas (lon, lat) arredondadas, sem vértices consecutivos repetidos."""
+    if casas is None:
+        return [(c[0], c[1]) for c in coords]
+    saida = []
+    for c in coords:
+        ponto = (round(c[0], casas), round(c[1], casas))
+        if not saida or saida[-1] != ponto:
+            saida.append(ponto)
+    return saida
+
+
+def trechos_rota(rota, casas=None):
+    """(superfície, coords) de cada trecho de superfície de uma ``RotaCompacta``, prontos para exportar."""
+    trechos = []
+    for superficie, coords in trechos_simplificados(rota.coordenadas, rota.valores(), {}, 0):
+        coords = _arredondar(coords, casas)
+        if len(coords) >= 2:
+            trechos.append((superficie, coords))
+    return trechos
+
+
+def _blocos(coords, formato):
+    for i in range(0, len(coords), VERTICES_POR_ESCRITA):
+        yield formato(coords[i:i + VERTICES_POR_ESCRITA])
+
+
+# --- ESCRITORES POR FORMATO ---
+
+
+def escrever_kml(saida, nome, trechos, paradas):
+    nome = escape(str(nome))
+    saida.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+                f'  <Document>\n    <name>{nome}</name>\n')
+    for estilo, cor in (("asfalto", COR_ASFALTO), ("chao", COR_CHAO)):
+        saida.write(f'    <Style id="{estilo}"><LineStyle><color>{_cor_kml(cor)}</color>'
+                    '<width>4</width></LineStyle></Style>\n')
+    saida.write('    <Folder>\n      <name>Trajeto</name>\n')
+    for superficie, coords in trechos:
+        tipo = _tipo(superficie)
+        saida.write(f'      <Placemark>\n        <name>{escape(superficie)}</name>\n'
+                    f'        <description>{tipo}</description>\n'
+                    f'        <styleUrl>#{"chao" if tipo == "Chão" else "asfalto"}</styleUrl>\n'
+                    '        <LineString><tessellate>1</tessellate><coordinates>')
+        for bloco in _blocos(coords, lambda cs: " ".join(f"{lon},{lat},0" for lon, lat in cs) + " "):
+            saida.write(bloco)
+        saida.write('</coordinates></LineString>\n      </Placemark>\n')
+    saida.write('    </Folder>\n')
+    for i, (lon, lat) in enumerate(paradas or []):
+        saida.write(f'    <Placemark><name>Ponto {i + 1}</name>'
+                    f'<Point><coordinates>{lon},{lat},0</coordinates></Point></Placemark>\n')
+    saida.write('  </Document>\n</kml>\n')
+
+
+def escrever_geojson(saida, nome, trechos, paradas):
+    saida.write('{"type":"FeatureCollection","name":' + json.dumps(str(nome), ensure_ascii=False)
+                + ',"features":[')
+    primeira = True
+    for superficie, coords in trechos:
+        tipo = _tipo(superficie)
+        # Propriedades no padrão simplestyle (stroke), entendido pelo geojson.io e pelo GitHub
+        propriedades = {"superficie": superficie, "tipo": tipo,
+                        "stroke": COR_CHAO if tipo == "Chão" else COR_ASFALTO, "stroke-width": 4}
+        saida.write(('' if primeira else ',') + '{"type":"Feature","properties":'
+                    + json.dumps(propriedades, ensure_ascii=False)
+                    + ',"geometry":{"type":"LineString","coordinates":[')
+        primeira = False
+        separador = ''
+        for bloco in _blocos(coords, lambda cs: ",".join(f"[{lon},{lat}]" for lon, lat in cs)):
+            saida.write(separador + bloco)
+            separador = ','
+        saida.write(']}}')
+    for i, (lon, lat) in enumerate(paradas or []):
+        saida.write(('' if primeira else ',') + '{"type":"Feature","properties":{"nome":"Ponto %d"},'
+                    '"geometry":{"type":"Point","coordinates":[%r,%r]}}' % (i + 1, lon, lat))
+        primeira = False
+    saida.write(']}\n')
+
+
+def escrever_gpx(saida, nome, trechos, paradas):
+    nome = escape(str(nome))
+    saida.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" creator="roteirizador" xmlns="http://www.topografix.com/GPX/1/1" '
+                'xmlns:gpx_style="http://www.topografix.com/GPX/gpx_style/0/2">\n'
+                f'  <metadata><name>{nome}</name></metadata>\n')
+    # No GPX 1.1 os waypoints vêm antes das trilhas
+    for i, (lon, lat) in enumerate(paradas or []):
+        saida.write(f'  <wpt lat="{lat}" lon="{lon}"><name>Ponto {i + 1}</name></wpt>\n')
+    # GPX não tem estilo por segmento: cada trecho de superfície vira uma trilha com a cor na extensão gpx_style
+    for superficie, coords in trechos:
+        tipo = _tipo(superficie)
+        cor = (COR_CHAO if tipo == "Chão" else COR_ASFALTO).lstrip('#')
+        saida.write(f'  <trk><name>{nome} - {escape(superficie)}</name><type>{tipo}</type>'
+                    f'<extensions><gpx_style:line><gpx_style:color>{cor}</gpx_style:color></gpx_style:line></extensions>'
+                    '<trkseg>\n')
+        for bloco in _blocos(coords, lambda cs: "".join(f'<trkpt lat="{lat}" lon="{lon}"/>' for lon, lat in cs)):
+            saida.write(bloco)
+        saida.write('\n  </trkseg></trk>\n')
+    saida.write('</gpx>\n')
+
+
+ESCRITORES = {
+    FORMATO_KML: escrever_kml,
+    FORMATO_GEOJSON: escrever_geojson,
+    FORMATO_GPX: escrever_gpx,
+}
+
+
+def documento_rota(rota, coords_ors, nome, formato=FORMATO_KML, casas=None):
+    """Documento de uma carga como texto (download individual)."""
+    saida = io.StringIO()
+    ESCRITORES[formato](saida, nome, trechos_rota(rota, casas), coords_ors)
+    return saida.getvalue()
+
+
+# --- ARQUIVO COM O LOTE INTEIRO ---
+
+
+class ArquivoRotas:
+    """Zip com uma pasta por formato e um arquivo por carga, gravado carga a carga.
+
+    ``destino`` é um caminho ou um arquivo binário aberto. Cargas sem
+    geometria (erro ou modo estimativa) são contadas e ignoradas.
+    """
+
+    def __init__(self, destino, formatos=FORMATOS, casas=None):
+        self.formatos = tuple(formatos)
+        self.casas = casas
+        self.exportadas = 0
+        self.ignoradas = 0
+        self._nomes = set()
+        self._zip = zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _nome_unico(self, carga_id):
+        # Ids diferentes podem virar o mesmo nome ('A/1' e 'A 1'); comparado sem caixa por causa do Windows
+        base = _nome_arquivo(carga_id)
+        nome, sufixo = base, 1
+        while nome.lower() in self._nomes:
+            sufixo += 1
+            nome = f"{base}_{sufixo}"
+        self._nomes.add(nome.lower())
+        return nome
+
+    def adicionar(self, carga_id, resultado):
+        if resultado.rota is None:
+            self.ignoradas += 1
+            return False
+        trechos = trechos_rota(resultado.rota, self.casas)
+        nome = f"Rota {carga_id}"
+        arquivo = self._nome_unico(carga_id)
+        for formato in self.formatos:
+            caminho = f"{formato}/rota_{arquivo}.{formato}"
+            with self._zip.open(caminho, 'w') as bruto:
+                texto = io.TextIOWrapper(bruto, encoding='utf-8', newline='')
+                ESCRITORES[formato](texto, nome, trechos, resultado.paradas)
+                texto.flush()
+                texto.detach()
+        self.exportadas += 1
+        return True
+
+    def fechar(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def exportar_zip(destino, resultados, formatos=FORMATOS, casas=None):
+    """Grava em ``destino`` as rotas de ``resultados`` (dict carga_id -> ``ResultadoRota``).
+
+    Retorna (exportadas, ignoradas).
+    """
+    with ArquivoRotas(destino, formatos, casas) as arquivo:
+        for carga_id, resultado in resultados.items():
+            arquivo.adicionar(carga_id, resultado)
+    return arquivo.exportadas, arquivo.ignoradas
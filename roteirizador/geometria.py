@@ -0,0 +1,111 @@
+"""Simplificação de polilinhas para exibição em mapa.
+
+A geometria do ORS tem um vértice a cada poucos metros; para desenhar a rota
+inteira na tela basta uma fração deles. ``douglas_peucker`` escolhe os
+vértices a manter, e ``trechos_simplificados`` aplica a simplificação trecho
+a trecho de superfície: trechos consecutivos de mesma superfície viram um só
+e as fronteiras entre superfícies nunca são removidas.
+
+A tolerância vem do zoom em que a rota cabe no mapa (``tolerancia_para_zoom``),
+de forma que o erro fique abaixo de um pixel.
+"""
+import math
+
+import numpy as np
+
+from roteirizador.superficies import nome_superficie
+
+METROS_POR_PIXEL_ZOOM_0 = 156543.03392  # na linha do Equador, tiles de 256 px
+TAMANHO_TILE = 256
+ZOOM_MAXIMO = 18
+
+
+def douglas_peucker(coords, tolerancia):
+    """Máscara booleana dos vértices mantidos pelo algoritmo de Douglas–Peucker.
+
+    ``tolerancia`` está na mesma unidade das coordenadas (graus). As duas
+    pontas são sempre mantidas. Versão iterativa, com a distância de todos os
+    vértices de cada trecho calculada de uma vez.
+    """
+    arr = np.asarray(coords, dtype=np.float64)
+    n = len(arr)
+    manter = np.zeros(n, dtype=bool)
+    if n == 0:
+        return manter
+    arr = arr[:, :2]
+    manter[0] = manter[-1] = True
+    if n < 3 or tolerancia <= 0:
+        manter[:] = True
+        return manter
+
+    pilha = [(0, n - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        a, b = arr[inicio], arr[fim]
+        meio = arr[inicio + 1:fim]
+        ab = b - a
+        comprimento = np.hypot(ab[0], ab[1])
+        if comprimento == 0:
+            dist = np.hypot(meio[:, 0] - a[0], meio[:, 1] - a[1])
+        else:
+            dist = np.abs(ab[0] * (meio[:, 1] - a[1]) - ab[1] * (meio[:, 0] - a[0])) / comprimento
+        i = int(np.argmax(dist))
+        if dist[i] > tolerancia:
+            indice = inicio + 1 + i
+            manter[indice] = True
+            pilha.append((inicio, indice))
+            pilha.append((indice, fim))
+    return manter
+
+
+def cantos_bbox(bbox):
+    """(min_lon, min_lat, max_lon, max_lat) de um ``bbox`` do ORS, com ou sem elevação."""
+    if len(bbox) == 6:  # rota com elevação: [min_lon, min_lat, min_z, max_lon, max_lat, max_z]
+        return bbox[0], bbox[1], bbox[3], bbox[4]
+    return tuple(bbox)
+
+
+def zoom_para_bbox(bbox, largura_px=1000, altura_px=500):
+    """Maior zoom (estilo Leaflet) em que o bbox cabe numa tela de ``largura_px`` x ``altura_px``."""
+    min_lon, min_lat, max_lon, max_lat = cantos_bbox(bbox)
+    largura_graus = max(max_lon - min_lon, 1e-9)
+    y_min = math.log(math.tan(math.pi / 4 + math.radians(min_lat) / 2))
+    y_max = math.log(math.tan(math.pi / 4 + math.radians(max_lat) / 2))
+    altura_rad = max(y_max - y_min, 1e-9)
+
+    zoom_x = math.log2(largura_px * 360 / (TAMANHO_TILE * largura_graus))
+    zoom_y = math.log2(altura_px * 2 * math.pi / (TAMANHO_TILE * altura_rad))
+    return max(0, min(ZOOM_MAXIMO, int(math.floor(min(zoom_x, zoom_y)))))
+
+
+def tolerancia_para_zoom(zoom, latitude, pixels=1.0):
+    """Tolerância em graus equivalente a ``pixels`` de tela no zoom e latitude dados."""
+    metros_por_pixel = METROS_POR_PIXEL_ZOOM_0 * math.cos(math.radians(latitude)) / 2 ** zoom
+    return pixels * metros_por_pixel / 111320.0
+
+
+def trechos_simplificados(geometry, valores, lookup_surface, tolerancia):
+    """Lista de ``(superficie, coords)`` com trechos vizinhos de mesma superfície unidos.
+
+    ``valores`` está no formato de ``extras['surface']['values']``. Cada trecho
+    é simplificado separadamente, então seus vértices de início e fim (as
+    fronteiras entre superfícies) são preservados.
+    """
+    unidos = []
+    for start, end, surf in valores:
+        nome = nome_superficie(surf, lookup_surface)
+        if unidos and unidos[-1][0] == nome and unidos[-1][2] == start:
+            unidos[-1][2] = end
+        else:
+            unidos.append([nome, start, end])
+
+    trechos = []
+    for nome, start, end in unidos:
+        coords = geometry[start:end + 1]
+        if len(coords) < 2:
+            continue
+        manter = douglas_peucker(coords, tolerancia)
+        trechos.append((nome, np.asarray(coords, dtype=np.float64)[manter, :2].tolist()))
+    return trechos
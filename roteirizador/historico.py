@@ -0,0 +1,199 @@
+"""Histórico persistente do resumo de cada lote, com totais mensais pré-agregados.
+
+Cada lote calculado grava as linhas do resumo gerencial (``linha_resumo``)
+num SQLite, com índices por data e por Carga. A tabela ``mensal`` guarda os
+totais de cada mês (cargas, km, custo), atualizados pela diferença a cada
+gravação. Abrir um ano de histórico no dashboard lê doze linhas, e
+não as milhares de cargas, nem exige rotear de novo ou reler os CSVs.
+
+Cargas do modo estimativa entram com ``estimativa = 1``; quando a rota
+completa é calculada depois, a linha da carga no lote é substituída.
+"""
+import threading
+import time
+
+from roteirizador.armazenamento import caminho_dados, conectar
+from roteirizador.rotas import linha_resumo
+
+ARQUIVO_HISTORICO = 'historico.sqlite3'
+MESES_PADRAO = 12  # período inicial do histórico no dashboard
+
+
+def _data_lote(criado):
+    return time.strftime('%Y-%m-%d', time.localtime(criado))
+
+
+class HistoricoLotes:
+    """Linhas do resumo por lote e carga em SQLite, com rollup mensal mantido na gravação."""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or caminho_dados(ARQUIVO_HISTORICO)
+        self._lock = threading.Lock()
+        self._conn = conectar(self.caminho)
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS lotes (
+                   lote TEXT PRIMARY KEY,
+                   descricao TEXT,
+                   data TEXT NOT NULL,
+                   criado REAL NOT NULL
+               );
+               CREATE TABLE IF NOT EXISTS resumo (
+                   lote TEXT NOT NULL,
+                   carga TEXT NOT NULL,
+                   data TEXT NOT NULL,
+                   mes TEXT NOT NULL,
+                   distancia_total_km REAL NOT NULL,
+                   asfalto_km REAL NOT NULL,
+                   chao_km REAL NOT NULL,
+                   custo REAL NOT NULL,
+                   estimativa INTEGER NOT NULL,
+                   PRIMARY KEY (lote, carga)
+               );
+               CREATE INDEX IF NOT EXISTS idx_resumo_data ON resumo (data);
+               CREATE INDEX IF NOT EXISTS idx_resumo_mes ON resumo (mes);
+               CREATE INDEX IF NOT EXISTS idx_resumo_carga ON resumo (carga, data);
+               CREATE TABLE IF NOT EXISTS mensal (
+                   mes TEXT PRIMARY KEY,
+                   lotes INTEGER NOT NULL,
+                   cargas INTEGER NOT NULL,
+                   distancia_total_km REAL NOT NULL,
+                   asfalto_km REAL NOT NULL,
+                   chao_km REAL NOT NULL,
+                   custo REAL NOT NULL,
+                   estimadas INTEGER NOT NULL
+               );"""
+        )
+
+    def registrar_lote(self, lote, resultados, descricao=None, criado=None):
+        """Grava (ou substitui) as cargas com sucesso de ``resultados`` no lote; retorna quantas foram gravadas.
+
+        O rollup do mês do lote recebe só a diferença: carga nova soma, carga
+        substituída (ex.: estimativa trocada pela rota completa) soma o novo e
+        desconta o antigo. Assim o CLI pode gravar carga a carga.
+        """
+        linhas = []
+        for carga_id, resultado in resultados.items():
+            resumo = linha_resumo(carga_id, resultado)
+            if resumo is not None:
+                linhas.append((str(resumo["Carga"]), resumo["Distância Total (km)"], resumo["Asfalto (km)"],
+                               resumo["Chão (km)"], resumo["Custo Estimado (pts)"], int(resultado.rota is None)))
+        if not linhas:
+            return 0
+
+        criado = criado or time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                existente = self._conn.execute("SELECT data FROM lotes WHERE lote = ?", (lote,)).fetchone()
+                if existente is None:
+                    data = _data_lote(criado)
+                    self._conn.execute(
+                        "INSERT INTO lotes (lote, descricao, data, criado) VALUES (?, ?, ?, ?)",
+                        (lote, descricao, data, criado)
+                    )
+                else:
+                    data = existente[0]
+                    if descricao is not None:
+                        self._conn.execute("UPDATE lotes SET descricao = ? WHERE lote = ?", (descricao, lote))
+
+                # Deltas do mês: lotes, cargas, distância, asfalto, chão, custo, estimadas
+                delta = [int(existente is None), 0, 0.0, 0.0, 0.0, 0.0, 0]
+                for carga, *valores in linhas:
+                    antigo = self._conn.execute(
+                        "SELECT distancia_total_km, asfalto_km, chao_km, custo, estimativa FROM resumo "
+                        "WHERE lote = ? AND carga = ?", (lote, carga)
+                    ).fetchone()
+                    if antigo is None:
+                        delta[1] += 1
+                        antigo = (0.0, 0.0, 0.0, 0.0, 0)
+                    for i, (novo, velho) in enumerate(zip(valores, antigo)):
+                        delta[2 + i] += novo - velho
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO resumo (lote, carga, data, mes, distancia_total_km, asfalto_km, "
+                        "chao_km, custo, estimativa) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (lote, carga, data, data[:7], *valores)
+                    )
+                self._conn.execute(
+                    """INSERT INTO mensal (mes, lotes, cargas, distancia_total_km, asfalto_km, chao_km, custo, estimadas)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(mes) DO UPDATE SET
+                           lotes = lotes + excluded.lotes,
+                           cargas = cargas + excluded.cargas,
+                           distancia_total_km = distancia_total_km + excluded.distancia_total_km,
+                           asfalto_km = asfalto_km + excluded.asfalto_km,
+                           chao_km = chao_km + excluded.chao_km,
+                           custo = custo + excluded.custo,
+                           estimadas = estimadas + excluded.estimadas""",
+                    (data[:7], *delta)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(linhas)
+
+    def reconstruir_mensal(self):
+        """Refaz o rollup inteiro a partir das linhas (após edição manual do banco, por exemplo)."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM mensal")
+            self._conn.execute(
+                """INSERT INTO mensal (mes, lotes, cargas, distancia_total_km, asfalto_km, chao_km, custo, estimadas)
+                   SELECT mes, COUNT(DISTINCT lote), COUNT(*), SUM(distancia_total_km), SUM(asfalto_km),
+                          SUM(chao_km), SUM(custo), SUM(estimativa)
+                   FROM resumo GROUP BY mes"""
+            )
+            self._conn.execute("COMMIT")
+
+    # --- Consultas do dashboard ---
+
+    def totais_mensais(self, inicio=None, fim=None):
+        """Totais por mês ('AAAA-MM') entre ``inicio`` e ``fim`` (inclusive), do rollup."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT mes, lotes, cargas, distancia_total_km, asfalto_km, chao_km, custo, estimadas FROM mensal "
+                "WHERE mes >= ? AND mes <= ? ORDER BY mes",
+                (inicio or '0000-00', fim or '9999-99')
+            ).fetchall()
+        return [
+            {
+                "Mês": mes,
+                "Lotes": lotes,
+                "Cargas": cargas,
+                "Distância Total (km)": round(distancia, 2),
+                "Asfalto (km)": round(asfalto, 2),
+                "Chão (km)": round(chao, 2),
+                "% Chão": round(chao / (asfalto + chao) * 100, 1) if asfalto + chao > 0 else 0.0,
+                "Custo Estimado (pts)": round(custo, 2),
+                "Estimadas": estimadas,
+            }
+            for mes, lotes, cargas, distancia, asfalto, chao, custo, estimadas in linhas
+        ]
+
+    def historico_carga(self, carga, limite=100):
+        """Últimas ocorrências de uma Carga em todos os lotes (pelo índice por carga)."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT r.data, r.lote, l.descricao, r.distancia_total_km, r.asfalto_km, r.chao_km, r.custo, "
+                "r.estimativa FROM resumo r JOIN lotes l ON l.lote = r.lote "
+                "WHERE r.carga = ? ORDER BY r.data DESC LIMIT ?",
+                (str(carga), limite)
+            ).fetchall()
+        return [
+            {"Data": data, "Lote": lote, "Descrição": descricao or "", "Distância Total (km)": distancia,
+             "Asfalto (km)": asfalto, "Chão (km)": chao, "Custo Estimado (pts)": custo, "Estimativa": bool(estimada)}
+            for data, lote, descricao, distancia, asfalto, chao, custo, estimada in linhas
+        ]
+
+    def estatisticas(self):
+        with self._lock:
+            lotes = self._conn.execute("SELECT COUNT(*) FROM lotes").fetchone()[0]
+            cargas = self._conn.execute("SELECT COUNT(*) FROM resumo").fetchone()[0]
+            meses = self._conn.execute("SELECT COUNT(*), MIN(mes), MAX(mes) FROM mensal").fetchone()
+        return {"lotes": lotes, "cargas": cargas, "meses": meses[0], "primeiro_mes": meses[1], "ultimo_mes": meses[2]}
+
+    def limpar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM mensal")
+            self._conn.execute("DELETE FROM resumo")
+            self._conn.execute("DELETE FROM lotes")
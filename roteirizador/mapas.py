@@ -0,0 +1,110 @@
+"""Mapa folium de uma carga roteada, com a polilinha simplificada para o zoom.
+
+Cada trecho de superfície vira uma única ``PolyLine`` (trechos vizinhos de
+mesma superfície são unidos) com os vértices reduzidos por Douglas–Peucker
+até a precisão visível alguns níveis de zoom além do enquadramento inicial.
+``html_mapa`` devolve o HTML pronto, que a interface guarda por carga.
+"""
+import folium
+from folium import plugins
+
+from roteirizador.constantes import COR_ASFALTO, COR_CHAO, UNPAVED_TYPES
+from roteirizador.geometria import cantos_bbox, tolerancia_para_zoom, trechos_simplificados, zoom_para_bbox
+from roteirizador.metricas import METRICAS
+from roteirizador.zonas import registro_padrao
+
+# Níveis de zoom além do enquadramento inicial que ainda são desenhados sem perda visível
+NIVEIS_ZOOM_DETALHE = 2
+
+LEGENDA_HTML = f'''
+     <div style="position: fixed; bottom: 50px; right: 50px; width: 130px; height: 90px; z-index:9999; font-size:14px; background-color: white; border:2px solid grey; border-radius:6px; padding: 10px; opacity: 0.9;">
+     <b>Legenda</b><br>
+     <i style="background: {COR_ASFALTO}; width: 18px; height: 18px; float: left; margin-right: 8px; opacity: 0.8;"></i> Asfalto<br>
+     <i style="background: {COR_CHAO}; width: 18px; height: 18px; float: left; margin-right: 8px; opacity: 0.8;"></i> Chão
+     </div>
+     '''
+
+
+def _adicionar_camadas(m):
+    # Adiciona camadas extras (Satélite e Mapa Claro)
+    folium.TileLayer('cartodbpositron', name='Mapa Claro').add_to(m)
+    folium.TileLayer(
+        tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+        attr='Esri',
+        name='Satélite',
+        overlay=False,
+        control=True
+    ).add_to(m)
+
+    folium.TileLayer(
+        tiles='https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
+        attr='Google',
+        name='Google Satélite',
+        overlay=False,
+        control=True
+    ).add_to(m)
+
+    folium.TileLayer(
+        tiles='https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}',
+        attr='Google',
+        name='Google Híbrido',
+        overlay=False,
+        control=True
+    ).add_to(m)
+
+
+def gerar_mapa_folium(rota, coords_ors, largura_px=1000, altura_px=500, zonas=None):
+    """Mapa folium de uma ``RotaCompacta`` com as paradas ``coords_ors``."""
+    start_lat = coords_ors[0][1]
+    start_lon = coords_ors[0][0]
+    m = folium.Map(location=[start_lat, start_lon], zoom_start=12, tiles='OpenStreetMap')
+    _adicionar_camadas(m)
+
+    bbox = rota.bbox
+    min_lon, min_lat, max_lon, max_lat = cantos_bbox(bbox)
+    zoom = zoom_para_bbox(bbox, largura_px, altura_px) + NIVEIS_ZOOM_DETALHE
+    tolerancia = tolerancia_para_zoom(zoom, (min_lat + max_lat) / 2)
+
+    for surf_type, coords in trechos_simplificados(rota.coordenadas, rota.valores(), {}, tolerancia):
+        eh_chao = surf_type in UNPAVED_TYPES
+        color = COR_CHAO if eh_chao else COR_ASFALTO
+        tipo_pt = "Chão" if eh_chao else "Asfalto"
+        tooltip_text = f"Superfície: {surf_type} | Status: {tipo_pt}"
+
+        folium.PolyLine([[lat, lon] for lon, lat in coords], color=color, weight=5, opacity=0.8, tooltip=tooltip_text).add_to(m)
+
+    for i, coord in enumerate(coords_ors):
+        folium.Marker(
+            location=[coord[1], coord[0]],
+            tooltip=f"Ponto {i+1}",
+            icon=folium.Icon(color="green" if i == 0 else "red" if i == len(coords_ors)-1 else "blue", icon="info-sign")
+        ).add_to(m)
+
+    # Adiciona as zonas de restrição da área do mapa apenas para visualização
+    registro = zonas if zonas is not None else registro_padrao()
+    for zona in registro.zonas_na_area((min_lon, min_lat, max_lon, max_lat)):
+        for anel in zona.aneis:
+            folium.Polygon([[lat, lon] for lon, lat in anel.tolist()], color='red', fill=True, fillOpacity=0.2,
+                           tooltip=f"Zona de Restrição: {zona.nome}").add_to(m)
+
+    m.fit_bounds([[min_lat, min_lon], [max_lat, max_lon]])
+
+    # Plugins de utilidade para logística
+    plugins.Fullscreen(
+        position='topleft',
+        title='Tela Cheia',
+        title_cancel='Sair',
+        force_separate_button=True
+    ).add_to(m)
+    plugins.MousePosition(position='topright').add_to(m)
+    plugins.MeasureControl(position='bottomleft', primary_length_unit='kilometers').add_to(m)
+    folium.LayerControl().add_to(m)
+
+    m.get_root().html.add_child(folium.Element(LEGENDA_HTML))
+    return m
+
+
+def html_mapa(rota, coords_ors, largura_px=1000, altura_px=500, zonas=None):
+    """HTML completo (página autônoma) do mapa de uma carga."""
+    with METRICAS.cronometrar("mapa"):
+        return gerar_mapa_folium(rota, coords_ors, largura_px, altura_px, zonas).get_root().render()
@@ -0,0 +1,77 @@
+"""Memória em processo dos resultados de roteamento por carga.
+
+Cada rerun do Streamlit chama ``processar_rota`` de novo para todas as
+cargas. O trecho caro (rota, divisão Asfalto/Chão e link) depende só
+das paradas e das opções de roteamento, e não do KM Adicional; ele é guardado
+aqui como uma ``RotaBase``, numa LRU limitada por número de cargas, que o app
+compartilha entre todas as sessões.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+
+PRECISAO_MEMO = 6  # casas decimais (~0,1 m)
+MAX_ITENS_PADRAO = 256
+
+RotaBase = namedtuple('RotaBase', [
+    'km_asfalto', 'km_chao', 'link', 'avisos', 'rota', 'coords_ors',
+])
+
+
+def chave_carga(coords_ors, opcoes, precisao=PRECISAO_MEMO):
+    """Hash das paradas [lon, lat] normalizadas e das opções de roteamento."""
+    paradas = [[round(float(lon), precisao), round(float(lat), precisao)] for lon, lat in coords_ors]
+    texto = json.dumps([paradas, opcoes], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class MemoRotas:
+    """LRU de ``RotaBase`` por chave de carga, segura entre threads.
+
+    Os objetos guardados são compartilhados entre quem os consulta e não
+    devem ser alterados.
+    """
+
+    def __init__(self, max_itens=MAX_ITENS_PADRAO):
+        self.max_itens = max_itens
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            base = self._itens.get(chave)
+            if base is None:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return base
+
+    def guardar(self, chave, base):
+        with self._lock:
+            self._itens[chave] = base
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.despejos += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            itens = len(self._itens)
+        consultas = self.acertos + self.falhas
+        return {
+            "Acertos": self.acertos,
+            "Falhas": self.falhas,
+            "Taxa de Acerto (%)": round(100 * self.acertos / consultas, 1) if consultas else 0.0,
+            "Cargas em Memória": itens,
+            "Limite": self.max_itens,
+            "Despejos (LRU)": self.despejos,
+        }
@@ -0,0 +1,282 @@
+"""Instrumentação dos pontos quentes do roteamento: contadores, histogramas e tempo por carga.
+
+Tudo passa pelo registro global ``METRICAS``, desligado por padrão (ou ligado
+com ``ROTEIRIZADOR_METRICAS=1``). Desligado, cada ponto instrumentado custa
+uma checagem de atributo: ``cronometrar`` devolve um context manager vazio
+compartilhado e ``inicio()`` devolve None.
+
+Métricas coletadas:
+
+- ``roteirizador_etapa_segundos{etapa}``: tempo de parede por etapa
+  (processar_rota, otimizacao, directions, classificacao, mapa, kml,
+  exportacao, render);
+- ``roteirizador_chamadas_ors_total{degrau,resultado}`` e
+  ``roteirizador_chamadas_por_carga``: tentativas na escada de fallback;
+- ``roteirizador_retentativas_total``: tentativas além da primeira;
+- ``roteirizador_retentativas_ors_total{tipo}``: repetições por erro
+  transitório (429, 5xx, timeout) no ``ClienteResiliente``;
+- ``roteirizador_degrau_usado_total{degrau}``: degrau que resolveu a carga;
+- ``roteirizador_vertices`` / ``roteirizador_vertices_total``: pontos da
+  geometria processados;
+- ``roteirizador_cargas_total{resultado}``.
+
+Além dos agregados, as últimas ``MAX_CARGAS_RECENTES`` cargas ficam com o
+detalhamento de tempo por etapa (``cargas_recentes``).
+
+Exporta em JSON (``exportar_json``) e no formato texto do Prometheus
+(``exportar_prometheus``).
+"""
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+BALDES_TEMPO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BALDES_CHAMADAS = (1, 2, 3, 4, 5, 8)
+BALDES_VERTICES = (100, 500, 1000, 5000, 10000, 50000, 100000, 500000)
+MAX_CARGAS_RECENTES = 500
+
+DESCRICOES = {
+    "roteirizador_etapa_segundos": "Tempo de parede por etapa do roteamento",
+    "roteirizador_chamadas_ors_total": "Chamadas a directions por degrau da escada e resultado",
+    "roteirizador_chamadas_por_carga": "Chamadas a directions necessárias por carga",
+    "roteirizador_retentativas_total": "Chamadas a directions além da primeira de cada carga",
+    "roteirizador_retentativas_ors_total": "Repetições de chamadas ao ORS por erro transitório",
+    "roteirizador_degrau_usado_total": "Degrau da escada de fallback que resolveu a carga",
+    "roteirizador_vertices": "Vértices da geometria processados por carga",
+    "roteirizador_vertices_total": "Vértices da geometria processados",
+    "roteirizador_cargas_total": "Cargas processadas por resultado",
+}
+
+
+class _Nulo:
+    """Context manager vazio usado quando as métricas estão desligadas."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULO = _Nulo()
+
+
+class _Cronometro:
+    def __init__(self, metricas, etapa):
+        self._metricas = metricas
+        self._etapa = etapa
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metricas.fim_etapa(self._etapa, self._inicio)
+        return False
+
+
+class _Histograma:
+    __slots__ = ('baldes', 'contagens', 'soma', 'total')
+
+    def __init__(self, baldes):
+        self.baldes = tuple(baldes)
+        self.contagens = [0] * (len(self.baldes) + 1)  # o último é o +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect.bisect_left(self.baldes, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def quantil(self, q):
+        """Estimativa por interpolação linear dentro do balde (como o histogram_quantile)."""
+        if self.total == 0:
+            return None
+        alvo = q * self.total
+        acumulado = 0
+        for i, contagem in enumerate(self.contagens):
+            if acumulado + contagem >= alvo and contagem > 0:
+                if i == len(self.baldes):
+                    return self.baldes[-1] if self.baldes else None
+                inferior = self.baldes[i - 1] if i > 0 else 0.0
+                return inferior + (self.baldes[i] - inferior) * (alvo - acumulado) / contagem
+            acumulado += contagem
+        return self.baldes[-1] if self.baldes else None
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted(rotulos.items()))
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _texto_rotulos(rotulos, extra=None):
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in pares) + '}'
+
+
+class Metricas:
+    """Registro de contadores e histogramas com rótulos, seguro entre threads."""
+
+    def __init__(self, habilitado=False):
+        self.habilitado = habilitado
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._contadores = {}
+        self._histogramas = {}
+        self.cargas_recentes = deque(maxlen=MAX_CARGAS_RECENTES)
+
+    # --- Coleta ---
+
+    def contar(self, nome, valor=1, **rotulos):
+        if not self.habilitado:
+            return
+        chave = _chave(nome, rotulos)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, baldes=BALDES_TEMPO, **rotulos):
+        if not self.habilitado:
+            return
+        chave = _chave(nome, rotulos)
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = _Histograma(baldes)
+            histograma.observar(valor)
+
+    def inicio(self):
+        """Marca de tempo para ``fim_etapa`` (None se desligado)."""
+        return time.perf_counter() if self.habilitado else None
+
+    def fim_etapa(self, etapa, inicio):
+        if inicio is None or not self.habilitado:
+            return
+        decorrido = time.perf_counter() - inicio
+        self.observar("roteirizador_etapa_segundos", decorrido, etapa=etapa)
+        carga = getattr(self._local, 'carga', None)
+        if carga is not None:
+            carga[etapa] = carga.get(etapa, 0.0) + decorrido
+
+    def cronometrar(self, etapa):
+        """``with METRICAS.cronometrar('mapa'): ...`` registra o tempo da etapa."""
+        if not self.habilitado:
+            return _NULO
+        return _Cronometro(self, etapa)
+
+    def anotar_carga(self, **valores):
+        """Acrescenta campos ao detalhamento da carga em andamento nesta thread."""
+        carga = getattr(self._local, 'carga', None)
+        if carga is not None:
+            carga.update(valores)
+
+    def iniciar_carga(self, carga_id=None):
+        """Abre o detalhamento por etapa da carga que esta thread vai processar."""
+        if not self.habilitado:
+            return None
+        self._local.carga = {"Carga": None if carga_id is None else str(carga_id)}
+        return time.perf_counter()
+
+    def encerrar_carga(self, inicio, resultado):
+        if inicio is None:
+            return
+        carga = getattr(self._local, 'carga', None)
+        self._local.carga = None
+        self.fim_etapa("processar_rota", inicio)
+        self.contar("roteirizador_cargas_total", resultado=resultado)
+        if carga is not None:
+            carga["processar_rota"] = time.perf_counter() - inicio
+            carga["Resultado"] = resultado
+            with self._lock:
+                self.cargas_recentes.append(carga)
+
+    # --- Consulta e exportação ---
+
+    def zerar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._histogramas.clear()
+            self.cargas_recentes.clear()
+
+    def instantaneo(self):
+        """Cópia dos dados em estruturas simples (dict/list), pronta para JSON."""
+        with self._lock:
+            contadores = [
+                {"nome": nome, "rotulos": dict(rotulos), "valor": valor}
+                for (nome, rotulos), valor in sorted(self._contadores.items())
+            ]
+            histogramas = [
+                {
+                    "nome": nome, "rotulos": dict(rotulos),
+                    "baldes": list(h.baldes), "contagens": list(h.contagens),
+                    "soma": h.soma, "total": h.total,
+                    "p50": h.quantil(0.5), "p95": h.quantil(0.95),
+                }
+                for (nome, rotulos), h in sorted(self._histogramas.items())
+            ]
+            recentes = list(self.cargas_recentes)
+        return {"contadores": contadores, "histogramas": histogramas, "cargas_recentes": recentes}
+
+    def exportar_json(self):
+        return json.dumps(self.instantaneo(), ensure_ascii=False, indent=2)
+
+    def exportar_prometheus(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted(
+                (chave, (h.baldes, list(h.contagens), h.soma, h.total)) for chave, h in self._histogramas.items()
+            )
+
+        linhas = []
+        anunciados = set()
+
+        def cabecalho(nome, tipo):
+            if nome not in anunciados:
+                anunciados.add(nome)
+                linhas.append(f"# HELP {nome} {DESCRICOES.get(nome, nome)}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+
+        for (nome, rotulos), valor in contadores:
+            cabecalho(nome, "counter")
+            linhas.append(f"{nome}{_texto_rotulos(rotulos)} {valor}")
+
+        for (nome, rotulos), (baldes, contagens, soma, total) in histogramas:
+            cabecalho(nome, "histogram")
+            acumulado = 0
+            for limite, contagem in zip(list(baldes) + [math.inf], contagens):
+                acumulado += contagem
+                le = "+Inf" if limite == math.inf else repr(float(limite))
+                linhas.append(f"{nome}_bucket{_texto_rotulos(rotulos, ('le', le))} {acumulado}")
+            linhas.append(f"{nome}_sum{_texto_rotulos(rotulos)} {soma}")
+            linhas.append(f"{nome}_count{_texto_rotulos(rotulos)} {total}")
+
+        return "\n".join(linhas) + "\n"
+
+    def resumo_etapas(self):
+        """Linhas (Etapa, Chamadas, Total, Média, p50, p95) do histograma de etapas, para tabela."""
+        linhas = []
+        for h in self.instantaneo()["histogramas"]:
+            if h["nome"] != "roteirizador_etapa_segundos":
+                continue
+            linhas.append({
+                "Etapa": h["rotulos"].get("etapa"),
+                "Ocorrências": h["total"],
+                "Total (s)": round(h["soma"], 3),
+                "Média (ms)": round(1000 * h["soma"] / h["total"], 1) if h["total"] else 0.0,
+                "p50 (ms)": round(1000 * h["p50"], 1) if h["p50"] is not None else None,
+                "p95 (ms)": round(1000 * h["p95"], 1) if h["p95"] is not None else None,
+            })
+        return linhas
+
+
+METRICAS = Metricas(habilitado=os.environ.get('ROTEIRIZADOR_METRICAS') == '1')
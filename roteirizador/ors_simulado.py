@@ -0,0 +1,298 @@
+"""Servidor local que imita o endpoint de directions do ORS, para testes de carga sem rede.
+
+Exemplo::
+
+    python -m roteirizador.ors_simulado --porta 8080 --latencia 0.2 --taxa-2004 0.1
+    python -m roteirizador cargas.csv -o saida.csv --api-key x --url-ors http://127.0.0.1:8080
+
+Atende ``POST /v2/matrix/<perfil>/json`` (distâncias em linha reta vezes
+``FATOR_SINUOSIDADE``) e ``POST /v2/directions/<perfil>/geojson`` com:
+
+- respostas gravadas: se ``cache`` (um ``CacheRotas``, por exemplo o
+  ``cache_ors.sqlite3`` de produção) tiver a requisição, ela é devolvida;
+- rotas sintéticas: uma polilinha com um vértice a cada ``passo_m`` metros
+  entre as paradas, ``extras.surface`` (asfalto/chão determinístico por
+  região, então a mesma rota sempre tem a mesma superfície), ``way_points``,
+  ``bbox`` e ``summary``.
+
+E injeta falhas: latência fixa mais variação, erro 2004 numa fração das
+requisições (ou sempre que houver ``avoid_polygons``, com
+``recusar_poligonos``) e HTTP 429 acima de ``por_minuto`` requisições.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from roteirizador.distancias import haversine_m
+
+PASSO_PADRAO_M = 200
+TRECHO_SUPERFICIE_M = 2000
+FATOR_SINUOSIDADE = 1.25  # distância "de odômetro" em relação à linha reta
+
+# Códigos de superfície usados nas rotas sintéticas (ver ORS_SURFACE_MAPPING)
+SUPERFICIES_SINTETICAS = (3, 3, 3, 1, 2, 11, 10)
+
+ERRO_2004 = {
+    "error": {
+        "code": 2004,
+        "message": "Request parameters exceed the server configuration limits. "
+                   "The approximated route distance must not be greater than 6000000.0 meters."
+    }
+}
+
+
+def _superficie_da_regiao(lon, lat):
+    # ~11 km por célula: trechos vizinhos tendem a repetir a superfície, como numa estrada real
+    celula = (int(math.floor(lon * 10)) * 73856093) ^ (int(math.floor(lat * 10)) * 19349663)
+    return SUPERFICIES_SINTETICAS[celula % len(SUPERFICIES_SINTETICAS)]
+
+
+def rota_sintetica(coordenadas, passo_m=PASSO_PADRAO_M):
+    """Resposta GeoJSON no formato do ORS ligando as paradas [lon, lat] em linha reta."""
+    geometria = [list(coordenadas[0])]
+    way_points = [0]
+    distancia_total = 0.0
+    for (lon1, lat1), (lon2, lat2) in zip(coordenadas[:-1], coordenadas[1:]):
+        trecho = float(haversine_m(lon1, lat1, lon2, lat2))
+        passos = max(1, int(trecho // passo_m))
+        for i in range(1, passos + 1):
+            f = i / passos
+            geometria.append([lon1 + (lon2 - lon1) * f, lat1 + (lat2 - lat1) * f])
+        way_points.append(len(geometria) - 1)
+        distancia_total += trecho * FATOR_SINUOSIDADE
+
+    # Agrupa os segmentos em trechos de superfície de ~TRECHO_SUPERFICIE_M
+    por_trecho = max(1, TRECHO_SUPERFICIE_M // passo_m)
+    valores = []
+    for inicio in range(0, len(geometria) - 1, por_trecho):
+        fim = min(inicio + por_trecho, len(geometria) - 1)
+        codigo = _superficie_da_regiao(*geometria[inicio])
+        if valores and valores[-1][2] == codigo:
+            valores[-1][1] = fim
+        else:
+            valores.append([inicio, fim, codigo])
+
+    lons = [p[0] for p in geometria]
+    lats = [p[1] for p in geometria]
+    return {
+        "type": "FeatureCollection",
+        "bbox": [min(lons), min(lats), max(lons), max(lats)],
+        "features": [{
+            "type": "Feature",
+            "bbox": [min(lons), min(lats), max(lons), max(lats)],
+            "geometry": {"type": "LineString", "coordinates": geometria},
+            "properties": {
+                "summary": {"distance": round(distancia_total, 1), "duration": round(distancia_total / 16.7, 1)},
+                "way_points": way_points,
+                "extras": {"surface": {"values": valores, "summary": []}},
+            },
+        }],
+        "metadata": {"service": "routing", "engine": {"version": "simulado"}},
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ORSSimulado/1.0"
+
+    def log_message(self, formato, *args):
+        if self.server.simulado.verboso:
+            super().log_message(formato, *args)
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        partes = self.path.split('?')[0].strip('/').split('/')
+        if len(partes) < 3 or partes[0] != 'v2' or partes[1] not in ('directions', 'matrix'):
+            self._responder(404, {"error": {"code": 404, "message": "Endpoint não simulado."}})
+            return
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        try:
+            corpo = json.loads(self.rfile.read(tamanho) or b'{}')
+        except json.JSONDecodeError:
+            self._responder(400, {"error": {"code": 2000, "message": "JSON inválido."}})
+            return
+        perfil = partes[2]
+        if partes[1] == 'matrix':
+            status, resposta = self.server.simulado.responder_matriz(corpo)
+        else:
+            formato = partes[3] if len(partes) > 3 else 'json'
+            status, resposta = self.server.simulado.responder(perfil, formato, corpo)
+        self._responder(status, resposta)
+
+
+class ServidorORSSimulado:
+    """Servidor HTTP do ORS simulado, numa thread própria (use como context manager)."""
+
+    def __init__(self, host='127.0.0.1', porta=0, latencia_s=0.0, variacao_latencia_s=0.0,
+                 taxa_2004=0.0, recusar_poligonos=False, por_minuto=None, cache=None,
+                 passo_m=PASSO_PADRAO_M, semente=None, verboso=False):
+        self.latencia_s = latencia_s
+        self.variacao_latencia_s = variacao_latencia_s
+        self.taxa_2004 = taxa_2004
+        self.recusar_poligonos = recusar_poligonos
+        self.por_minuto = por_minuto
+        self.cache = cache
+        self.passo_m = passo_m
+        self.verboso = verboso
+        self.requisicoes = 0
+        self.erros_2004 = 0
+        self.recusas_429 = 0
+        self.gravadas = 0
+        self.matrizes = 0
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self._janela = deque()
+        self._servidor = ThreadingHTTPServer((host, porta), _Handler)
+        self._servidor.daemon_threads = True
+        self._servidor.simulado = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def _excede_limite(self):
+        if self.por_minuto is None:
+            return False
+        agora = time.monotonic()
+        while self._janela and agora - self._janela[0] > 60:
+            self._janela.popleft()
+        if len(self._janela) >= self.por_minuto:
+            return True
+        self._janela.append(agora)
+        return False
+
+    def responder(self, perfil, formato, corpo):
+        """Decide (status, corpo) para uma requisição; chamado pelas threads do servidor."""
+        with self._lock:
+            self.requisicoes += 1
+            if self._excede_limite():
+                self.recusas_429 += 1
+                return 429, {"error": "Rate limit exceeded"}
+            atraso = self.latencia_s + self._aleatorio.uniform(0, self.variacao_latencia_s)
+            sorteio = self._aleatorio.random()
+
+        if atraso > 0:
+            time.sleep(atraso)
+
+        coordenadas = corpo.get('coordinates') or []
+        if len(coordenadas) < 2:
+            return 400, {"error": {"code": 2003, "message": "Mínimo de 2 coordenadas."}}
+
+        opcoes = corpo.get('options') or {}
+        if sorteio < self.taxa_2004 or (self.recusar_poligonos and 'avoid_polygons' in opcoes):
+            with self._lock:
+                self.erros_2004 += 1
+            return 400, ERRO_2004
+
+        if self.cache is not None:
+            # Mesmos parâmetros que rotas.chamar_directions passa ao cliente
+            parametros = {k: v for k, v in corpo.items() if k in ('coordinates', 'extra_info', 'options')}
+            parametros.update(profile=perfil, format=formato)
+            gravada = self.cache.obter(self.cache.chave(parametros))
+            if gravada is not None:
+                with self._lock:
+                    self.gravadas += 1
+                return 200, gravada
+
+        return 200, rota_sintetica(coordenadas, self.passo_m)
+
+    def responder_matriz(self, corpo):
+        """Matriz de distâncias (m) entre ``sources`` e ``destinations``, pela mesma regra das rotas sintéticas."""
+        with self._lock:
+            self.requisicoes += 1
+            self.matrizes += 1
+            if self._excede_limite():
+                self.recusas_429 += 1
+                return 429, {"error": "Rate limit exceeded"}
+            atraso = self.latencia_s + self._aleatorio.uniform(0, self.variacao_latencia_s)
+        if atraso > 0:
+            time.sleep(atraso)
+
+        locais = corpo.get('locations') or []
+        origens = corpo.get('sources') or list(range(len(locais)))
+        destinos = corpo.get('destinations') or list(range(len(locais)))
+        distancias = [
+            [round(float(haversine_m(*locais[o], *locais[d])) * FATOR_SINUOSIDADE, 1) for d in destinos]
+            for o in origens
+        ]
+        return 200, {"distances": distancias, "metadata": {"service": "matrix", "engine": {"version": "simulado"}}}
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "Requisições": self.requisicoes,
+                "Matrizes": self.matrizes,
+                "Erros 2004": self.erros_2004,
+                "Recusas 429": self.recusas_429,
+                "Respostas Gravadas": self.gravadas,
+            }
+
+    def servir(self):
+        """Atende na thread atual até Ctrl+C."""
+        try:
+            self._servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._servidor.server_close()
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m roteirizador.ors_simulado",
+                                     description="ORS de mentira para testes de carga sem rede.")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos fixos por requisição")
+    parser.add_argument("--variacao-latencia", type=float, default=0.0, help="Segundos extras sorteados (0 a N)")
+    parser.add_argument("--taxa-2004", type=float, default=0.0, help="Fração das requisições que falha com 2004")
+    parser.add_argument("--recusar-poligonos", action="store_true", help="Sempre responde 2004 a avoid_polygons")
+    parser.add_argument("--por-minuto", type=int, default=None, help="Responde 429 acima deste número por minuto")
+    parser.add_argument("--cache", default=None, help="SQLite do CacheRotas com respostas gravadas")
+    parser.add_argument("--semente", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache:
+        from roteirizador.cache_ors import CacheRotas
+        cache = CacheRotas(args.cache, ttl_segundos=None)
+
+    servidor = ServidorORSSimulado(args.host, args.porta, args.latencia, args.variacao_latencia,
+                                   args.taxa_2004, args.recusar_poligonos, args.por_minuto, cache,
+                                   semente=args.semente, verboso=True)
+    print(f"ORS simulado em {servidor.url}")
+    servidor.servir()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
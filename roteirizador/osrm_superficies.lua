@@ -0,0 +1,58 @@
+-- Perfil do OSRM para o roteirizador (backend 'osrm' de roteirizador/backends.py).
+--
+-- É o car.lua padrão com a tag 'surface' do OSM publicada como "class" da via,
+-- que o OSRM devolve em cada interseção dos steps. O OSRM aceita no máximo 8
+-- classes: as cinco do car.lua (toll, motorway, ferry, restricted, tunnel) e
+-- três de superfície. Vias sem tag de superfície não recebem classe e viram
+-- 'unknown' (assumido asfalto), como no ORS.
+--
+-- Copie para /opt (ao lado do car.lua) no container osrm/osrm-backend:
+--   osrm-extract -p /opt/osrm_superficies.lua ms.osm.pbf
+
+api_version = 4
+
+local car = require('car')
+Set = require('lib/set')
+Sequence = require('lib/sequence')
+
+-- Tag 'surface' do OSM -> classe; os valores sem classe própria caem em 'unpaved'
+local CLASSE_SUPERFICIE = {
+  compacted = 'compacted',
+  gravel = 'gravel',
+  fine_gravel = 'gravel',
+  dirt = 'unpaved',
+  earth = 'unpaved',
+  ground = 'unpaved',
+  mud = 'unpaved',
+  clay = 'unpaved',
+  sand = 'unpaved',
+  grass = 'unpaved',
+  wood = 'unpaved',
+  salt = 'unpaved',
+  ice = 'unpaved',
+  snow = 'unpaved',
+}
+
+function setup()
+  local profile = car.setup()
+  profile.classes = Sequence {
+    'toll', 'motorway', 'ferry', 'restricted', 'tunnel', 'compacted', 'gravel', 'unpaved'
+  }
+  return profile
+end
+
+function process_way(profile, way, result, relations)
+  car.process_way(profile, way, result, relations)
+  local classe = CLASSE_SUPERFICIE[way:get_value_by_key('surface') or '']
+  if classe then
+    result.forward_classes[classe] = true
+    result.backward_classes[classe] = true
+  end
+end
+
+return {
+  setup = setup,
+  process_way = process_way,
+  process_node = car.process_node,
+  process_turn = car.process_turn
+}
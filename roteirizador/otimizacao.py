@@ -0,0 +1,197 @@
+"""Otimização da ordem das paradas de uma carga antes do roteamento.
+
+A primeira e a última parada ficam fixas; as intermediárias são reordenadas
+para minimizar o custo ponderado do ``MODELO_PADRAO`` (``roteirizador.custos``):
+
+1. matriz de distâncias entre todas as paradas pelo endpoint de matriz do ORS,
+   em blocos que respeitam o limite de locais por chamada;
+2. custo de cada par = km x (fator de asfalto/chão pela proporção de chão
+   histórica do trecho, ver ``HistoricoCorredores``; sem histórico, só km);
+3. vizinho mais próximo, depois 2-opt e Or-opt (vetorizados com numpy) até
+   não haver melhora ou acabar o ``prazo_s``.
+
+A matriz do ORS não aceita ``avoid_polygons``: as zonas de restrição
+(``roteirizador.zonas``) só entram no roteamento da sequência final.
+"""
+import time
+
+import numpy as np
+
+from roteirizador.cliente_ors import CotaDiariaEsgotada
+from roteirizador.custos import MODELO_PADRAO
+
+PARADAS_POR_BLOCO = 25  # origens x destinos por chamada: no máximo 50 locais, o limite do plano público
+PRAZO_PADRAO_S = 2.0
+MIN_PARADAS = 4  # com 3 ou menos só há uma ordem possível para as intermediárias
+FATOR_ASFALTO = MODELO_PADRAO.fator_asfalto
+FATOR_CHAO = MODELO_PADRAO.fator_chao
+_EPS = 1e-9
+
+
+# --- MATRIZ DE CUSTOS ---
+
+
+def matriz_distancias(client, paradas, profile='driving-hgv'):
+    """Matriz (n, n) de distâncias em metros entre as paradas [lon, lat]. Retorna (matriz, chamadas)."""
+    n = len(paradas)
+    matriz = np.zeros((n, n), dtype=np.float64)
+    chamadas = 0
+    for i in range(0, n, PARADAS_POR_BLOCO):
+        origens = list(range(i, min(i + PARADAS_POR_BLOCO, n)))
+        for j in range(0, n, PARADAS_POR_BLOCO):
+            destinos = list(range(j, min(j + PARADAS_POR_BLOCO, n)))
+            locais = list(dict.fromkeys(origens + destinos))
+            posicao = {p: k for k, p in enumerate(locais)}
+            resposta = client.distance_matrix(
+                locations=[list(paradas[p]) for p in locais],
+                profile=profile,
+                sources=[posicao[p] for p in origens],
+                destinations=[posicao[p] for p in destinos],
+                metrics=['distance'],
+            )
+            chamadas += 1
+            bloco = np.array(resposta['distances'], dtype=np.float64)  # None (sem rota) vira nan
+            matriz[i:i + len(origens), j:j + len(destinos)] = bloco
+    return matriz, chamadas
+
+
+def matriz_custos(distancias_m, paradas, historico=None):
+    """Custo ponderado (km x fator) de cada par; pares sem rota ficam com custo infinito."""
+    fatores = np.full(distancias_m.shape, FATOR_ASFALTO)
+    if historico is not None:
+        # Todos os pares numa leitura só do histórico (consultas IN em lote), não uma consulta por par
+        n = len(paradas)
+        origens, destinos = np.nonzero(~np.eye(n, dtype=bool))
+        pontos = [tuple(parada) for parada in paradas]
+        proporcoes = historico.proporcoes_chao([(pontos[i], pontos[j]) for i, j in zip(origens, destinos)])
+        fracoes = np.array([fracao for fracao, _ in proporcoes], dtype=np.float64)
+        fatores[origens, destinos] = FATOR_ASFALTO * (1 - fracoes) + FATOR_CHAO * fracoes
+    custos = distancias_m / 1000 * fatores
+    custos[np.isnan(custos)] = np.inf
+    return custos
+
+
+def custo_ordem(custos, ordem):
+    ordem = np.asarray(ordem)
+    return float(custos[ordem[:-1], ordem[1:]].sum())
+
+
+# --- HEURÍSTICAS ---
+
+
+def vizinho_mais_proximo(custos):
+    """Ordem gulosa a partir da primeira parada, terminando na última."""
+    n = len(custos)
+    ordem = [0]
+    livres = set(range(1, n - 1))
+    while livres:
+        atual = ordem[-1]
+        proximo = min(livres, key=lambda k: custos[atual, k])
+        ordem.append(proximo)
+        livres.remove(proximo)
+    ordem.append(n - 1)
+    return np.array(ordem)
+
+
+def _dois_opt(ordem, custos, limite):
+    """Inverte trechos enquanto houver melhora. ``custos`` deve ser simétrica."""
+    n = len(ordem)
+    melhorou = False
+    for i in range(1, n - 2):
+        if time.perf_counter() > limite:
+            break
+        js = np.arange(i + 1, n - 1)
+        a, b = ordem[i - 1], ordem[i]
+        c, e = ordem[js], ordem[js + 1]
+        delta = custos[a, c] + custos[b, e] - custos[a, b] - custos[c, e]
+        k = int(np.argmin(delta))
+        if delta[k] < -_EPS:
+            j = js[k]
+            ordem[i:j + 1] = ordem[i:j + 1][::-1].copy()
+            melhorou = True
+    return melhorou
+
+
+def _or_opt(ordem, custos, limite, max_segmento=3):
+    """Move segmentos de 1 a ``max_segmento`` paradas (também invertidos) para a melhor posição."""
+    melhorou = False
+    for tamanho in range(1, max_segmento + 1):
+        i = 1
+        while i + tamanho <= len(ordem) - 1:
+            if time.perf_counter() > limite:
+                return melhorou
+            segmento = ordem[i:i + tamanho]
+            p, q = ordem[i - 1], ordem[i + tamanho]
+            s0, s1 = segmento[0], segmento[-1]
+            ganho = custos[p, s0] + custos[s1, q] - custos[p, q]
+
+            resto = np.concatenate([ordem[:i], ordem[i + tamanho:]])
+            x, y = resto[:-1], resto[1:]
+            direto = custos[x, s0] + custos[s1, y] - custos[x, y]
+            invertido = custos[x, s1] + custos[s0, y] - custos[x, y]
+            k_direto, k_invertido = int(np.argmin(direto)), int(np.argmin(invertido))
+            if invertido[k_invertido] < direto[k_direto]:
+                k, acrescimo, inserido = k_invertido, invertido[k_invertido], segmento[::-1]
+            else:
+                k, acrescimo, inserido = k_direto, direto[k_direto], segmento
+            if acrescimo - ganho < -_EPS:
+                ordem[:] = np.concatenate([resto[:k + 1], inserido, resto[k + 1:]])
+                melhorou = True
+            else:
+                i += 1
+    return melhorou
+
+
+def otimizar_sequencia(custos, prazo_s=PRAZO_PADRAO_S):
+    """Melhor ordem encontrada (array de índices) e o seu custo, com primeira e última paradas fixas."""
+    n = len(custos)
+    original = np.arange(n)
+    if n < MIN_PARADAS:
+        return original, custo_ordem(custos, original)
+
+    limite = time.perf_counter() + (prazo_s if prazo_s is not None else float('inf'))
+    # As buscas locais usam a média dos dois sentidos; a escolha final usa a matriz real
+    simetrica = (custos + custos.T) / 2
+    simetrica[~np.isfinite(simetrica)] = np.finfo(np.float64).max / (4 * n)
+
+    ordem = vizinho_mais_proximo(simetrica)
+    while time.perf_counter() <= limite:
+        melhorou = _dois_opt(ordem, simetrica, limite)
+        melhorou = _or_opt(ordem, simetrica, limite) or melhorou
+        if not melhorou:
+            break
+
+    custo_original = custo_ordem(custos, original)
+    custo_otimizado = custo_ordem(custos, ordem)
+    if custo_otimizado < custo_original:
+        return ordem, custo_otimizado
+    return original, custo_original
+
+
+def otimizar_paradas(client, paradas, historico=None, prazo_s=PRAZO_PADRAO_S):
+    """Reordena as paradas intermediárias. Retorna (paradas, aviso ou None)."""
+    if len(paradas) < MIN_PARADAS:
+        return paradas, None
+    try:
+        distancias, chamadas = matriz_distancias(client, paradas)
+    except CotaDiariaEsgotada:
+        raise
+    except Exception as e:
+        return paradas, f"Sequência original mantida (matriz do ORS indisponível: {e})."
+
+    inicio = time.perf_counter()
+    custos = matriz_custos(distancias, paradas, historico)
+    ordem, custo = otimizar_sequencia(custos, prazo_s)
+    custo_original = custo_ordem(custos, np.arange(len(paradas)))
+    decorrido = time.perf_counter() - inicio
+
+    if not np.isfinite(custo_original) or not np.isfinite(custo):
+        return paradas, "Sequência original mantida (a matriz do ORS não encontrou rota entre algumas paradas)."
+    if custo >= custo_original - _EPS:
+        return paradas, f"Sequência original já era a melhor encontrada ({chamadas} chamada(s) à matriz)."
+    economia = 100 * (custo_original - custo) / custo_original if custo_original else 0.0
+    nova_ordem = " → ".join(str(int(k) + 1) for k in ordem)
+    return [paradas[int(k)] for k in ordem], (
+        f"Paradas reordenadas ({nova_ordem}): custo estimado {custo_original:.1f} → {custo:.1f} "
+        f"(-{economia:.1f}%) em {decorrido:.2f}s, {chamadas} chamada(s) à matriz."
+    )
@@ -0,0 +1,242 @@
+"""Leitura da planilha de cargas (CSV ou Excel) e preparo das colunas para o roteamento.
+
+A leitura é feita em blocos: o separador do CSV é detectado numa amostra do
+início do arquivo, só as colunas usadas são carregadas (Coordenada, Carga e
+KM Adicional, com tipos compactos) e ``iterar_cargas`` entrega uma carga por
+vez, de forma que o roteamento começa antes de o arquivo terminar de ser lido.
+
+O pandas só é importado quando uma planilha é de fato lida.
+"""
+import csv
+import io
+
+TAMANHO_BLOCO_PADRAO = 50000
+TAMANHO_AMOSTRA = 64 * 1024
+SEPARADORES_CSV = (',', ';', '\t')
+
+
+def _eh_csv(nome_arquivo):
+    return nome_arquivo.lower().endswith('.csv')
+
+
+def _ler_amostra(arquivo, tamanho=TAMANHO_AMOSTRA):
+    if isinstance(arquivo, (str, bytes)) or hasattr(arquivo, '__fspath__'):
+        with open(arquivo, 'rb') as f:
+            return f.read(tamanho)
+    posicao = arquivo.tell()
+    amostra = arquivo.read(tamanho)
+    arquivo.seek(posicao)
+    return amostra
+
+
+def detectar_separador(amostra):
+    """Escolhe o separador do CSV pelo cabeçalho da amostra (',' se nada for encontrado).
+
+    Só o cabeçalho é usado porque as coordenadas podem ter vírgula decimal.
+    """
+    if isinstance(amostra, bytes):
+        amostra = amostra.decode('utf-8-sig', errors='replace')
+    cabecalho = amostra.splitlines()[0] if amostra else ''
+    contagens = {sep: cabecalho.count(sep) for sep in SEPARADORES_CSV}
+    separador = max(contagens, key=contagens.get)
+    return separador if contagens[separador] > 0 else ','
+
+
+def _mapear_colunas(colunas):
+    col_coords = [col for col in colunas if 'coordenada' in str(col).lower()]
+    col_carga = [col for col in colunas if 'carga' in str(col).lower()]
+    if not col_coords:
+        raise ValueError("A planilha precisa ter uma coluna chamada 'Coordenadas'.")
+    col_km = 'KM Adicional' if 'KM Adicional' in colunas else None
+    return col_coords[0], (col_carga[0] if col_carga else None), col_km
+
+
+def _normalizar(df_upload, col_coords, col_carga, col_km):
+    """Monta o bloco compacto com as colunas Coordenada, Carga e KM Adicional."""
+    import pandas as pd
+
+    df_para_processar = pd.DataFrame(index=df_upload.index)
+    df_para_processar['Coordenada'] = df_upload[col_coords]
+
+    # Resgata o nome da carga ou define como única
+    if col_carga is not None:
+        df_para_processar['Carga'] = df_upload[col_carga]
+    else:
+        df_para_processar['Carga'] = "Única"
+
+    if col_km is not None:
+        df_para_processar['KM Adicional'] = pd.to_numeric(df_upload[col_km], errors='coerce').fillna(0).astype('float32')
+    else:
+        df_para_processar['KM Adicional'] = pd.Series(0.0, index=df_upload.index, dtype='float32')
+
+    # Remove linhas vazias e preenche nomes de carga faltantes
+    df_para_processar = df_para_processar.dropna(subset=['Coordenada'])
+    df_para_processar['Carga'] = df_para_processar['Carga'].fillna("Desconhecida")
+    return df_para_processar
+
+
+def preparar_cargas(df_upload):
+    """Monta o DataFrame com as colunas Coordenada, Carga e KM Adicional.
+
+    Levanta ValueError se a planilha não tiver a coluna de coordenadas.
+    """
+    return _normalizar(df_upload, *_mapear_colunas(df_upload.columns))
+
+
+def _blocos_csv(arquivo, tamanho_bloco):
+    import pandas as pd
+
+    amostra = _ler_amostra(arquivo).decode('utf-8-sig', errors='replace')
+    separador = detectar_separador(amostra)
+    cabecalho = next(csv.reader(io.StringIO(amostra.splitlines()[0] if amostra else ''), delimiter=separador), [])
+    col_coords, col_carga, col_km = _mapear_colunas(cabecalho)
+
+    usecols = [col for col in (col_coords, col_carga, col_km) if col is not None]
+    dtype = {col_coords: str}
+    if col_carga is not None:
+        dtype[col_carga] = str
+
+    leitor = pd.read_csv(arquivo, sep=separador, usecols=usecols, dtype=dtype,
+                         chunksize=tamanho_bloco, encoding='utf-8-sig')
+    for bloco in leitor:
+        yield _normalizar(bloco, col_coords, col_carga, col_km)
+
+
+def _blocos_excel(arquivo, tamanho_bloco):
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    # read_only percorre a planilha em fluxo, sem montar o XML inteiro na memória
+    planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        linhas = planilha.worksheets[0].iter_rows(values_only=True)
+        cabecalho = [str(c) if c is not None else '' for c in next(linhas, ())]
+        col_coords, col_carga, col_km = _mapear_colunas(cabecalho)
+        indices = [cabecalho.index(col) for col in (col_coords, col_carga, col_km) if col is not None]
+        nomes = [cabecalho[i] for i in indices]
+
+        inicio = 0
+        bloco = []
+        for linha in linhas:
+            bloco.append([linha[i] if i < len(linha) else None for i in indices])
+            if len(bloco) >= tamanho_bloco:
+                df_bloco = pd.DataFrame(bloco, columns=nomes, index=pd.RangeIndex(inicio, inicio + len(bloco)))
+                yield _normalizar(df_bloco, col_coords, col_carga, col_km)
+                inicio += len(bloco)
+                bloco = []
+        if bloco:
+            df_bloco = pd.DataFrame(bloco, columns=nomes, index=pd.RangeIndex(inicio, inicio + len(bloco)))
+            yield _normalizar(df_bloco, col_coords, col_carga, col_km)
+    finally:
+        planilha.close()
+
+
+def ler_blocos(arquivo, nome_arquivo, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+    """Gera blocos já normalizados (Coordenada, Carga, KM Adicional) da planilha."""
+    if _eh_csv(nome_arquivo):
+        return _blocos_csv(arquivo, tamanho_bloco)
+    return _blocos_excel(arquivo, tamanho_bloco)
+
+
+def ler_amostra(arquivo, nome_arquivo, linhas=5):
+    """Primeiras linhas da planilha com todas as colunas, para pré-visualização."""
+    import pandas as pd
+
+    if _eh_csv(nome_arquivo):
+        df_amostra = pd.read_csv(arquivo, sep=detectar_separador(_ler_amostra(arquivo)),
+                                 nrows=linhas, encoding='utf-8-sig')
+    else:
+        from openpyxl import load_workbook
+
+        planilha = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            valores = list(planilha.worksheets[0].iter_rows(values_only=True, max_row=linhas + 1))
+        finally:
+            planilha.close()
+        df_amostra = pd.DataFrame(valores[1:], columns=valores[0]) if valores else pd.DataFrame()
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    return df_amostra
+
+
+def ler_cargas(arquivo, nome_arquivo, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+    """Lê a planilha inteira numa única passada para um DataFrame compacto (Carga categórica)."""
+    import pandas as pd
+
+    blocos = list(ler_blocos(arquivo, nome_arquivo, tamanho_bloco))
+    if not blocos:
+        return pd.DataFrame({'Coordenada': [], 'Carga': [], 'KM Adicional': []})
+    df_para_processar = pd.concat(blocos) if len(blocos) > 1 else blocos[0]
+    df_para_processar['Carga'] = df_para_processar['Carga'].astype('category')
+    return df_para_processar
+
+
+def validar_coordenadas(df_para_processar):
+    """Converte a coluna Coordenada inteira de uma vez.
+
+    Retorna o DataFrame com as colunas Latitude/Longitude preenchidas e outro
+    DataFrame com todas as linhas inválidas (Carga, Linha, Coordenada).
+    """
+    from roteirizador.coordenadas import converter_coluna
+
+    lat, lon, erros = converter_coluna(df_para_processar['Coordenada'])
+    df_validado = df_para_processar.assign(Latitude=lat, Longitude=lon)
+
+    df_erros = df_para_processar.loc[erros, ['Carga', 'Coordenada']].copy()
+    df_erros.insert(1, 'Linha', df_erros.index + 1)
+    return df_validado, df_erros.reset_index(drop=True)
+
+
+def agrupar_cargas(df_para_processar):
+    """Lista de (carga_id, df_carga) mantendo a ordem de aparição (sort=False)."""
+    return list(df_para_processar.groupby('Carga', sort=False, observed=True))
+
+
+def iterar_cargas(arquivo, nome_arquivo, tamanho_bloco=TAMANHO_BLOCO_PADRAO, ordenado=False,
+                  ao_encontrar_erros=None):
+    """Gera ``(carga_id, df_carga)`` lendo a planilha em blocos, já com Latitude/Longitude.
+
+    Com ``ordenado=True`` (planilha agrupada por Carga) cada carga é entregue
+    assim que a próxima começa, sem esperar o fim do arquivo; se uma carga
+    reaparecer depois de entregue, levanta ValueError. Sem essa garantia, as
+    cargas são acumuladas e entregues no fim, na ordem de aparição.
+
+    ``ao_encontrar_erros(df_erros)`` recebe as coordenadas inválidas de cada bloco.
+    """
+    import pandas as pd
+
+    pendentes = {}
+    entregues = set()
+
+    for bloco in ler_blocos(arquivo, nome_arquivo, tamanho_bloco):
+        if bloco.empty:
+            continue
+        bloco, df_erros = validar_coordenadas(bloco)
+        if ao_encontrar_erros is not None and not df_erros.empty:
+            ao_encontrar_erros(df_erros)
+
+        grupos = bloco.groupby('Carga', sort=False)
+        if not ordenado:
+            for carga_id, df_carga in grupos:
+                pendentes.setdefault(carga_id, []).append(df_carga)
+            continue
+
+        # Caminho rápido: todas as cargas do bloco, exceto a última, já estão completas
+        ids_bloco = list(grupos.groups)
+        for carga_id in [c for c in pendentes if c != ids_bloco[0]]:
+            # A carga que ficou aberta no fim do bloco anterior não continua neste
+            partes = pendentes.pop(carga_id)
+            entregues.add(carga_id)
+            yield carga_id, pd.concat(partes) if len(partes) > 1 else partes[0]
+
+        for carga_id, df_carga in grupos:
+            if carga_id in entregues:
+                raise ValueError(f"Planilha não está ordenada por Carga: '{carga_id}' reaparece na linha {df_carga.index[0] + 1}.")
+            pendentes.setdefault(carga_id, []).append(df_carga)
+            if carga_id != ids_bloco[-1]:
+                partes = pendentes.pop(carga_id)
+                entregues.add(carga_id)
+                yield carga_id, pd.concat(partes) if len(partes) > 1 else partes[0]
+
+    for carga_id, partes in pendentes.items():
+        yield carga_id, pd.concat(partes) if len(partes) > 1 else partes[0]
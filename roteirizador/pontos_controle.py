@@ -0,0 +1,122 @@
+"""Detecção de passagem por pontos de controle (Ponte BR-262 e outros).
+
+Uma rota só é examinada ponto a ponto se o seu ``bbox`` (devolvido pelo ORS)
+chegar perto de algum ponto de controle; nesse caso a busca é vetorizada:
+um recorte retangular descarta quase toda a polilinha e a distância só é
+calculada para os vértices que sobram.
+
+Cada entrada e saída do raio de um ponto conta como uma passagem, de modo
+que uma rota de ida e volta pela ponte registra duas passagens, na ordem em
+que acontecem.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from roteirizador.constantes import PONTE_BR262
+from roteirizador.distancias import haversine_m
+from roteirizador.geometria import cantos_bbox
+
+METROS_POR_GRAU = 111320.0
+
+PontoControle = namedtuple('PontoControle', ['nome', 'coordenada', 'raio_m'])
+Passagem = namedtuple('Passagem', ['nome', 'coordenada', 'indice', 'distancia_m'])
+
+PONTOS_CONTROLE = (
+    PontoControle("Ponte BR-262", PONTE_BR262, 2000),
+)
+
+
+def _margens_graus(ponto):
+    """Meia largura (lon, lat) em graus do quadrado que contém o raio do ponto."""
+    lon, lat = ponto.coordenada
+    margem_lat = ponto.raio_m / METROS_POR_GRAU
+    margem_lon = margem_lat / max(np.cos(np.radians(lat)), 1e-6)
+    return margem_lon, margem_lat
+
+
+def _bbox_alcanca(bbox, ponto):
+    min_lon, min_lat, max_lon, max_lat = cantos_bbox(bbox)
+    margem_lon, margem_lat = _margens_graus(ponto)
+    lon, lat = ponto.coordenada
+    return (min_lon - margem_lon <= lon <= max_lon + margem_lon
+            and min_lat - margem_lat <= lat <= max_lat + margem_lat)
+
+
+def detectar_passagens(geometry, pontos=PONTOS_CONTROLE, bbox=None):
+    """Lista de :class:`Passagem` pelos pontos de controle, em ordem ao longo da rota.
+
+    ``bbox`` ([min_lon, min_lat, max_lon, max_lat], como em ``route['bbox']``)
+    descarta sem olhar a geometria os pontos que estão longe da rota.
+    """
+    candidatos = [p for p in pontos if bbox is None or _bbox_alcanca(bbox, p)]
+    if not candidatos or len(geometry) == 0:
+        return []
+
+    arr = np.asarray(geometry, dtype=np.float64)[:, :2]
+    passagens = []
+    for ponto in candidatos:
+        lon, lat = ponto.coordenada
+        margem_lon, margem_lat = _margens_graus(ponto)
+        perto = np.flatnonzero((np.abs(arr[:, 0] - lon) <= margem_lon) & (np.abs(arr[:, 1] - lat) <= margem_lat))
+        if len(perto) == 0:
+            continue
+
+        distancias = haversine_m(arr[perto, 0], arr[perto, 1], lon, lat)
+        dentro = perto[distancias < ponto.raio_m]
+        distancias = distancias[distancias < ponto.raio_m]
+        if len(dentro) == 0:
+            continue
+
+        # Vértices consecutivos dentro do raio formam uma única passagem
+        cortes = np.flatnonzero(np.diff(dentro) > 1) + 1
+        for indices, dists in zip(np.split(dentro, cortes), np.split(distancias, cortes)):
+            mais_perto = int(np.argmin(dists))
+            passagens.append(Passagem(ponto.nome, ponto.coordenada, int(indices[mais_perto]), float(dists[mais_perto])))
+
+    passagens.sort(key=lambda p: p.indice)
+    return passagens
+
+
+def indices_paradas(geometry, coords_ors, way_points=None):
+    """Índice na geometria de cada parada (``way_points`` do ORS ou o vértice mais próximo)."""
+    if way_points is not None and len(way_points) == len(coords_ors):
+        return list(way_points)
+    arr = np.asarray(geometry, dtype=np.float64)[:, :2]
+    indices = []
+    inicio = 0
+    for lon, lat in coords_ors:
+        # Busca só a partir da parada anterior: numa ida e volta a origem também é o destino
+        inicio += int(np.argmin((arr[inicio:, 0] - lon) ** 2 + (arr[inicio:, 1] - lat) ** 2))
+        indices.append(inicio)
+    return indices
+
+
+def coordenadas_para_link(coords_ors, geometry, passagens, way_points=None, pontos=PONTOS_CONTROLE):
+    """Paradas com os pontos de controle atravessados inseridos no trecho em que ocorreram.
+
+    Um ponto de controle que já é uma das pontas do trecho (desvio forçado
+    pela escada de fallback) não é repetido.
+    """
+    if not passagens:
+        return list(coords_ors)
+
+    raios = {p.nome: p.raio_m for p in pontos}
+    indices = indices_paradas(geometry, coords_ors, way_points)
+    resultado = [coords_ors[0]]
+    restantes = list(passagens)
+    for k in range(1, len(coords_ors)):
+        inicio, fim = coords_ors[k - 1], coords_ors[k]
+        while restantes and restantes[0].indice < indices[k]:
+            passagem = restantes.pop(0)
+            raio = raios.get(passagem.nome, 0)
+            lon, lat = passagem.coordenada
+            if all(haversine_m(c[0], c[1], lon, lat) >= raio for c in (inicio, fim)):
+                resultado.append(passagem.coordenada)
+        resultado.append(fim)
+    return resultado
+
+
+def link_google_maps(coordenadas):
+    """Link de rota do Google Maps para uma lista de pontos [lon, lat]."""
+    return "https://www.google.com/maps/dir/" + "/".join([f"{c[1]},{c[0]}" for c in coordenadas])
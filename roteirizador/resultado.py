@@ -0,0 +1,115 @@
+"""Resultado compacto do roteamento de uma carga.
+
+Em vez da resposta inteira do ORS e de uma lista de dicts de debug com
+coordenadas já formatadas, cada carga guarda só o necessário, em arrays:
+
+- ``RotaCompacta.coordenadas``: geometria (n, 2) float64 [lon, lat];
+- ``RotaCompacta.trechos``: trechos de superfície (k, 3) int32
+  [início, fim, índice em ``superficies``] com os nomes já traduzidos;
+- ``RotaCompacta.distancias_m``: distância de cada trecho.
+
+A tabela de debug e o resumo por tipo de superfície são montados a partir
+desses arrays só quando pedidos (``tabela_debug``, ``resumo_tipos``).
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+from roteirizador.constantes import UNPAVED_TYPES
+from roteirizador.superficies import nome_superficie
+
+NAO_INFORMADO = "Não Informado (Assumido Asfalto)"
+
+
+@dataclass(slots=True, eq=False)
+class RotaCompacta:
+    coordenadas: np.ndarray
+    trechos: np.ndarray
+    superficies: tuple
+    distancias_m: np.ndarray
+    distancia_oficial_m: float
+    bbox: tuple
+    tags_indice: tuple = None
+
+    @classmethod
+    def de_resposta(cls, route, valores, lookup_surface, distancias_m, tags_indice=None):
+        """Compacta a resposta do ORS; ``valores`` são os trechos [início, fim, superfície] usados no cálculo."""
+        feature = route['features'][0]
+        coordenadas = np.asarray(feature['geometry']['coordinates'], dtype=np.float64)[:, :2]
+        posicao = {}
+        trechos = np.empty((len(valores), 3), dtype=np.int32)
+        for i, (start, end, surf) in enumerate(valores):
+            nome = nome_superficie(surf, lookup_surface)
+            trechos[i] = (start, end, posicao.setdefault(nome, len(posicao)))
+        bbox = route.get('bbox')
+        if bbox is None:
+            bbox = (*coordenadas.min(axis=0), *coordenadas.max(axis=0))
+        return cls(
+            coordenadas=coordenadas,
+            trechos=trechos,
+            superficies=tuple(posicao),
+            distancias_m=np.asarray(distancias_m, dtype=np.float64),
+            distancia_oficial_m=float(feature['properties']['summary']['distance']),
+            bbox=tuple(float(v) for v in bbox),
+            tags_indice=tuple(tags_indice) if tags_indice is not None else None,
+        )
+
+    @property
+    def vertices(self):
+        return len(self.coordenadas)
+
+    @property
+    def nbytes(self):
+        return self.coordenadas.nbytes + self.trechos.nbytes + self.distancias_m.nbytes
+
+    def valores(self):
+        """Trechos no formato de ``extras['surface']['values']``, com os nomes no lugar dos códigos."""
+        return [[start, end, self.superficies[i]] for start, end, i in self.trechos.tolist()]
+
+    def resumo_tipos(self):
+        """Metros por tipo de superfície (antes da normalização pela distância oficial)."""
+        resumo = {}
+        for (_, _, i), metros in zip(self.trechos.tolist(), self.distancias_m.tolist()):
+            surf = self.superficies[i]
+            chave = str(surf) if surf else NAO_INFORMADO
+            resumo[chave] = resumo.get(chave, 0) + metros
+        return resumo
+
+    def tabela_debug(self):
+        """Linhas do debug por trecho de superfície (montadas só quando a tabela é exibida)."""
+        linhas = []
+        for n, ((start, end, i), metros) in enumerate(zip(self.trechos.tolist(), self.distancias_m.tolist())):
+            surf = self.superficies[i]
+            p_start = self.coordenadas[start]
+            p_end = self.coordenadas[end]
+            linha = {
+                "Tag_Original": surf,
+                "Classificacao_App": "Chão" if surf in UNPAVED_TYPES else "Asfalto",
+                "Distancia_m": round(metros, 1),
+                "Coord_Inicio": f"{p_start[1]:.5f}, {p_start[0]:.5f}",
+                "Coord_Fim": f"{p_end[1]:.5f}, {p_end[0]:.5f}",
+            }
+            if self.tags_indice is not None:
+                linha["Tag_Cache"] = self.tags_indice[n]
+            linhas.append(linha)
+        return linhas
+
+
+@dataclass(slots=True, eq=False)
+class ResultadoRota:
+    """Resultado de ``processar_rota`` para uma carga (``rota`` None no modo estimativa ou com erro)."""
+
+    total: float = 0.0
+    link: str = None
+    detalhes: dict = None
+    rota: RotaCompacta = None
+    paradas: list = None
+    erro: str = None
+
+    @classmethod
+    def falha(cls, erro):
+        return cls(erro=erro)
+
+    @property
+    def ok(self):
+        return self.erro is None
@@ -0,0 +1,452 @@
+"""Roteamento de uma carga no ORS com zonas de restrição (``roteirizador.zonas``) e divisão Asfalto/Chão.
+
+Este módulo não depende do Streamlit, do folium nem do pandas e pode ser
+usado por workers, cron ou pela linha de comando (``python -m roteirizador``).
+"""
+from roteirizador.backends import BACKEND_ORS, backend_do_cliente
+from roteirizador.cliente_ors import CotaDiariaEsgotada, ErroLimiteDistancia, PrazoEsgotado, classificar_erro
+from roteirizador.constantes import UNPAVED_TYPES
+from roteirizador.coordenadas import limpar_e_converter
+from roteirizador.custos import MODELO_PADRAO
+from roteirizador.distancias import MODO_ELIPSOIDE, distancia_trecho, distancias_acumuladas
+from roteirizador.estrategias import (
+    DEGRAU_BALSAS, DEGRAU_LIVRE, DEGRAU_POLIGONO, DEGRAU_PONTE, NOMES_DEGRAUS, chave_corredor
+)
+from roteirizador.metricas import BALDES_CHAMADAS, BALDES_VERTICES, METRICAS
+from roteirizador.memo_rotas import RotaBase, chave_carga
+from roteirizador.otimizacao import PRAZO_PADRAO_S, otimizar_paradas
+from roteirizador.pontos_controle import coordenadas_para_link, detectar_passagens, link_google_maps
+from roteirizador.resultado import ResultadoRota, RotaCompacta
+from roteirizador.superficies import nome_superficie, tabela_superficies
+from roteirizador.zonas import registro_padrao
+
+
+# --- ESCADA DE FALLBACK DO ERRO 2004 ---
+
+
+def tentativas_rota(coords_ors, zonas=None, backend=BACKEND_ORS):
+    """Gera (degrau, coordenadas, options, aviso) na ordem da escada de fallback.
+
+    ``zonas`` é um ``RegistroZonas`` (padrão: ``registro_padrao()``); só as
+    zonas no corredor das paradas entram na requisição, já recortadas.
+    ``backend`` diz se o servidor aceita polígonos e até que distância.
+    """
+    registro = zonas if zonas is not None else registro_padrao()
+    relevantes = registro.zonas_no_corredor(coords_ors)
+    nomes_zonas = ", ".join(z.nome for z in relevantes)
+    sem_poligonos = not backend.aceita_poligonos
+    longa = (backend.limite_poligonos_m is not None
+             and registro.longa_para_poligonos(coords_ors, backend.limite_poligonos_m))
+    motivo = "Servidor sem polígonos" if sem_poligonos else "Rota >150km"
+
+    # TENTATIVA 1: A Mágica de bloqueio acontece aqui no campo 'options'
+    # Servidor sem polígonos (OSRM) ou rota mais longa que o limite do avoid_polygons: vai direto para o desvio
+    if not relevantes or not (sem_poligonos or longa):
+        options = {"avoid_features": ["ferries"]}
+        poligonos = registro.poligonos_evitar(relevantes, coords_ors) if relevantes else None
+        if poligonos is not None:
+            options["avoid_polygons"] = poligonos
+        yield DEGRAU_POLIGONO, coords_ors, options, None
+
+    # Sem zona no corredor não há polígono na requisição: um 2004 não vem do limite dos polígonos e
+    # repetir sem evitar balsas só esconderia o erro atrás de um aviso falso
+    if not relevantes:
+        return
+
+    # TENTATIVA 2: Forçar passagem pelos desvios das zonas (ex.: Ponte BR-262), trecho a trecho
+    coords_desvio, desvios = registro.com_desvios(coords_ors)
+    if desvios:
+        nomes_desvios = ", ".join(dict.fromkeys(desvios))
+        vezes = f" ({len(desvios)}x)" if len(desvios) > 1 else ""
+        yield (DEGRAU_PONTE, coords_desvio, None,
+               f"✅ {motivo}. Desvio automático via {nomes_desvios} aplicado{vezes}.")
+
+    # TENTATIVA 3: Se o polígono falhou, tenta pelo menos evitar BALSAS (mais leve para a API)
+    yield DEGRAU_BALSAS, coords_ors, {'avoid_features': ['ferries']}, f"⚠️ {motivo}. Polígono ignorado, mas BALSAS evitadas."
+
+    # TENTATIVA 4: Fallback final (libera a rota original sem bloqueios)
+    limite = "" if sem_poligonos else " (Limite API)"
+    yield DEGRAU_LIVRE, coords_ors, None, f"⚠️ {motivo}. Bloqueio {nomes_zonas} ignorado{limite}."
+
+
+def chamar_directions(client, coordenadas, options, degrau=None):
+    parametros = dict(coordinates=coordenadas, profile='driving-hgv', format='geojson', extra_info=['surface'])
+    if options is not None:
+        parametros['options'] = options
+    if not METRICAS.habilitado:
+        return client.directions(**parametros)
+
+    nome_degrau = NOMES_DEGRAUS.get(degrau, "Direto")
+    inicio = METRICAS.inicio()
+    try:
+        route = client.directions(**parametros)
+    except Exception:
+        METRICAS.contar("roteirizador_chamadas_ors_total", degrau=nome_degrau, resultado="erro")
+        raise
+    finally:
+        METRICAS.fim_etapa("directions", inicio)
+    METRICAS.contar("roteirizador_chamadas_ors_total", degrau=nome_degrau, resultado="ok")
+    return route
+
+
+def _registrar_escada(chamadas, degrau):
+    if not METRICAS.habilitado:
+        return
+    METRICAS.observar("roteirizador_chamadas_por_carga", chamadas, baldes=BALDES_CHAMADAS)
+    if chamadas > 1:
+        METRICAS.contar("roteirizador_retentativas_total", chamadas - 1)
+    nome_degrau = NOMES_DEGRAUS.get(degrau, "Falhou") if degrau is not None else "Falhou"
+    METRICAS.contar("roteirizador_degrau_usado_total", degrau=nome_degrau)
+    METRICAS.anotar_carga(**{"Chamadas ORS": chamadas, "Degrau": nome_degrau})
+
+
+def rotear_com_fallback(client, coords_ors, memoria_estrategias=None, zonas=None):
+    """Executa a escada de fallback. Retorna (route, coords_finais, aviso, erro).
+
+    ``CotaDiariaEsgotada`` não vira erro da carga: sobe para interromper o lote.
+    """
+    backend = backend_do_cliente(client)
+    tentativas = list(tentativas_rota(coords_ors, zonas, backend))
+    # A memória só serve ao limite de distância dos polígonos; sem ele, o primeiro degrau já é o certo
+    if backend.limite_poligonos_m is None:
+        memoria_estrategias = None
+    corredor = chave_corredor(coords_ors) if memoria_estrategias is not None else None
+    ja_tentado = None
+    chamadas = 0
+    
+    ultimo_degrau = tentativas[-1][0]
+    
+    # Atalho: começa direto no degrau que funcionou da última vez para este corredor
+    if corredor is not None:
+        degrau_memorizado = memoria_estrategias.consultar(corredor)
+        if degrau_memorizado is not None and degrau_memorizado not in (t[0] for t in tentativas):
+            # Estratégia que a escada deste corredor nem tem mais (ex.: zonas mudaram): descarta
+            memoria_estrategias.invalidar(corredor)
+        for degrau, coords, options, aviso in tentativas:
+            if degrau == degrau_memorizado:
+                chamadas += 1
+                try:
+                    route = chamar_directions(client, coords, options, degrau)
+                    memoria_estrategias.registrar(corredor, degrau)
+                    _registrar_escada(chamadas, degrau)
+                    return route, coords, aviso, None
+                except Exception as e:
+                    erro = classificar_erro(e)
+                    # Cota diária esgotada não é falha da carga: interrompe o lote
+                    if isinstance(erro, CotaDiariaEsgotada):
+                        _registrar_escada(chamadas, None)
+                        raise erro
+                    # ORS fora do ar ou prazo esgotado: a estratégia continua válida e a escada também falharia
+                    if erro is not None and (erro.retentavel or isinstance(erro, PrazoEsgotado)):
+                        _registrar_escada(chamadas, None)
+                        return None, coords_ors, None, f"Erro API (ORS indisponível): {e}"
+                    # Estratégia memorizada deixou de funcionar: invalida e roda a escada completa
+                    memoria_estrategias.invalidar(corredor)
+                    # O último degrau nunca é pulado: é ele que devolve o erro final da escada
+                    if degrau != ultimo_degrau:
+                        ja_tentado = degrau
+                    break
+    
+    for degrau, coords, options, aviso in tentativas:
+        if degrau == ja_tentado:
+            continue
+        chamadas += 1
+        try:
+            route = chamar_directions(client, coords, options, degrau)
+        except Exception as e:
+            erro = classificar_erro(e)
+            if isinstance(erro, CotaDiariaEsgotada):
+                _registrar_escada(chamadas, None)
+                raise erro
+            # ORS fora do ar ou prazo esgotado (já com retentativas): os outros degraus também falhariam
+            if erro is not None and (erro.retentavel or isinstance(erro, PrazoEsgotado)):
+                _registrar_escada(chamadas, None)
+                return None, coords_ors, None, f"Erro API (ORS indisponível): {e}"
+            # Se o erro não for limite de distância (Code 2004), não adianta descer a escada
+            if degrau == DEGRAU_POLIGONO and not isinstance(erro, ErroLimiteDistancia):
+                _registrar_escada(chamadas, None)
+                return None, coords_ors, None, f"Erro API (O trajeto pode ser impossível sem a balsa?): {e}"
+            if degrau == DEGRAU_LIVRE:
+                _registrar_escada(chamadas, None)
+                return None, coords_ors, None, f"Erro API (Tentativa sem bloqueio falhou): {e}"
+            if degrau == ultimo_degrau:
+                # Escada de um degrau só (nenhuma zona no corredor): o erro é do próprio pedido
+                _registrar_escada(chamadas, None)
+                return None, coords_ors, None, f"Erro API (Limite do servidor sem zonas no trajeto): {e}"
+            continue
+        
+        if corredor is not None and degrau != DEGRAU_POLIGONO:
+            memoria_estrategias.registrar(corredor, degrau)
+        _registrar_escada(chamadas, degrau)
+        return route, coords, aviso, None
+
+    # Escada sem degrau final (não deveria acontecer): erro explícito em vez de None
+    _registrar_escada(chamadas, None)
+    return None, coords_ors, None, "Erro API (Nenhum degrau da escada de fallback respondeu)."
+
+# --- PROCESSAMENTO INDIVIDUAL DA ROTA ---
+
+
+def _como_lista(coluna):
+    return coluna.tolist() if hasattr(coluna, 'tolist') else list(coluna)
+
+
+def somar_km_adicional(dados_carga):
+    if 'KM Adicional' not in dados_carga:
+        return 0.0
+    total = 0.0
+    for valor in _como_lista(dados_carga['KM Adicional']):
+        # Células vazias (None/NaN) contam como zero
+        if valor is not None and valor == valor:
+            total += float(valor)
+    return total
+
+
+def extrair_paradas(dados_carga):
+    """Paradas [lon, lat] da carga, ou ``(None, erro)`` se houver coordenada inválida ou menos de 2."""
+    coords_raw_list = _como_lista(dados_carga['Coordenada'])
+    
+    # Usa as colunas já convertidas em lote (planilha.validar_coordenadas) quando existirem
+    if 'Latitude' in dados_carga and 'Longitude' in dados_carga:
+        lat_lon = zip(_como_lista(dados_carga['Latitude']), _como_lista(dados_carga['Longitude']))
+    else:
+        lat_lon = (limpar_e_converter(c_raw) for c_raw in coords_raw_list)
+    
+    coords_ors = []
+    coords_invalidas = []
+    
+    for c_raw, (lat, lon) in zip(coords_raw_list, lat_lon):
+        # Coordenada inválida: None (conversão célula a célula) ou NaN (conversão em lote)
+        if lat is None or lat != lat:
+            coords_invalidas.append(str(c_raw))
+            continue
+        coords_ors.append([lon, lat])
+    
+    if coords_invalidas:
+        return None, f"Erro no formato da coordenada: {' | '.join(coords_invalidas)}"
+
+    if len(coords_ors) < 2:
+        return None, "Erro: Mínimo 2 pontos necessários para traçar uma rota."
+    return coords_ors, None
+
+
+def _carga_de(dados_carga):
+    if 'Carga' not in dados_carga:
+        return None
+    cargas = _como_lista(dados_carga['Carga'])
+    return cargas[0] if cargas else None
+
+
+def processar_rota(client, dados_carga, modo_distancia=MODO_ELIPSOIDE, memoria_estrategias=None,
+                   indice_superficies=None, verificar_superficies=False, memo_rotas=None,
+                   historico_corredores=None, otimizar_sequencia=False, prazo_otimizacao_s=PRAZO_PADRAO_S,
+                   zonas=None):
+    """Roteia uma carga e calcula a divisão Asfalto/Chão; retorna um ``ResultadoRota``.
+
+    ``dados_carga`` pode ser um DataFrame ou um dict de listas com as colunas
+    'Coordenada' e (opcional) 'KM Adicional'.
+
+    Com ``indice_superficies`` as superfícies da resposta alimentam o índice
+    local; com ``verificar_superficies`` os trechos que divergem do que o
+    índice já sabia são sinalizados nos detalhes e no debug.
+
+    Com ``memo_rotas`` uma carga cujas paradas e opções já foram roteadas
+    reaproveita a rota; só o KM Adicional e os custos são recalculados.
+
+    Com ``historico_corredores`` a proporção de chão de cada trecho da rota
+    alimenta o modo estimativa (``roteirizador.estimativa``).
+
+    Com ``otimizar_sequencia`` as paradas intermediárias são reordenadas pelo
+    custo ponderado Asfalto/Chão antes do roteamento (``roteirizador.otimizacao``),
+    em até ``prazo_otimizacao_s`` segundos.
+
+    ``zonas`` é o ``RegistroZonas`` com as áreas a evitar (padrão: o arquivo
+    de ``roteirizador.zonas``).
+    """
+    inicio = METRICAS.iniciar_carga(_carga_de(dados_carga)) if METRICAS.habilitado else None
+    resultado = _processar_rota(client, dados_carga, modo_distancia, memoria_estrategias,
+                                indice_superficies, verificar_superficies, memo_rotas, historico_corredores,
+                                otimizar_sequencia, prazo_otimizacao_s, zonas)
+    METRICAS.encerrar_carga(inicio, "ok" if resultado.ok else "erro")
+    return resultado
+
+
+def _processar_rota(client, dados_carga, modo_distancia, memoria_estrategias,
+                    indice_superficies, verificar_superficies, memo_rotas, historico_corredores,
+                    otimizar_sequencia, prazo_otimizacao_s, zonas):
+    total_manual = somar_km_adicional(dados_carga)
+    coords_ors, erro = extrair_paradas(dados_carga)
+    if erro:
+        return ResultadoRota.falha(erro)
+
+    if zonas is None:
+        zonas = registro_padrao()
+    opcoes = {
+        "modo_distancia": modo_distancia,
+        "indice_superficies": indice_superficies is not None,
+        "verificar_superficies": bool(verificar_superficies),
+        "otimizar_sequencia": bool(otimizar_sequencia),
+        "zonas": zonas.assinatura,
+        "backend": backend_do_cliente(client).nome,
+    }
+    chave = chave_carga(coords_ors, opcoes) if memo_rotas is not None else None
+    base = memo_rotas.obter(chave) if chave is not None else None
+    if base is not None:
+        METRICAS.anotar_carga(**{"Chamadas ORS": 0, "Degrau": "Memória"})
+    else:
+        aviso_sequencia = None
+        if otimizar_sequencia:
+            with METRICAS.cronometrar("otimizacao"):
+                coords_ors, aviso_sequencia = otimizar_paradas(client, coords_ors, historico_corredores,
+                                                               prazo_otimizacao_s)
+        base, erro = rotear_carga(client, coords_ors, modo_distancia, memoria_estrategias,
+                                  indice_superficies, verificar_superficies, historico_corredores, zonas)
+        if erro:
+            return ResultadoRota.falha(erro)
+        if aviso_sequencia:
+            base = base._replace(avisos={**base.avisos, "🔀 SEQUÊNCIA": aviso_sequencia})
+        if chave is not None:
+            memo_rotas.guardar(chave, base)
+
+    return compor_resultado(base, total_manual)
+
+
+def rotear_carga(client, coords_ors, modo_distancia=MODO_ELIPSOIDE, memoria_estrategias=None,
+                 indice_superficies=None, verificar_superficies=False, historico_corredores=None, zonas=None):
+    """Parte cara de ``processar_rota``: roteia as paradas e divide a rota em Asfalto/Chão.
+
+    Retorna ``(RotaBase, None)`` ou ``(None, erro)``. O resultado não depende do
+    KM Adicional, por isso pode ser memorizado por carga (``MemoRotas``).
+    """
+    paradas = coords_ors
+    if zonas is None:
+        zonas = registro_padrao()
+    route, coords_ors, aviso_restricao, erro = rotear_com_fallback(client, coords_ors, memoria_estrategias, zonas)
+    if erro:
+        return None, erro
+
+    geometry = route['features'][0]['geometry']['coordinates']
+    extras = route['features'][0]['properties'].get('extras', {}).get('surface')
+    superficie_da_resposta = extras is not None
+    if not superficie_da_resposta:
+        # Resposta sem 'surface': reclassifica a geometria com o que o índice local já aprendeu
+        valores = indice_superficies.reclassificar(geometry, cobertura_minima=0.0) if indice_superficies else None
+        extras = {'values': valores or [[0, len(geometry) - 1, 'unknown']]}
+    
+    # --- AJUSTE INTELIGENTE DO LINK GOOGLE MAPS ---
+    # Desvios das zonas (ex.: Ponte BR-262) por onde a rota passou entram no link para o Google Maps obedecer
+    pontos = zonas.pontos_controle()
+    passagens = detectar_passagens(geometry, pontos, bbox=route.get('bbox'))
+    coords_para_link = coordenadas_para_link(
+        coords_ors, geometry, passagens, route['features'][0]['properties'].get('way_points'), pontos
+    )
+
+    inicio_classificacao = METRICAS.inicio()
+    dist_paved = 0
+    dist_unpaved = 0
+    
+    lookup_surface = tabela_superficies(extras)
+
+    divergencias_superficie = []
+    superficies_cache = None
+    if indice_superficies is not None and verificar_superficies and superficie_da_resposta:
+        superficies_cache, divergencias_superficie = indice_superficies.divergencias(
+            geometry, extras['values'], lookup_surface
+        )
+
+    distancias_trechos = []
+    
+    # Distâncias de todos os segmentos calculadas de uma vez; cada trecho vira uma consulta O(1)
+    acumulado = distancias_acumuladas(geometry, modo_distancia)
+    
+    for start, end, surf in extras['values']:
+        surf = nome_superficie(surf, lookup_surface)
+        seg_d = distancia_trecho(acumulado, start, end)
+        distancias_trechos.append(seg_d)
+        
+        if surf in UNPAVED_TYPES:
+            dist_unpaved += seg_d
+        else:
+            dist_paved += seg_d
+
+    # Debug e resumo por tipo saem destes arrays só quando a interface pede (ver roteirizador.resultado)
+    rota = RotaCompacta.de_resposta(route, extras['values'], lookup_surface, distancias_trechos, superficies_cache)
+
+    if indice_superficies is not None and superficie_da_resposta:
+        indice_superficies.aprender(geometry, extras['values'], lookup_surface)
+    if historico_corredores is not None and superficie_da_resposta:
+        # Trechos entre as paradas originais (o desvio pela ponte fica dentro do trecho)
+        historico_corredores.registrar_rota(paradas, geometry, extras['values'], lookup_surface, acumulado)
+
+    # --- AJUSTE DE PRECISÃO (NORMALIZAÇÃO) ---
+    # A geometria (pontos) é uma simplificação visual. A distância do 'summary' é a real do odômetro.
+    # Ajustamos proporcionalmente os segmentos para que a soma bata com a distância oficial.
+    official_distance = route['features'][0]['properties']['summary']['distance']
+    total_calculated = dist_paved + dist_unpaved
+    
+    if total_calculated > 0:
+        factor = official_distance / total_calculated
+        dist_paved *= factor
+        dist_unpaved *= factor
+
+    km_paved = dist_paved / 1000
+    km_unpaved = dist_unpaved / 1000
+    METRICAS.fim_etapa("classificacao", inicio_classificacao)
+    if METRICAS.habilitado:
+        METRICAS.observar("roteirizador_vertices", len(geometry), baldes=BALDES_VERTICES)
+        METRICAS.contar("roteirizador_vertices_total", len(geometry))
+        METRICAS.anotar_carga(**{"Vértices": len(geometry)})
+
+    # Gera o link baseado nas coordenadas FINAIS (coords_ors), que podem conter o desvio da ponte
+    # Usa coords_para_link para garantir que o Google Maps siga o desvio da ponte se necessário
+    link = link_google_maps(coords_para_link)
+    
+    avisos = {}
+    if aviso_restricao:
+        avisos["⚠️ AVISO"] = aviso_restricao
+    if divergencias_superficie:
+        avisos["⚠️ SUPERFÍCIE"] = f"{len(divergencias_superficie)} trecho(s) com superfície diferente da já conhecida no índice local."
+    
+    return RotaBase(km_paved, km_unpaved, link, avisos, rota, coords_ors), None
+
+
+def compor_resultado(base, total_manual, modelo=MODELO_PADRAO):
+    """Soma o KM Adicional à rota já calculada e monta o ``ResultadoRota``."""
+    km_paved, km_unpaved = base.km_asfalto, base.km_chao
+    custo_asfalto = km_paved * modelo.fator_asfalto
+    custo_chao = km_unpaved * modelo.fator_chao
+    total = custo_chao + custo_asfalto + total_manual
+
+    detalhes = {
+        "Asfalto (KM)": round(km_paved, 2),
+        "Chão (KM)": round(km_unpaved, 2),
+        "Total KM (Asfalto + Chão)": round(km_paved + km_unpaved, 2),
+        "Adicional (KM)": round(total_manual, 2),
+        "Custo Asfalto": round(custo_asfalto, 2),
+        "Custo Chão": round(custo_chao, 2),
+        "Total Custo (Asfalto + Chão)": round(custo_asfalto + custo_chao, 2)
+    }
+    detalhes.update(base.avisos)
+    
+    return ResultadoRota(total, base.link, detalhes, base.rota, base.coords_ors)
+
+
+def linha_resumo(carga_id, resultado):
+    """Linha do resumo gerencial (dashboard/CSV) de uma carga, ou None se ela falhou."""
+    if resultado.erro:
+        return None
+    detalhes = resultado.detalhes
+
+    custo_total = detalhes["Total Custo (Asfalto + Chão)"]
+    km_total_real = detalhes["Total KM (Asfalto + Chão)"]
+    perc_chao = (detalhes["Chão (KM)"] / km_total_real * 100) if km_total_real > 0 else 0
+
+    return {
+        "Carga": str(carga_id),
+        "Distância Total (km)": round(resultado.total, 2),
+        "Asfalto (km)": detalhes["Asfalto (KM)"],
+        "Chão (km)": detalhes["Chão (KM)"],
+        "% Chão": round(perc_chao, 1),
+        "Custo Estimado (pts)": round(custo_total, 2),
+        "Link Google Maps": resultado.link
+    }
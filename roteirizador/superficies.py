@@ -0,0 +1,235 @@
+"""Índice local de superfícies aprendidas por segmento de estrada.
+
+Cada segmento da geometria (par de vértices consecutivos) é quantizado numa
+grade de ~11 m (``PRECISAO_VERTICE``) e guardado com a superfície que o ORS
+informou para ele. Como as cargas repetem sempre os mesmos trechos (BR-262,
+estradas de chão da MS-184...), uma geometria já vista pode ser
+reclassificada e recosteada sem nova consulta, e uma resposta nova pode ser
+comparada com o que o índice já sabia.
+
+Os segmentos também são indexados pela célula de 0,01° do ponto médio, o que
+permite consultas por área (``segmentos_na_area``).
+"""
+import threading
+import time
+
+import numpy as np
+
+from roteirizador.armazenamento import caminho_dados, conectar
+from roteirizador.constantes import ORS_SURFACE_MAPPING, UNPAVED_TYPES
+from roteirizador.distancias import MODO_ELIPSOIDE, distancias_segmentos
+
+ARQUIVO_SUPERFICIES = 'superficies.sqlite3'
+PRECISAO_VERTICE = 4  # casas decimais (~11 m)
+CELULAS_POR_GRAU = 100  # células de 0,01° (~1,1 km)
+LOTE_CONSULTA = 900
+
+# Modos de uso no roteamento
+MODO_DESLIGADO = 'desligado'
+MODO_APRENDER = 'aprender'
+MODO_VERIFICAR = 'verificar'
+MODOS_INDICE = (MODO_DESLIGADO, MODO_APRENDER, MODO_VERIFICAR)
+
+
+def tabela_superficies(extras_surface):
+    """Tabela código -> nome de superfície, completada pelo 'summary' da resposta."""
+    lookup_surface = {}
+    lookup_surface.update(ORS_SURFACE_MAPPING)
+
+    if 'summary' in extras_surface:
+        for item in extras_surface['summary']:
+            if 'name' in item:
+                lookup_surface[item['value']] = item['name']
+    return lookup_surface
+
+
+def nome_superficie(surf, lookup_surface):
+    if isinstance(surf, int) and surf in lookup_surface:
+        return lookup_surface[surf]
+    return surf
+
+
+def superficie_por_segmento(valores, lookup_surface, n_segmentos):
+    """Expande os trechos [inicio, fim, superficie] do ORS para um nome por segmento."""
+    superficies = [None] * n_segmentos
+    for start, end, surf in valores:
+        nome = nome_superficie(surf, lookup_surface)
+        superficies[start:end] = [nome] * (end - start)
+    return superficies
+
+
+def _celula(lon, lat):
+    ilon = np.floor(np.asarray(lon) * CELULAS_POR_GRAU).astype(np.int64) + 180 * CELULAS_POR_GRAU
+    ilat = np.floor(np.asarray(lat) * CELULAS_POR_GRAU).astype(np.int64) + 90 * CELULAS_POR_GRAU
+    return ilon * (180 * CELULAS_POR_GRAU + 1) + ilat
+
+
+def chaves_segmentos(geometry):
+    """Chave de cada segmento (independente do sentido) e a célula do seu ponto médio."""
+    arr = np.asarray(geometry, dtype=np.float64)
+    if arr.ndim != 2 or len(arr) < 2:
+        return [], np.zeros(0, dtype=np.int64)
+
+    q = np.round(arr[:, :2] * 10 ** PRECISAO_VERTICE).astype(np.int64)
+    a, b = q[:-1], q[1:]
+    # Orientação canônica: o mesmo trecho percorrido nos dois sentidos tem a mesma chave
+    troca = (a[:, 0] > b[:, 0]) | ((a[:, 0] == b[:, 0]) & (a[:, 1] > b[:, 1]))
+    p = np.where(troca[:, None], b, a)
+    r = np.where(troca[:, None], a, b)
+    chaves = [f"{x1},{y1};{x2},{y2}" for x1, y1, x2, y2 in np.hstack([p, r]).tolist()]
+
+    meio = (arr[:-1, :2] + arr[1:, :2]) / 2
+    return chaves, _celula(meio[:, 0], meio[:, 1])
+
+
+def trechos_de_superficies(superficies):
+    """Junta segmentos consecutivos de mesma superfície em trechos [inicio, fim, nome]."""
+    valores = []
+    inicio = 0
+    for i in range(1, len(superficies) + 1):
+        if i == len(superficies) or superficies[i] != superficies[inicio]:
+            valores.append([inicio, i, superficies[inicio]])
+            inicio = i
+    return valores
+
+
+class IndiceSuperficies:
+    """Índice em SQLite de superfícies por segmento quantizado, com grade espacial."""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or caminho_dados(ARQUIVO_SUPERFICIES)
+        self._lock = threading.Lock()
+        self._conn = conectar(self.caminho)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS segmentos (
+                   chave TEXT PRIMARY KEY,
+                   celula INTEGER NOT NULL,
+                   superficie TEXT,
+                   observacoes INTEGER NOT NULL DEFAULT 1,
+                   atualizado REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_segmentos_celula ON segmentos (celula)")
+
+    def aprender(self, geometry, valores, lookup_surface):
+        """Grava a superfície de cada segmento de uma resposta do ORS."""
+        chaves, celulas = chaves_segmentos(geometry)
+        superficies = superficie_por_segmento(valores, lookup_surface, len(chaves))
+        agora = time.time()
+        linhas = [
+            (chave, int(celula), superficie, agora)
+            for chave, celula, superficie in zip(chaves, celulas.tolist(), superficies)
+            if superficie is not None
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                """INSERT INTO segmentos (chave, celula, superficie, observacoes, atualizado) VALUES (?, ?, ?, 1, ?)
+                   ON CONFLICT(chave) DO UPDATE SET
+                       superficie = excluded.superficie,
+                       observacoes = observacoes + 1,
+                       atualizado = excluded.atualizado""",
+                linhas
+            )
+            self._conn.execute("COMMIT")
+
+    def classificar(self, geometry):
+        """Superfície conhecida de cada segmento (None se nunca visto) e a cobertura (0 a 1)."""
+        chaves, _ = chaves_segmentos(geometry)
+        conhecidas = {}
+        unicas = list(dict.fromkeys(chaves))
+        with self._lock:
+            for i in range(0, len(unicas), LOTE_CONSULTA):
+                lote = unicas[i:i + LOTE_CONSULTA]
+                marcadores = ",".join("?" * len(lote))
+                conhecidas.update(self._conn.execute(
+                    f"SELECT chave, superficie FROM segmentos WHERE chave IN ({marcadores})", lote
+                ).fetchall())
+        superficies = [conhecidas.get(chave) for chave in chaves]
+        cobertura = sum(s is not None for s in superficies) / len(superficies) if superficies else 0.0
+        return superficies, cobertura
+
+    def reclassificar(self, geometry, cobertura_minima=1.0):
+        """Trechos no formato de ``extras['surface']['values']`` a partir do índice.
+
+        Retorna None se a fração de segmentos conhecidos ficar abaixo de ``cobertura_minima``;
+        segmentos desconhecidos entram como 'unknown'.
+        """
+        superficies, cobertura = self.classificar(geometry)
+        if not superficies or cobertura < cobertura_minima:
+            return None
+        return trechos_de_superficies([s if s is not None else 'unknown' for s in superficies])
+
+    def recostear(self, geometry, distancia_oficial=None, modo_distancia=MODO_ELIPSOIDE):
+        """Divisão Asfalto/Chão de uma geometria usando só o índice, sem chamar a API.
+
+        Segmentos desconhecidos contam como asfalto (mesma regra do 'Não
+        Informado'); a cobertura indica quanto da rota o índice conhecia.
+        """
+        superficies, cobertura = self.classificar(geometry)
+        metros = distancias_segmentos(geometry, modo_distancia)
+        eh_chao = np.fromiter((s in UNPAVED_TYPES for s in superficies), dtype=bool, count=len(superficies))
+        dist_unpaved = float(metros[eh_chao].sum())
+        dist_paved = float(metros.sum()) - dist_unpaved
+
+        total_calculado = dist_paved + dist_unpaved
+        if distancia_oficial and total_calculado > 0:
+            fator = distancia_oficial / total_calculado
+            dist_paved *= fator
+            dist_unpaved *= fator
+
+        return {
+            "Asfalto (KM)": round(dist_paved / 1000, 2),
+            "Chão (KM)": round(dist_unpaved / 1000, 2),
+            "Cobertura do Índice (%)": round(100 * cobertura, 1),
+        }
+
+    def divergencias(self, geometry, valores, lookup_surface):
+        """Compara uma resposta nova com o índice, trecho a trecho do ORS.
+
+        Retorna, para cada trecho de ``valores``, a superfície mais comum no
+        índice (ou None se nenhum segmento era conhecido) e a lista dos trechos
+        em que ela difere da informada agora.
+        """
+        conhecidas, _ = self.classificar(geometry)
+        por_trecho = []
+        divergentes = []
+        for start, end, surf in valores:
+            nome = nome_superficie(surf, lookup_surface)
+            vistas = [s for s in conhecidas[start:end] if s is not None]
+            anterior = max(set(vistas), key=vistas.count) if vistas else None
+            por_trecho.append(anterior)
+            if anterior is not None and anterior != nome:
+                divergentes.append({
+                    "Inicio": start, "Fim": end,
+                    "Superficie_Cache": anterior, "Superficie_Nova": nome,
+                    "Segmentos_Divergentes": sum(s != nome for s in vistas),
+                })
+        return por_trecho, divergentes
+
+    def segmentos_na_area(self, bbox):
+        """Segmentos conhecidos cujo ponto médio cai no bbox [min_lon, min_lat, max_lon, max_lat]."""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        canto_min = int(_celula(min_lon, min_lat))
+        canto_max = int(_celula(max_lon, max_lat))
+        largura = 180 * CELULAS_POR_GRAU + 1
+        resultado = []
+        with self._lock:
+            # Uma faixa contígua de células por coluna de longitude da grade
+            for coluna in range(canto_min // largura, canto_max // largura + 1):
+                resultado.extend(self._conn.execute(
+                    "SELECT chave, superficie, observacoes FROM segmentos WHERE celula BETWEEN ? AND ?",
+                    (coluna * largura + canto_min % largura, coluna * largura + canto_max % largura)
+                ).fetchall())
+        return resultado
+
+    def estatisticas(self):
+        with self._lock:
+            segmentos, celulas = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT celula) FROM segmentos"
+            ).fetchone()
+        return {"Segmentos": segmentos, "Células da Grade": celulas}
+
+    def limpar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM segmentos")
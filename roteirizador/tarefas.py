@@ -0,0 +1,576 @@
+"""Fila de tarefas em SQLite e trabalhadores em segundo plano para lotes longos.
+
+Rotear um lote dentro do rerun do Streamlit perdia o trabalho a cada refresh,
+rerun ou queda do navegador. Aqui o lote vira uma tarefa persistente:
+
+- ``FilaTarefas`` guarda cada tarefa (usuário, opções, estado) e cada carga
+  (paradas, estado e o ``ResultadoRota`` serializado) num SQLite;
+- ``ExecutorTarefas`` é um pool de threads do processo do servidor (o app o
+  cria uma vez, com ``st.cache_resource``), que sobrevive aos reruns e às
+  sessões e vai gravando cada carga assim que ela termina. A interface só lê
+  o andamento e os resultados parciais da fila;
+- a planilha é lida numa thread do executor (``ExecutorTarefas.submeter``):
+  a tarefa é criada antes, em leitura, e as cargas gravadas em blocos já são
+  distribuídas enquanto o resto do arquivo é lido;
+- cancelar para a distribuição das cargas restantes (as que já estão em
+  andamento terminam e são gravadas); retomar devolve a tarefa à fila. Após
+  um reinício, as cargas que estavam em andamento voltam a pendentes
+  (``recuperar``) e a tarefa continua de onde parou;
+- a distribuição é justa entre usuários: cada trabalhador livre pega a
+  próxima carga do usuário com menos cargas em andamento (empate: o atendido
+  há mais tempo), e cada tarefa respeita o seu limite de cargas em paralelo.
+  Um lote de 5000 cargas não bloqueia o de 20 cargas de outro usuário.
+
+A unidade de trabalho é a carga, e não o lote, para que a distribuição entre
+usuários seja fina e o cancelamento imediato.
+
+Os resultados são gravados com ``pickle``: o arquivo é local e só é lido por
+este mesmo processo ou por outro do mesmo usuário do sistema.
+"""
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from roteirizador.armazenamento import caminho_dados, conectar
+from roteirizador.cliente_ors import CotaDiariaEsgotada, PrazoEsgotado
+from roteirizador.despacho import MAX_WORKERS_PADRAO
+from roteirizador.resultado import ResultadoRota
+
+_log = logging.getLogger(__name__)
+
+ARQUIVO_TAREFAS = 'tarefas.sqlite3'
+TRABALHADORES_PADRAO = int(os.environ.get('ROTEIRIZADOR_TRABALHADORES', 2 * MAX_WORKERS_PADRAO))
+ESPERA_OCIOSA_S = 1.0
+BLOCO_SUBMISSAO = 500  # cargas gravadas por transação ao submeter
+INTERVALO_SUBMISSAO_S = 0.5  # durante a leitura, grava o que já foi lido pelo menos a cada meio segundo
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDA = 'concluida'
+CANCELADA = 'cancelada'
+FALHOU = 'falhou'
+ESTADOS_ATIVOS = (PENDENTE, EXECUTANDO)
+
+# Falhas que param a tarefa (retomável) em vez de marcar a carga com erro: repetir a carga mais tarde resolve
+ERROS_QUE_PAUSAM = (CotaDiariaEsgotada, PrazoEsgotado)
+
+# Estados de cada carga
+CARGA_OK = 'ok'
+CARGA_ERRO = 'erro'
+
+Tarefa = namedtuple('Tarefa', [
+    'id', 'usuario', 'descricao', 'estado', 'opcoes', 'max_paralelo',
+    'total', 'concluidas', 'falhas', 'criado', 'atualizado', 'erro', 'lendo', 'falhas_registro',
+])
+
+_COLUNAS_TAREFA = ("id, usuario, descricao, estado, opcoes, max_paralelo, total, concluidas, falhas, "
+                   "criado, atualizado, erro, lendo, falhas_registro")
+# Colunas acrescentadas depois da primeira versão do arquivo: (nome, definição)
+_COLUNAS_NOVAS = (
+    ("lendo", "INTEGER NOT NULL DEFAULT 0"),
+    ("rotear_durante_leitura", "INTEGER NOT NULL DEFAULT 1"),
+    ("falhas_registro", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+def _tarefa(linha):
+    return Tarefa(*linha[:4], json.loads(linha[4]), *linha[5:])
+
+
+def _serializar_dados(dados):
+    # DataFrame da carga ou dict de listas -> JSON compacto (processar_rota aceita o dict de volta)
+    colunas = dados.to_dict('list') if hasattr(dados, 'to_dict') else {k: list(v) for k, v in dados.items()}
+    return zlib.compress(json.dumps(colunas, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def _ler_dados(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class FilaTarefas:
+    """Tarefas e cargas em SQLite; seguro entre threads e entre processos (WAL)."""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or caminho_dados(ARQUIVO_TAREFAS)
+        self._lock = threading.Lock()
+        self._ultimo_atendimento = {}  # usuário -> relógio da última carga distribuída
+        self._conn = conectar(self.caminho)
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS tarefas (
+                   id TEXT PRIMARY KEY,
+                   usuario TEXT NOT NULL,
+                   descricao TEXT,
+                   estado TEXT NOT NULL,
+                   opcoes TEXT NOT NULL,
+                   max_paralelo INTEGER NOT NULL,
+                   total INTEGER NOT NULL,
+                   concluidas INTEGER NOT NULL DEFAULT 0,
+                   falhas INTEGER NOT NULL DEFAULT 0,
+                   criado REAL NOT NULL,
+                   atualizado REAL NOT NULL,
+                   erro TEXT,
+                   lendo INTEGER NOT NULL DEFAULT 0,
+                   rotear_durante_leitura INTEGER NOT NULL DEFAULT 1,
+                   falhas_registro INTEGER NOT NULL DEFAULT 0
+               );
+               CREATE TABLE IF NOT EXISTS cargas (
+                   tarefa TEXT NOT NULL,
+                   ordem INTEGER NOT NULL,
+                   carga TEXT NOT NULL,
+                   dados BLOB NOT NULL,
+                   estado TEXT NOT NULL,
+                   sequencia INTEGER,
+                   resultado BLOB,
+                   PRIMARY KEY (tarefa, ordem)
+               );
+               CREATE INDEX IF NOT EXISTS idx_tarefas_estado ON tarefas (estado, criado);
+               CREATE INDEX IF NOT EXISTS idx_tarefas_usuario ON tarefas (usuario, criado);
+               CREATE INDEX IF NOT EXISTS idx_cargas_estado ON cargas (tarefa, estado, ordem);
+               CREATE INDEX IF NOT EXISTS idx_cargas_sequencia ON cargas (tarefa, sequencia);"""
+        )
+        existentes = {linha[1] for linha in self._conn.execute("PRAGMA table_info(tarefas)")}
+        for nome, definicao in _COLUNAS_NOVAS:
+            if nome not in existentes:
+                self._conn.execute(f"ALTER TABLE tarefas ADD COLUMN {nome} {definicao}")
+
+    # --- Submissão e controle ---
+
+    def criar(self, tarefa_id, usuario, opcoes, descricao=None, max_paralelo=MAX_WORKERS_PADRAO,
+              rotear_durante_leitura=True):
+        """Grava a tarefa, ainda sem cargas e em leitura; as cargas chegam por ``acrescentar``.
+
+        Com ``rotear_durante_leitura`` os trabalhadores já pegam as cargas
+        gravadas enquanto o resto da planilha é lido; sem ele (ex.: o plano de
+        trechos precisa do lote inteiro) a tarefa só é distribuída no fim da leitura.
+        """
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO tarefas ({_COLUNAS_TAREFA}, rotear_durante_leitura) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0, ?, ?, NULL, 1, 0, ?)",
+                (tarefa_id, usuario, descricao, PENDENTE, json.dumps(opcoes), max(1, int(max_paralelo)),
+                 agora, agora, int(bool(rotear_durante_leitura)))
+            )
+        return tarefa_id
+
+    def acrescentar(self, tarefa_id, grupos, ao_gravar=None):
+        """Lê ``grupos`` ((carga_id, dados), pode ser o gerador de ``iterar_cargas``) para a tarefa criada.
+
+        As cargas são gravadas em blocos de até ``BLOCO_SUBMISSAO``, ou o que
+        foi lido em ``INTERVALO_SUBMISSAO_S``, e o ``total`` da tarefa cresce a
+        cada bloco; ``ao_gravar()`` é chamado depois de cada um (acordar os
+        trabalhadores). A planilha inteira nunca fica na memória. Se a leitura
+        falhar, a tarefa vai para ``FALHOU`` com as cargas já lidas e a exceção
+        sobe; retomar a tarefa roteia só essas. Retorna o número de cargas.
+        """
+        ordem = 0
+        bloco = []
+        ultima_gravacao = time.monotonic()
+        erro = None
+        try:
+            for carga_id, dados in grupos:
+                bloco.append((tarefa_id, ordem, str(carga_id), _serializar_dados(dados), PENDENTE))
+                ordem += 1
+                if len(bloco) >= BLOCO_SUBMISSAO or time.monotonic() - ultima_gravacao >= INTERVALO_SUBMISSAO_S:
+                    self._gravar_cargas(tarefa_id, bloco)
+                    bloco = []
+                    ultima_gravacao = time.monotonic()
+                    if ao_gravar is not None:
+                        ao_gravar()
+        except BaseException as e:
+            erro = e
+        try:
+            # Mesmo com erro, as cargas lidas antes dele ficam na tarefa
+            self._gravar_cargas(tarefa_id, bloco, fim_leitura=erro is None)
+        except BaseException as e:
+            erro = erro or e
+        if erro is not None:
+            self._interromper_leitura(tarefa_id, f"Leitura da planilha: {type(erro).__name__}: {erro}")
+            raise erro
+        if ao_gravar is not None:
+            ao_gravar()
+        return ordem
+
+    def submeter(self, tarefa_id, usuario, grupos, opcoes, descricao=None, max_paralelo=MAX_WORKERS_PADRAO):
+        """``criar`` + ``acrescentar`` na thread de quem chamou; retorna o id."""
+        self.criar(tarefa_id, usuario, opcoes, descricao, max_paralelo)
+        self.acrescentar(tarefa_id, grupos)
+        return tarefa_id
+
+    def _gravar_cargas(self, tarefa_id, linhas, fim_leitura=False):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO cargas (tarefa, ordem, carga, dados, estado) VALUES (?, ?, ?, ?, ?)", linhas
+                )
+                self._conn.execute(
+                    "UPDATE tarefas SET total = total + ?, lendo = ?, atualizado = ? WHERE id = ?",
+                    (len(linhas), int(not fim_leitura), time.time(), tarefa_id)
+                )
+                if fim_leitura:
+                    self._encerrar_se_terminou(tarefa_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _interromper_leitura(self, tarefa_id, erro):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tarefas SET lendo = 0, erro = ?, atualizado = ?, "
+                "estado = CASE WHEN estado IN (?, ?) THEN ? ELSE estado END WHERE id = ?",
+                (erro, time.time(), *ESTADOS_ATIVOS, FALHOU, tarefa_id)
+            )
+
+    def _encerrar_se_terminou(self, tarefa_id):
+        # Dentro de uma transação: sem cargas por rotear e com a leitura encerrada, a tarefa está concluída
+        restantes = self._conn.execute(
+            "SELECT COUNT(*) FROM cargas WHERE tarefa = ? AND estado IN (?, ?)", (tarefa_id, *ESTADOS_ATIVOS)
+        ).fetchone()[0]
+        lendo = self._conn.execute("SELECT lendo FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()[0]
+        if restantes or lendo:
+            return False
+        # Uma tarefa cancelada cuja última carga terminou agora também está concluída
+        self._conn.execute(
+            "UPDATE tarefas SET estado = ? WHERE id = ? AND estado IN (?, ?, ?)",
+            (CONCLUIDA, tarefa_id, *ESTADOS_ATIVOS, CANCELADA)
+        )
+        return True
+
+    def cancelar(self, tarefa_id):
+        """Para de distribuir as cargas da tarefa; as que estão em andamento terminam normalmente."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tarefas SET estado = ?, atualizado = ? WHERE id = ? AND estado IN (?, ?)",
+                (CANCELADA, time.time(), tarefa_id, *ESTADOS_ATIVOS)
+            )
+        return cursor.rowcount > 0
+
+    def retomar(self, tarefa_id):
+        """Devolve à fila uma tarefa cancelada ou que falhou, a partir das cargas que faltam."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tarefas SET estado = ?, erro = NULL, atualizado = ? WHERE id = ? AND estado IN (?, ?) "
+                "AND EXISTS (SELECT 1 FROM cargas WHERE tarefa = tarefas.id AND estado = ?)",
+                (PENDENTE, time.time(), tarefa_id, CANCELADA, FALHOU, PENDENTE)
+            )
+        return cursor.rowcount > 0
+
+    def remover(self, tarefa_id):
+        """Apaga uma tarefa que não está ativa, com as suas cargas e resultados."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            cursor = self._conn.execute(
+                "DELETE FROM tarefas WHERE id = ? AND estado NOT IN (?, ?) AND lendo = 0", (tarefa_id, *ESTADOS_ATIVOS)
+            )
+            if cursor.rowcount:
+                self._conn.execute("DELETE FROM cargas WHERE tarefa = ?", (tarefa_id,))
+            self._conn.execute("COMMIT")
+        return cursor.rowcount > 0
+
+    def recuperar(self):
+        """Após um reinício, devolve a pendentes as cargas e tarefas que estavam em andamento.
+
+        Uma tarefa cuja leitura foi interrompida pelo reinício vai para
+        ``FALHOU``, com as cargas que chegaram a ser lidas.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            cargas = self._conn.execute(
+                "UPDATE cargas SET estado = ? WHERE estado = ?", (PENDENTE, EXECUTANDO)
+            ).rowcount
+            self._conn.execute(
+                "UPDATE tarefas SET estado = ?, atualizado = ? WHERE estado = ?", (PENDENTE, time.time(), EXECUTANDO)
+            )
+            self._conn.execute(
+                "UPDATE tarefas SET lendo = 0, erro = ?, "
+                "estado = CASE WHEN estado IN (?, ?) THEN ? ELSE estado END WHERE lendo = 1",
+                ("Leitura da planilha interrompida por um reinício.", *ESTADOS_ATIVOS, FALHOU)
+            )
+            self._conn.execute("COMMIT")
+        return cargas
+
+    # --- Distribuição para os trabalhadores ---
+
+    def reservar(self):
+        """Próxima carga a rotear, pela distribuição justa entre usuários: (tarefa_id, ordem, carga_id, dados) ou None."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                candidatas = self._conn.execute(
+                    """SELECT t.id, t.usuario, t.max_paralelo, t.criado,
+                              (SELECT COUNT(*) FROM cargas c WHERE c.tarefa = t.id AND c.estado = ?)
+                       FROM tarefas t
+                       WHERE t.estado IN (?, ?)
+                         AND (t.lendo = 0 OR t.rotear_durante_leitura = 1)
+                         AND EXISTS (SELECT 1 FROM cargas c WHERE c.tarefa = t.id AND c.estado = ?)""",
+                    (EXECUTANDO, *ESTADOS_ATIVOS, PENDENTE)
+                ).fetchall()
+                # Ocupação de cada usuário por todas as suas cargas em andamento, inclusive as de tarefas
+                # que já não têm cargas pendentes (e por isso não estão entre as candidatas)
+                ocupacao = dict(self._conn.execute(
+                    """SELECT t.usuario, COUNT(*) FROM cargas c JOIN tarefas t ON t.id = c.tarefa
+                       WHERE c.estado = ? GROUP BY t.usuario""",
+                    (EXECUTANDO,)
+                ).fetchall())
+                livres = [c for c in candidatas if c[4] < c[2]]
+                if not livres:
+                    self._conn.execute("COMMIT")
+                    return None
+                tarefa_id, usuario, _, _, _ = min(
+                    livres, key=lambda c: (ocupacao.get(c[1], 0), self._ultimo_atendimento.get(c[1], 0.0), c[3])
+                )
+                ordem, carga_id, dados = self._conn.execute(
+                    "SELECT ordem, carga, dados FROM cargas WHERE tarefa = ? AND estado = ? ORDER BY ordem LIMIT 1",
+                    (tarefa_id, PENDENTE)
+                ).fetchone()
+                self._conn.execute(
+                    "UPDATE cargas SET estado = ? WHERE tarefa = ? AND ordem = ?", (EXECUTANDO, tarefa_id, ordem)
+                )
+                self._conn.execute(
+                    "UPDATE tarefas SET estado = ?, atualizado = ? WHERE id = ?", (EXECUTANDO, time.time(), tarefa_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._ultimo_atendimento[usuario] = time.monotonic()
+        return tarefa_id, ordem, carga_id, _ler_dados(dados)
+
+    def concluir(self, tarefa_id, ordem, resultado):
+        """Grava o ``ResultadoRota`` da carga; retorna True se era a última da tarefa."""
+        blob = zlib.compress(pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                sequencia = self._conn.execute(
+                    "UPDATE tarefas SET concluidas = concluidas + 1, falhas = falhas + ?, atualizado = ? "
+                    "WHERE id = ? RETURNING concluidas",
+                    (int(not resultado.ok), time.time(), tarefa_id)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "UPDATE cargas SET estado = ?, sequencia = ?, resultado = ? WHERE tarefa = ? AND ordem = ?",
+                    (CARGA_OK if resultado.ok else CARGA_ERRO, sequencia, blob, tarefa_id, ordem)
+                )
+                ultima = self._encerrar_se_terminou(tarefa_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ultima
+
+    def contar_falha_registro(self, tarefa_id):
+        """Uma carga roteada cujas gravações auxiliares (``ao_concluir``) falharam."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tarefas SET falhas_registro = falhas_registro + 1 WHERE id = ?", (tarefa_id,)
+            )
+
+    def devolver(self, tarefa_id, ordem, erro):
+        """A carga não pôde ser roteada (ex.: cota diária esgotada): volta a pendente e a tarefa para, retomável."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "UPDATE cargas SET estado = ? WHERE tarefa = ? AND ordem = ?", (PENDENTE, tarefa_id, ordem)
+            )
+            self._conn.execute(
+                "UPDATE tarefas SET estado = ?, erro = ?, atualizado = ? WHERE id = ? AND estado IN (?, ?)",
+                (FALHOU, erro, time.time(), tarefa_id, *ESTADOS_ATIVOS)
+            )
+            self._conn.execute("COMMIT")
+
+    # --- Consultas da interface ---
+
+    def obter(self, tarefa_id):
+        with self._lock:
+            linha = self._conn.execute(
+                f"SELECT {_COLUNAS_TAREFA} FROM tarefas WHERE id = ?", (tarefa_id,)
+            ).fetchone()
+        return _tarefa(linha) if linha is not None else None
+
+    def tarefas(self, usuario=None, limite=50):
+        """Tarefas mais recentes (de um usuário, ou de todos)."""
+        with self._lock:
+            if usuario is None:
+                linhas = self._conn.execute(
+                    f"SELECT {_COLUNAS_TAREFA} FROM tarefas ORDER BY criado DESC LIMIT ?", (limite,)
+                ).fetchall()
+            else:
+                linhas = self._conn.execute(
+                    f"SELECT {_COLUNAS_TAREFA} FROM tarefas WHERE usuario = ? ORDER BY criado DESC LIMIT ?",
+                    (usuario, limite)
+                ).fetchall()
+        return [_tarefa(linha) for linha in linhas]
+
+    def grupos(self, tarefa_id):
+        """(carga_id, dados) de todas as cargas da tarefa, na ordem de submissão."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT carga, dados FROM cargas WHERE tarefa = ? ORDER BY ordem", (tarefa_id,)
+            ).fetchall()
+        return [(carga, _ler_dados(dados)) for carga, dados in linhas]
+
+    def resultados(self, tarefa_id, desde=0):
+        """Resultados gravados depois da sequência ``desde``: (lista de (ordem, carga_id, resultado), última sequência)."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT ordem, carga, sequencia, resultado FROM cargas "
+                "WHERE tarefa = ? AND sequencia > ? ORDER BY sequencia",
+                (tarefa_id, desde)
+            ).fetchall()
+        ultima = linhas[-1][2] if linhas else desde
+        return [(ordem, carga, pickle.loads(zlib.decompress(blob))) for ordem, carga, _, blob in linhas], ultima
+
+    def estatisticas(self):
+        with self._lock:
+            por_estado = dict(self._conn.execute("SELECT estado, COUNT(*) FROM tarefas GROUP BY estado").fetchall())
+            falhas_registro = self._conn.execute("SELECT COALESCE(SUM(falhas_registro), 0) FROM tarefas").fetchone()[0]
+            pendentes, em_andamento = self._conn.execute(
+                "SELECT COALESCE(SUM(estado = ?), 0), COALESCE(SUM(estado = ?), 0) FROM cargas",
+                (PENDENTE, EXECUTANDO)
+            ).fetchone()
+        return {
+            "tarefas": por_estado,
+            "cargas_pendentes": pendentes,
+            "cargas_em_andamento": em_andamento,
+            "falhas_registro": falhas_registro,
+        }
+
+
+class ExecutorTarefas:
+    """Threads que consomem a ``FilaTarefas``.
+
+    ``preparar(tarefa, carregar_grupos)`` monta, uma vez por tarefa, a função
+    que roteia uma carga (``dados -> ResultadoRota``) com as opções da tarefa;
+    o contexto (cliente, plano de trechos) fica guardado enquanto a tarefa
+    estiver ativa. ``carregar_grupos()`` lê todas as cargas da tarefa da fila
+    e só deve ser chamado quando o contexto precisa do lote inteiro. ``ao_concluir(tarefa, carga_id, resultado)`` é chamado a
+    cada carga gravada (ex.: totais por superfície e histórico).
+    """
+
+    def __init__(self, fila, preparar, trabalhadores=TRABALHADORES_PADRAO, ao_concluir=None):
+        self.fila = fila
+        self.preparar = preparar
+        self.trabalhadores = max(1, int(trabalhadores))
+        self.ao_concluir = ao_concluir
+        self._contextos = {}
+        self._lock = threading.Lock()
+        self._novo = threading.Event()
+        self._parar = threading.Event()
+        self._threads = []
+        self._ocupados = 0
+
+    def iniciar(self):
+        """Recupera as tarefas interrompidas e sobe os trabalhadores; retorna o próprio executor."""
+        self.fila.recuperar()
+        for i in range(self.trabalhadores):
+            thread = threading.Thread(target=self._trabalhar, name=f"roteirizador-tarefas-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def notificar(self):
+        """Acorda os trabalhadores ociosos (chamado após submeter ou retomar uma tarefa)."""
+        self._novo.set()
+
+    def submeter(self, tarefa_id, usuario, grupos, opcoes, descricao=None, max_paralelo=MAX_WORKERS_PADRAO,
+                 rotear_durante_leitura=True):
+        """Cria a tarefa e lê ``grupos`` numa thread própria; retorna o id sem esperar a leitura.
+
+        Quem chamou (o rerun do Streamlit) volta na hora: a leitura continua
+        mesmo que a página seja recarregada ou fechada, e os trabalhadores
+        começam pelas primeiras cargas enquanto o resto do arquivo é lido.
+        """
+        self.fila.criar(tarefa_id, usuario, opcoes, descricao, max_paralelo, rotear_durante_leitura)
+        thread = threading.Thread(target=self._ler, args=(tarefa_id, grupos),
+                                  name=f"roteirizador-leitura-{tarefa_id}", daemon=True)
+        thread.start()
+        return tarefa_id
+
+    def _ler(self, tarefa_id, grupos):
+        try:
+            self.fila.acrescentar(tarefa_id, grupos, ao_gravar=self.notificar)
+        except Exception:
+            # O erro já ficou gravado na tarefa, que aparece como falha no painel
+            _log.warning("Leitura da tarefa %s interrompida", tarefa_id, exc_info=True)
+
+    def cancelar(self, tarefa_id):
+        cancelada = self.fila.cancelar(tarefa_id)
+        self._descartar(tarefa_id)
+        return cancelada
+
+    def retomar(self, tarefa_id):
+        retomada = self.fila.retomar(tarefa_id)
+        self.notificar()
+        return retomada
+
+    def parar(self, timeout=None):
+        self._parar.set()
+        self._novo.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _contexto(self, tarefa_id):
+        with self._lock:
+            funcao = self._contextos.get(tarefa_id)
+        if funcao is None:
+            funcao = self.preparar(self.fila.obter(tarefa_id), lambda: self.fila.grupos(tarefa_id))
+            with self._lock:
+                funcao = self._contextos.setdefault(tarefa_id, funcao)
+        return funcao
+
+    def _descartar(self, tarefa_id):
+        with self._lock:
+            self._contextos.pop(tarefa_id, None)
+
+    def _trabalhar(self):
+        while not self._parar.is_set():
+            item = self.fila.reservar()
+            if item is None:
+                self._novo.wait(ESPERA_OCIOSA_S)
+                self._novo.clear()
+                continue
+            tarefa_id, ordem, carga_id, dados = item
+            with self._lock:
+                self._ocupados += 1
+            try:
+                rotear = self._contexto(tarefa_id)
+                try:
+                    resultado = rotear(dados)
+                except ERROS_QUE_PAUSAM:
+                    raise
+                except Exception as e:
+                    # Erro da própria carga: repetir daria o mesmo erro, então ela fica com falha e o lote segue
+                    resultado = ResultadoRota.falha(f"Erro inesperado: {type(e).__name__}: {e}")
+            except Exception as e:
+                # Cota diária, prazo ou contexto da tarefa que não pôde ser montado: a tarefa para e pode ser retomada
+                self.fila.devolver(tarefa_id, ordem, f"{type(e).__name__}: {e}")
+                self._descartar(tarefa_id)
+                continue
+            finally:
+                with self._lock:
+                    self._ocupados -= 1
+            ultima = self.fila.concluir(tarefa_id, ordem, resultado)
+            if self.ao_concluir is not None:
+                try:
+                    self.ao_concluir(tarefa_id, carga_id, resultado)
+                except Exception:
+                    # Gravações auxiliares (totais, histórico) não derrubam o trabalhador, mas ficam contadas na tarefa
+                    _log.exception("Falha ao registrar a carga %s da tarefa %s", carga_id, tarefa_id)
+                    self.fila.contar_falha_registro(tarefa_id)
+            if ultima:
+                self._descartar(tarefa_id)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "trabalhadores": self.trabalhadores,
+                "ocupados": self._ocupados,
+                "tarefas_com_contexto": len(self._contextos),
+            }
@@ -0,0 +1,351 @@
+"""Reaproveitamento de trechos repetidos entre as cargas de um lote.
+
+Numa planilha típica muitas cargas repetem o trecho depósito -> fazenda, ou
+fazem o caminho de volta de outra, e cada uma pedia a rota inteira ao ORS.
+``planejar_trechos`` conta, antes do roteamento, quantas vezes cada trecho
+(par de paradas consecutivas) aparece no lote, e ``ClienteTrechos`` usa essa
+contagem em cada ``directions``:
+
+- os trechos repetidos que compensam (ver ``PlanoTrechos``) são roteados
+  sozinhos, uma vez por lote, e servidos às outras cargas da memória do lote;
+- os demais trechos vizinhos continuam numa só requisição, então um lote sem
+  repetição faz as mesmas chamadas de antes;
+- a resposta da carga é montada juntando as partes: geometria, ``way_points``,
+  trechos de superfície e distância (a soma das partes, como o ORS faz na rota
+  com várias paradas). A normalização pela distância oficial, em
+  ``rotear_carga``, continua a mesma.
+
+Com ``reversiveis`` o trecho B -> A reaproveita A -> B invertido (geometria e
+superfícies de trás para frente). Só vale onde as vias são de mão dupla, como
+as estradas de fazenda; por isso vem desligado.
+
+Os ``avoid_polygons`` de cada parte são refeitos com as zonas do corredor da
+própria parte (``RegistroZonas``), como ``tentativas_rota`` faz com a carga:
+assim o mesmo trecho gera a mesma requisição em qualquer carga, e o cache
+persistente (``ClienteComCache``, por baixo deste cliente) também o
+reaproveita entre lotes.
+"""
+import threading
+from collections import Counter
+
+from roteirizador.cache_ors import PRECISAO_PADRAO, chave_requisicao
+from roteirizador.metricas import METRICAS
+from roteirizador.rotas import extrair_paradas
+from roteirizador.zonas import registro_padrao
+
+
+def _ponto(coordenada, precisao=PRECISAO_PADRAO):
+    return round(float(coordenada[0]), precisao), round(float(coordenada[1]), precisao)
+
+
+# --- PLANO DO LOTE ---
+
+
+class PlanoTrechos:
+    """Quais trechos do lote são roteados sozinhos e reaproveitados pelas cargas que os repetem.
+
+    Separar um trecho custa uma chamada e pode partir a requisição de cada
+    carga que o contém em duas (trecho no meio da carga) ou poupá-la inteira
+    (a carga é só aquele trecho). Os trechos repetidos são escolhidos de forma
+    gulosa, dos mais frequentes para os menos, e só quando diminuem o total de
+    chamadas do lote: o plano nunca faz mais chamadas que uma por carga.
+    """
+
+    def __init__(self, paradas_por_carga, reversiveis=False):
+        self.reversiveis = reversiveis
+        self.cargas = len(paradas_por_carga)
+        sequencias = [
+            [self.chave(origem, destino) for origem, destino in zip(paradas[:-1], paradas[1:])]
+            for paradas in paradas_por_carga
+        ]
+        self._contagem = Counter(chave for sequencia in sequencias for chave in sequencia)
+        self._separados = self._escolher(sequencias)
+        self.chamadas_planejadas = self._contar_chamadas(sequencias)
+
+    def chave(self, origem, destino):
+        a, b = _ponto(origem), _ponto(destino)
+        if self.reversiveis and b < a:
+            a, b = b, a
+        return a, b
+
+    def separado(self, origem, destino):
+        """O trecho é roteado sozinho (uma vez por lote) em vez de ir na requisição da carga."""
+        return self.chave(origem, destino) in self._separados
+
+    def _escolher(self, sequencias):
+        ocorrencias = {}
+        for i, sequencia in enumerate(sequencias):
+            for j, chave in enumerate(sequencia):
+                if self._contagem[chave] > 1 and chave[0] != chave[1]:
+                    ocorrencias.setdefault(chave, []).append((i, j))
+
+        separados = set()
+
+        def variacao(chave):
+            # Chamadas a mais (negativo: a menos) no lote se o trecho passar a ser separado
+            delta = 1
+            for i, j in ocorrencias[chave]:
+                sequencia = sequencias[i]
+                antes = j > 0 and sequencia[j - 1] not in separados
+                depois = j < len(sequencia) - 1 and sequencia[j + 1] not in separados
+                delta += int(antes and depois) - int(not antes and not depois)
+            return delta
+
+        candidatos = sorted(ocorrencias, key=lambda chave: -len(ocorrencias[chave]))
+        mudou = True
+        while mudou:
+            mudou = False
+            for chave in candidatos:
+                if chave not in separados and variacao(chave) < 0:
+                    separados.add(chave)
+                    mudou = True
+        return separados
+
+    def _contar_chamadas(self, sequencias):
+        # Primeiro degrau da escada: uma chamada por trecho separado e uma por sequência dos demais
+        chamadas = len(self._separados)
+        for sequencia in sequencias:
+            em_sequencia = False
+            for chave in sequencia:
+                if chave in self._separados:
+                    em_sequencia = False
+                elif not em_sequencia:
+                    chamadas += 1
+                    em_sequencia = True
+        return chamadas
+
+    def estatisticas(self):
+        return {
+            "Cargas": self.cargas,
+            "Trechos": sum(self._contagem.values()),
+            "Trechos Únicos": len(self._contagem),
+            "Trechos Repetidos": sum(1 for n in self._contagem.values() if n > 1),
+            "Trechos Reaproveitados": len(self._separados),
+            "Chamadas sem Reaproveitamento": self.cargas,
+            "Chamadas Planejadas": self.chamadas_planejadas,
+        }
+
+
+def planejar_trechos(grupos, reversiveis=False):
+    """``PlanoTrechos`` das cargas de ``grupos`` ((carga_id, dados)); cargas com paradas inválidas ficam de fora."""
+    paradas_por_carga = []
+    for _, dados in grupos:
+        coords_ors, erro = extrair_paradas(dados)
+        if erro is None:
+            paradas_por_carga.append(coords_ors)
+    return PlanoTrechos(paradas_por_carga, reversiveis)
+
+
+# --- MONTAGEM DAS RESPOSTAS ---
+
+
+def inverter_resposta(resposta):
+    """Resposta do ORS do caminho de volta: geometria, superfícies e ``way_points`` de trás para frente."""
+    feature = resposta['features'][0]
+    propriedades = feature['properties']
+    coords = feature['geometry']['coordinates'][::-1]
+    ultimo = len(coords) - 1
+    extras = dict(propriedades.get('extras', {}))
+    if 'surface' in extras:
+        superficie = dict(extras['surface'])
+        superficie['values'] = [[ultimo - fim, ultimo - inicio, valor]
+                                for inicio, fim, valor in reversed(superficie['values'])]
+        extras['surface'] = superficie
+    return {
+        **resposta,
+        "features": [{
+            **feature,
+            "geometry": {**feature['geometry'], "coordinates": coords},
+            "properties": {
+                **propriedades,
+                "way_points": [ultimo - w for w in reversed(propriedades.get('way_points', [0, ultimo]))],
+                "extras": extras,
+            },
+        }],
+    }
+
+
+def juntar_respostas(respostas):
+    """Uma resposta do ORS a partir das respostas de partes consecutivas da mesma rota."""
+    coords = []
+    valores = []
+    resumo_superficies = {}
+    way_points = []
+    distancia = duracao = 0.0
+    tem_superficie = False
+    for resposta in respostas:
+        feature = resposta['features'][0]
+        propriedades = feature['properties']
+        geometria = feature['geometry']['coordinates']
+        # A parte começa na parada em que a anterior terminou: o vértice de junção não se repete
+        inicio = len(coords) - 1 if coords and coords[-1] == geometria[0] else len(coords)
+        coords.extend(geometria[len(coords) - inicio:])
+
+        pontos = [inicio + w for w in propriedades.get('way_points', [0, len(geometria) - 1])]
+        way_points.extend(pontos if not way_points else pontos[1:])
+
+        superficie = propriedades.get('extras', {}).get('surface')
+        if superficie is not None:
+            tem_superficie = True
+            for a, b, valor in superficie['values']:
+                a, b = a + inicio, b + inicio
+                if valores and valores[-1][2] == valor and valores[-1][1] == a:
+                    valores[-1][1] = b
+                else:
+                    valores.append([a, b, valor])
+            # Só a distância soma entre as partes; o 'amount' (percentual) é refeito no fim
+            for item in superficie.get('summary', []):
+                soma = resumo_superficies.setdefault(item['value'], {**item, 'distance': 0.0})
+                soma['distance'] += item.get('distance', 0.0)
+
+        resumo = propriedades['summary']
+        distancia += resumo.get('distance', 0.0)
+        duracao += resumo.get('duration', 0.0)
+
+    lons = [c[0] for c in coords]
+    lats = [c[1] for c in coords]
+    bbox = [min(lons), min(lats), max(lons), max(lats)]
+    propriedades = {"summary": {"distance": distancia, "duration": duracao}, "way_points": way_points}
+    if tem_superficie:
+        superficie = {"values": valores}
+        if resumo_superficies:
+            total = sum(item['distance'] for item in resumo_superficies.values())
+            superficie["summary"] = [
+                {**item, 'amount': round(100 * item['distance'] / total, 2) if total else 0.0}
+                for item in resumo_superficies.values()
+            ]
+        propriedades["extras"] = {"surface": superficie}
+    return {
+        "type": "FeatureCollection",
+        "bbox": bbox,
+        "features": [{
+            "type": "Feature",
+            "bbox": bbox,
+            "geometry": {"type": "LineString", "coordinates": coords},
+            "properties": propriedades,
+        }],
+    }
+
+
+# --- CLIENTE ---
+
+
+class ClienteTrechos:
+    """Envolve um cliente ORS e roteia os trechos separados pelo ``plano`` uma vez por lote.
+
+    Deve ser criado para cada lote: a memória dos trechos vive enquanto ele existir.
+    """
+
+    def __init__(self, client, plano, zonas=None):
+        self.client = client
+        self.plano = plano
+        self.zonas = zonas if zonas is not None else registro_padrao()
+        self.requisicoes = 0
+        self.partes_roteadas = 0
+        self.reaproveitados = 0
+        self.invertidos = 0
+        self._respostas = {}
+        self._travas = {}
+        self._lock = threading.Lock()
+
+    def _partes(self, coordenadas):
+        """Divide as paradas em (coordenadas, separada), cortando só nos trechos separados pelo plano."""
+        partes = []
+        sequencia = None
+        for origem, destino in zip(coordenadas[:-1], coordenadas[1:]):
+            if self.plano.separado(origem, destino):
+                partes.append(([origem, destino], True))
+                sequencia = None
+            elif sequencia is None:
+                sequencia = [origem, destino]
+                partes.append((sequencia, False))
+            else:
+                sequencia.append(destino)
+        return partes
+
+    def _opcoes_parte(self, options, coordenadas):
+        if not options or 'avoid_polygons' not in options:
+            return options
+        opcoes = {k: v for k, v in options.items() if k != 'avoid_polygons'}
+        relevantes = self.zonas.zonas_no_corredor(coordenadas)
+        poligonos = self.zonas.poligonos_evitar(relevantes, coordenadas) if relevantes else None
+        if poligonos is not None:
+            opcoes['avoid_polygons'] = poligonos
+        return opcoes
+
+    def _chamar(self, coordenadas, options, kwargs):
+        parametros = dict(kwargs, coordinates=coordenadas)
+        if options is not None:
+            parametros['options'] = options
+        with self._lock:
+            self.partes_roteadas += 1
+        METRICAS.contar("roteirizador_trechos_total", origem="roteado")
+        return self.client.directions(**parametros)
+
+    def _chave(self, coordenadas, options, kwargs):
+        return chave_requisicao({**kwargs, 'coordinates': coordenadas, 'options': options})
+
+    def _trecho(self, coordenadas, options, kwargs):
+        """Resposta de um trecho separado: da memória do lote (ou do sentido oposto) ou do cliente."""
+        chave = self._chave(coordenadas, options, kwargs)
+        chave_volta = self._chave(coordenadas[::-1], options, kwargs) if self.plano.reversiveis else None
+        with self._lock:
+            resposta = self._obter(chave, chave_volta)
+            if resposta is not None:
+                return resposta
+            trava = self._travas.setdefault(chave, threading.Lock())
+        # Cargas em paralelo com o mesmo trecho esperam a primeira em vez de chamar de novo
+        with trava:
+            with self._lock:
+                resposta = self._obter(chave, chave_volta)
+                if resposta is not None:
+                    return resposta
+            resposta = self._chamar(coordenadas, options, kwargs)
+            with self._lock:
+                self._respostas[chave] = resposta
+                self._travas.pop(chave, None)
+        return resposta
+
+    def _obter(self, chave, chave_volta):
+        # Chamado com o lock
+        resposta = self._respostas.get(chave)
+        if resposta is not None:
+            self.reaproveitados += 1
+            METRICAS.contar("roteirizador_trechos_total", origem="reaproveitado")
+            return resposta
+        volta = self._respostas.get(chave_volta) if chave_volta is not None else None
+        if volta is not None:
+            self.invertidos += 1
+            METRICAS.contar("roteirizador_trechos_total", origem="invertido")
+            return inverter_resposta(volta)
+        return None
+
+    def directions(self, coordinates, options=None, **kwargs):
+        with self._lock:
+            self.requisicoes += 1
+        partes = self._partes(coordinates)
+        if len(partes) == 1 and not partes[0][1]:
+            # Nenhum trecho separado: a requisição da carga segue como veio
+            return self._chamar(coordinates, options, kwargs)
+
+        respostas = []
+        for coordenadas, separada in partes:
+            opcoes = self._opcoes_parte(options, coordenadas)
+            if separada:
+                respostas.append(self._trecho(coordenadas, opcoes, kwargs))
+            else:
+                respostas.append(self._chamar(coordenadas, opcoes, kwargs))
+        return juntar_respostas(respostas)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "Requisições das Cargas": self.requisicoes,
+                "Partes Roteadas": self.partes_roteadas,
+                "Trechos Reaproveitados": self.reaproveitados,
+                "Trechos Invertidos": self.invertidos,
+                "Trechos em Memória": len(self._respostas),
+            }
+
+    def __getattr__(self, nome):
+        return getattr(self.client, nome)
@@ -0,0 +1,238 @@
+"""Registro de zonas de restrição e dos desvios correspondentes, lido de um GeoJSON.
+
+O arquivo (padrão ``zonas_restricao.geojson`` ao lado deste módulo, ou o da
+variável ``ROTEIRIZADOR_ZONAS``) tem dois tipos de feature:
+
+- ``{"tipo": "zona", "nome": ..., "margem_km": 20}`` com geometria Polygon ou
+  MultiPolygon: área a evitar;
+- ``{"tipo": "desvio", "nome": ..., "zona": <nome da zona>, "raio_m": 2000}``
+  com geometria Point: waypoint que contorna a zona (ex.: Ponte BR-262).
+
+Cada zona é registrada numa grade de ``CELULAS_POR_GRAU`` nas células do seu
+bbox acrescido da margem. Para saber quais zonas importam a uma rota, só as
+células cruzadas pelos trechos retos entre as paradas são consultadas
+(``zonas_no_corredor``), sem percorrer a lista de zonas.
+
+Antes da requisição, as zonas relevantes são recortadas ao retângulo do
+corredor e simplificadas (``poligonos_evitar``). Rotas longas demais para
+``avoid_polygons`` (limite do ORS) recebem os desvios como waypoints
+(``com_desvios``).
+"""
+import hashlib
+import json
+import math
+import os
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from roteirizador.distancias import haversine_m
+from roteirizador.geometria import douglas_peucker
+from roteirizador.pontos_controle import METROS_POR_GRAU, PontoControle
+
+ARQUIVO_ZONAS_PADRAO = os.environ.get(
+    'ROTEIRIZADOR_ZONAS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zonas_restricao.geojson')
+)
+
+CELULAS_POR_GRAU = 4  # células de 0,25° (~28 km)
+MARGEM_PADRAO_KM = 20
+RAIO_DESVIO_PADRAO_M = 2000
+LIMITE_POLIGONOS_M = 150000  # distância máxima de rota com avoid_polygons no ORS público
+FATOR_ESTRADA = 1.3  # distância por estrada em relação à linha reta, para estimar o limite
+TOLERANCIA_GRAUS = 0.001  # ~110 m na simplificação dos polígonos enviados
+
+Zona = namedtuple('Zona', ['nome', 'aneis', 'bbox', 'margem_km', 'desvios'])
+
+
+def _celula(lon, lat):
+    return int(math.floor(lon * CELULAS_POR_GRAU)), int(math.floor(lat * CELULAS_POR_GRAU))
+
+
+def _margem_graus(margem_km, lat):
+    margem_lat = margem_km * 1000 / METROS_POR_GRAU
+    return margem_lat / max(math.cos(math.radians(lat)), 1e-6), margem_lat
+
+
+def _recortar_anel(anel, min_lon, min_lat, max_lon, max_lat):
+    """Sutherland–Hodgman do anel contra um retângulo; devolve o anel fechado ou None se vazio."""
+    pontos = [tuple(p) for p in anel[:-1]] if len(anel) > 1 and tuple(anel[0]) == tuple(anel[-1]) else [tuple(p) for p in anel]
+    bordas = (
+        (lambda p: p[0] >= min_lon, lambda a, b: (min_lon, a[1] + (b[1] - a[1]) * (min_lon - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[0] <= max_lon, lambda a, b: (max_lon, a[1] + (b[1] - a[1]) * (max_lon - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[1] >= min_lat, lambda a, b: (a[0] + (b[0] - a[0]) * (min_lat - a[1]) / (b[1] - a[1]), min_lat)),
+        (lambda p: p[1] <= max_lat, lambda a, b: (a[0] + (b[0] - a[0]) * (max_lat - a[1]) / (b[1] - a[1]), max_lat)),
+    )
+    for dentro, cruzamento in bordas:
+        if not pontos:
+            return None
+        entrada, pontos = pontos, []
+        anterior = entrada[-1]
+        for atual in entrada:
+            if dentro(atual):
+                if not dentro(anterior):
+                    pontos.append(cruzamento(anterior, atual))
+                pontos.append(atual)
+            elif dentro(anterior):
+                pontos.append(cruzamento(anterior, atual))
+            anterior = atual
+    if len(pontos) < 3:
+        return None
+    return pontos + [pontos[0]]
+
+
+class RegistroZonas:
+    """Zonas de restrição com índice em grade e os desvios de cada uma."""
+
+    def __init__(self, zonas=()):
+        self.zonas = list(zonas)
+        self._grade = defaultdict(set)
+        for i, zona in enumerate(self.zonas):
+            min_lon, min_lat, max_lon, max_lat = zona.bbox
+            margem_lon, margem_lat = _margem_graus(zona.margem_km, (min_lat + max_lat) / 2)
+            c0 = _celula(min_lon - margem_lon, min_lat - margem_lat)
+            c1 = _celula(max_lon + margem_lon, max_lat + margem_lat)
+            for cx in range(c0[0], c1[0] + 1):
+                for cy in range(c0[1], c1[1] + 1):
+                    self._grade[(cx, cy)].add(i)
+        texto = json.dumps([[z.nome, [a.tolist() for a in z.aneis], z.margem_km, z.desvios] for z in self.zonas],
+                           sort_keys=True)
+        self.assinatura = hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def de_geojson(cls, dados):
+        poligonos = defaultdict(list)
+        margens = {}
+        desvios = defaultdict(list)
+        for feature in dados.get('features', []):
+            propriedades = feature.get('properties') or {}
+            geometria = feature.get('geometry') or {}
+            nome = propriedades.get('nome')
+            if propriedades.get('tipo', 'zona') == 'desvio':
+                desvios[propriedades.get('zona')].append(PontoControle(
+                    nome, list(geometria['coordinates'][:2]), propriedades.get('raio_m', RAIO_DESVIO_PADRAO_M)
+                ))
+                continue
+            if geometria.get('type') == 'Polygon':
+                poligonos[nome].append(geometria['coordinates'][0])
+            elif geometria.get('type') == 'MultiPolygon':
+                poligonos[nome].extend(p[0] for p in geometria['coordinates'])
+            margens[nome] = propriedades.get('margem_km', MARGEM_PADRAO_KM)
+
+        zonas = []
+        for nome, aneis in poligonos.items():
+            aneis = [np.asarray(a, dtype=np.float64)[:, :2] for a in aneis]
+            todos = np.vstack(aneis)
+            bbox = (*todos.min(axis=0).tolist(), *todos.max(axis=0).tolist())
+            zonas.append(Zona(nome, aneis, bbox, margens[nome], desvios.get(nome, [])))
+        return cls(zonas)
+
+    @classmethod
+    def carregar(cls, caminho=ARQUIVO_ZONAS_PADRAO):
+        with open(caminho, encoding='utf-8') as f:
+            return cls.de_geojson(json.load(f))
+
+    # --- Consultas ---
+
+    def _celulas_trecho(self, a, b):
+        passos = max(1, int(max(abs(b[0] - a[0]), abs(b[1] - a[1])) * CELULAS_POR_GRAU * 2))
+        return {_celula(a[0] + (b[0] - a[0]) * k / passos, a[1] + (b[1] - a[1]) * k / passos)
+                for k in range(passos + 1)}
+
+    def zonas_no_trecho(self, a, b):
+        """Índices das zonas cuja área (com margem) está no caminho reto de ``a`` a ``b``."""
+        indices = set()
+        for celula in self._celulas_trecho(a, b):
+            indices |= self._grade.get(celula, set())
+        return sorted(indices)
+
+    def zonas_no_corredor(self, paradas):
+        indices = set()
+        for a, b in zip(paradas[:-1], paradas[1:]):
+            indices.update(self.zonas_no_trecho(a, b))
+        return [self.zonas[i] for i in sorted(indices)]
+
+    def zonas_na_area(self, bbox):
+        """Zonas com bbox que cruza ``bbox`` (para desenhar no mapa)."""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return [z for z in self.zonas
+                if z.bbox[0] <= max_lon and z.bbox[2] >= min_lon and z.bbox[1] <= max_lat and z.bbox[3] >= min_lat]
+
+    def listar(self):
+        return [{"Zona": z.nome, "Margem (km)": z.margem_km, "Desvios": ", ".join(d.nome for d in z.desvios)}
+                for z in self.zonas]
+
+    def estatisticas(self):
+        return {
+            "zonas": len(self.zonas),
+            "desvios": sum(len(z.desvios) for z in self.zonas),
+            "celulas_indexadas": len(self._grade),
+            "assinatura": self.assinatura,
+        }
+
+    def pontos_controle(self):
+        """Desvios de todas as zonas como pontos de controle do link do Google Maps."""
+        return tuple(d for z in self.zonas for d in z.desvios)
+
+    # --- Montagem da requisição ---
+
+    @staticmethod
+    def longa_para_poligonos(paradas, limite_m=LIMITE_POLIGONOS_M):
+        """Estimativa (linha reta x ``FATOR_ESTRADA``) de que a rota passa do limite de avoid_polygons."""
+        arr = np.asarray(paradas, dtype=np.float64)
+        reta = float(haversine_m(arr[:-1, 0], arr[:-1, 1], arr[1:, 0], arr[1:, 1]).sum())
+        return reta * FATOR_ESTRADA > limite_m
+
+    def poligonos_evitar(self, zonas, paradas, tolerancia=TOLERANCIA_GRAUS):
+        """MultiPolygon GeoJSON das ``zonas`` recortadas ao corredor das paradas e simplificadas."""
+        arr = np.asarray(paradas, dtype=np.float64)
+        min_lon, min_lat = arr.min(axis=0)[:2].tolist()
+        max_lon, max_lat = arr.max(axis=0)[:2].tolist()
+        poligonos = []
+        for zona in zonas:
+            margem_lon, margem_lat = _margem_graus(zona.margem_km, (min_lat + max_lat) / 2)
+            janela = (min_lon - margem_lon, min_lat - margem_lat, max_lon + margem_lon, max_lat + margem_lat)
+            for anel in zona.aneis:
+                recortado = _recortar_anel(anel.tolist(), *janela)
+                if recortado is None:
+                    continue
+                manter = douglas_peucker(recortado, tolerancia)
+                simplificado = [list(p) for p, m in zip(recortado, manter) if m]
+                if len(simplificado) >= 4:
+                    poligonos.append([simplificado])
+        if not poligonos:
+            return None
+        return {"type": "MultiPolygon", "coordinates": poligonos}
+
+    def com_desvios(self, paradas):
+        """Paradas com o melhor desvio de cada zona inserido nos trechos que passam por ela.
+
+        Retorna (paradas, nomes dos desvios usados); sem desvio aplicável,
+        os nomes vêm vazios.
+        """
+        resultado = [paradas[0]]
+        usados = []
+        for a, b in zip(paradas[:-1], paradas[1:]):
+            inseridos = []
+            for i in self.zonas_no_trecho(a, b):
+                desvios = self.zonas[i].desvios
+                if not desvios:
+                    continue
+                # O desvio que menos alonga o trecho a -> b
+                melhor = min(desvios, key=lambda d: float(
+                    haversine_m(a[0], a[1], *d.coordenada) + haversine_m(*d.coordenada, b[0], b[1])
+                ))
+                inseridos.append(melhor)
+            inseridos.sort(key=lambda d: float(haversine_m(a[0], a[1], *d.coordenada)))
+            for desvio in inseridos:
+                resultado.append(list(desvio.coordenada))
+                usados.append(desvio.nome)
+            resultado.append(b)
+        return resultado, usados
+
+
+@lru_cache(maxsize=None)
+def registro_padrao():
+    """Registro lido de ``ARQUIVO_ZONAS_PADRAO`` uma vez por processo."""
+    return RegistroZonas.carregar()
@@ -1,12 +1,28 @@
 import streamlit as st
-import pandas as pd
-import openrouteservice
-from geopy.distance import geodesic
-import re
-import folium
-from folium import plugins
-from streamlit_folium import st_folium
+import streamlit.components.v1 as components
 import json
+import io
+import tempfile
+from roteirizador.backends import BACKENDS, criar_cliente_backend
+from roteirizador.cache_ors import PRECISAO_PADRAO, CacheRotas, ClienteComCache
+from roteirizador.cliente_ors import PRAZO_LOTE_PADRAO, ClienteResiliente
+from roteirizador.constantes import COR_ASFALTO, COR_CHAO
+from roteirizador.custos import MODELO_PADRAO, ModeloCusto, TotaisSuperficies, comparar_modelos, novo_lote, superficies_conhecidas
+from roteirizador.despacho import MAX_WORKERS_PADRAO, ClienteLimitado, CotaDiariaEsgotada, LimitadorTaxa
+from roteirizador.distancias import MODOS_DISTANCIA, MODO_ELIPSOIDE
+from roteirizador.estimativa import HistoricoCorredores, estimar_cargas
+from roteirizador.exportacao import FORMATO_KML, FORMATOS, MIME_FORMATOS, documento_rota, exportar_zip
+from roteirizador.estrategias import MemoriaEstrategias
+from roteirizador.historico import MESES_PADRAO, HistoricoLotes
+from roteirizador.memo_rotas import MemoRotas
+from roteirizador.metricas import METRICAS
+from roteirizador.otimizacao import PRAZO_PADRAO_S
+from roteirizador.planilha import agrupar_cargas, iterar_cargas, ler_amostra, preparar_cargas, validar_coordenadas
+from roteirizador.rotas import linha_resumo, processar_rota
+from roteirizador.superficies import MODO_APRENDER, MODO_DESLIGADO, MODO_VERIFICAR, MODOS_INDICE, IndiceSuperficies
+from roteirizador.tarefas import CANCELADA, ESTADOS_ATIVOS, FALHOU, ExecutorTarefas, FilaTarefas
+from roteirizador.trechos import ClienteTrechos, planejar_trechos
+from roteirizador.zonas import ARQUIVO_ZONAS_PADRAO, registro_padrao
 
 st.set_page_config(page_title="Roteirizador Híbrido", layout="wide")
 
@@ -14,462 +30,360 @@ st.title("🚛 Calculadora de Rota: Asfalto vs Chão")
 st.markdown("""
 **Instruções:**
 Faça o upload da sua planilha (CSV ou Excel) contendo a coluna **Coordenadas** e a coluna **Número Carga**.
-O sistema vai processar cada carga separadamente e evitar rotas pelo Porto da Manga.
+O sistema vai processar cada carga separadamente e evitar rotas pelas zonas de restrição (ex.: Porto da Manga).
 """)
 
-# --- CONSTANTES ---
-UNPAVED_TYPES = ['unpaved', 'compacted', 'dirt', 'earth', 'gravel', 'fine_gravel', 'grass', 'ground', 'sand', 'wood', 'mud', 'clay', 'salt', 'ice', 'snow']
-
-ORS_SURFACE_MAPPING = {
-    0: "unknown", 1: "paved", 2: "unpaved", 3: "asphalt", 4: "concrete",
-    5: "cobblestone", 6: "metal", 7: "wood", 8: "compacted", 9: "fine_gravel",
-    10: "gravel", 11: "dirt", 12: "earth", 13: "ice", 14: "salt", 15: "sand",
-    16: "woodchips", 17: "grass", 18: "grass_paver"
-}
-
-# COORDENADAS E ZONA DE BLOQUEIO (PORTO DA MANGA)
-LAT_MANGA = -19.25973252213004
-LON_MANGA = -57.233418110785635
-OFFSET = 0.03 # Margem de ~3.3km para cada lado criando um quadrado de bloqueio seguro
-
-PORTO_MANGA_POLYGON = {
-    "type": "Polygon",
-    "coordinates": [[
-        [LON_MANGA - OFFSET, LAT_MANGA - OFFSET],
-        [LON_MANGA + OFFSET, LAT_MANGA - OFFSET],
-        [LON_MANGA + OFFSET, LAT_MANGA + OFFSET],
-        [LON_MANGA - OFFSET, LAT_MANGA + OFFSET],
-        [LON_MANGA - OFFSET, LAT_MANGA - OFFSET]
-    ]]
+MODO_CALCULO_COMPLETO = "Rota completa"
+MODO_CALCULO_ESTIMATIVA = "Estimativa rápida (matriz)"
+MODOS_CALCULO = [MODO_CALCULO_COMPLETO, MODO_CALCULO_ESTIMATIVA]
+INTERVALO_PAINEL_TAREFAS_S = 3
+ROTULOS_ESTADO_TAREFA = {
+    "pendente": "⏳ Na fila", "executando": "⚙️ Em andamento", "concluida": "✅ Concluída",
+    "cancelada": "⏹️ Cancelada", "falhou": "❌ Interrompida",
 }
 
-# PONTO DE DESVIO ESTRATÉGICO (Ponte BR-262 / Porto Morrinho)
-PONTE_BR262 = [-57.129748, -19.246586]
-
 # --- SIDEBAR ---
 with st.sidebar:
     st.header("⚙️ Configurações")
+    modo_distancia = st.selectbox(
+        "Precisão do cálculo de distância",
+        MODOS_DISTANCIA,
+        index=MODOS_DISTANCIA.index(MODO_ELIPSOIDE),
+        help="'elipsoide' = WGS-84 (mesmo resultado do geodesic); 'haversine' = esfera, mais rápido."
+    )
+    max_workers = st.number_input(
+        "Cargas processadas em paralelo",
+        min_value=1, max_value=16, value=MAX_WORKERS_PADRAO, step=1,
+        help="Limite por lote: os trabalhadores em segundo plano são divididos entre os lotes de todos os usuários. No ORS público as chamadas continuam limitadas pela cota por minuto/dia; nos servidores próprios o limite é a CPU."
+    )
+    precisao_cache = st.number_input(
+        "Casas decimais das coordenadas no cache",
+        min_value=2, max_value=7, value=PRECISAO_PADRAO, step=1,
+        help="Coordenadas são arredondadas antes de montar a chave do cache de rotas (5 casas ≈ 1 m)."
+    )
+    modo_calculo = st.radio(
+        "Modo de cálculo",
+        MODOS_CALCULO,
+        help="A estimativa usa a matriz do ORS (poucas chamadas para todas as cargas) e a proporção de chão histórica de cada trecho; a rota completa de uma carga é buscada ao abri-la."
+    )
+    otimizar_sequencia = st.checkbox(
+        "Otimizar sequência de paradas",
+        help="Reordena as paradas intermediárias de cada carga (a primeira e a última ficam fixas) pelo custo Asfalto +3% / Chão +9%, usando a matriz do ORS."
+    )
+    prazo_otimizacao_s = st.slider(
+        "Tempo máximo da otimização por carga (s)",
+        min_value=0.5, max_value=30.0, value=PRAZO_PADRAO_S, step=0.5,
+        disabled=not otimizar_sequencia
+    )
+    reaproveitar_trechos = st.checkbox(
+        "Reaproveitar trechos repetidos no lote",
+        value=True,
+        help="Trechos (par de paradas) que se repetem entre as cargas são roteados uma vez só e reaproveitados, quando isso poupa chamadas."
+    )
+    trechos_reversiveis = st.checkbox(
+        "Ida e volta pelo mesmo caminho",
+        disabled=not reaproveitar_trechos,
+        help="O trecho B → A reaproveita A → B invertido. Só vale onde as vias são de mão dupla (estradas de fazenda)."
+    )
+    nome_backend = st.selectbox(
+        "Servidor de rotas",
+        list(BACKENDS),
+        format_func=lambda nome: BACKENDS[nome].descricao,
+        help="Os servidores próprios (grafo local do MS) não têm cota nem o limite de 150 km dos polígonos; o lote passa a depender só da CPU."
+    )
+    backend = BACKENDS[nome_backend]
+    url_backend = None
+    if backend.url_padrao:
+        url_backend = st.text_input("URL do servidor", value=backend.url_padrao)
+    usuario = st.text_input(
+        "Usuário",
+        value=st.user.get("email") or "anônimo",
+        help="Os lotes ficam numa fila em segundo plano; os trabalhadores são divididos de forma justa entre os usuários."
+    )
     api_key = "eyJvcmciOiI1YjNjZTM1OTc4NTExMTAwMDFjZjYyNDgiLCJpZCI6ImU5OTg5N2VmZmI5MzRjYjk5YjkwNTRkNzY3MGMxZDE2IiwiaCI6Im11cm11cjY0In0="
 
-# --- FUNÇÕES DE LIMPEZA E CONVERSÃO ---
-def dms_para_decimal(dms_str):
-    dms_str = dms_str.replace(',', '.')
-    dms_str = dms_str.upper().strip()
-    sign = -1 if 'S' in dms_str or 'W' in dms_str or 'O' in dms_str else 1
-    
-    parts = re.split(r'[^\d\.]+', dms_str)
-    parts = [float(x) for x in parts if x]
-    
-    if len(parts) >= 3:
-        return sign * (parts[0] + (parts[1] / 60) + (parts[2] / 3600))
-    elif len(parts) >= 2:
-        return sign * (parts[0] + (parts[1] / 60))
-    elif len(parts) == 1:
-        return sign * float(parts[0])
-    return None
-
-def limpar_e_converter(texto):
-    texto = str(texto).strip().upper()
-    try:
-        if any(c in texto for c in ['S', 'W', 'N', 'E', 'O', '°', 'º']):
-            padrao = r"[\d\.,]+[°º\s]+[\d\.,]+[′'\s]+[\d\.,]+[″\"\s]*[NSEWO]"
-            matches = re.findall(padrao, texto)
-            if len(matches) >= 2:
-                lat = dms_para_decimal(matches[0])
-                lon = dms_para_decimal(matches[1])
-                return lat, lon
-            return None, None
-
-        texto_limpo = texto.replace(';', ' ').replace(',', '.') 
-        numeros = re.findall(r'-?\d+\.\d+|-?\d+', texto.replace(',', '.'))
-        
-        if len(numeros) >= 2:
-            lat = float(numeros[0])
-            lon = float(numeros[1])
-            if abs(lat) <= 90 and abs(lon) <= 180:
-                return lat, lon
-    except Exception as e:
-        pass
-    return None, None
-
-# --- FUNÇÃO GERADORA DE KML ---
-def gerar_kml(geometry_coords, nome_rota):
-    kml_content = """<?xml version="1.0" encoding="UTF-8"?>
-<kml xmlns="http://www.opengis.net/kml/2.2">
-  <Document>
-    <name>{}</name>
-    <Style id="lineStyle">
-      <LineStyle>
-        <color>ff0000ff</color>
-        <width>4</width>
-      </LineStyle>
-    </Style>
-    <Placemark>
-      <name>Trajeto</name>
-      <styleUrl>#lineStyle</styleUrl>
-      <LineString>
-        <tessellate>1</tessellate>
-        <coordinates>""".format(nome_rota)
-    
-    coords_str = " ".join([f"{lon},{lat},0" for lon, lat in geometry_coords])
-    
-    kml_footer = """</coordinates>
-      </LineString>
-    </Placemark>
-  </Document>
-</kml>"""
-    return kml_content + coords_str + kml_footer
-
-# --- FUNÇÃO DE GERAÇÃO DE MAPA ---
-def gerar_mapa_folium(route, coords_ors):
-    start_lat = coords_ors[0][1]
-    start_lon = coords_ors[0][0]
-    m = folium.Map(location=[start_lat, start_lon], zoom_start=12, tiles='OpenStreetMap')
-
-    # Adiciona camadas extras (Satélite e Mapa Claro)
-    folium.TileLayer('cartodbpositron', name='Mapa Claro').add_to(m)
-    folium.TileLayer(
-        tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-        attr='Esri',
-        name='Satélite',
-        overlay=False,
-        control=True
-    ).add_to(m)
-    
-    folium.TileLayer(
-        tiles='https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
-        attr='Google',
-        name='Google Satélite',
-        overlay=False,
-        control=True
-    ).add_to(m)
-
-    folium.TileLayer(
-        tiles='https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}',
-        attr='Google',
-        name='Google Híbrido',
-        overlay=False,
-        control=True
-    ).add_to(m)
-
-    extras = route['features'][0]['properties']['extras']['surface']
-    geometry = route['features'][0]['geometry']['coordinates']
-    
-    lookup_surface = {}
-    lookup_surface.update(ORS_SURFACE_MAPPING) 
-    
-    if 'summary' in extras:
-        for item in extras['summary']:
-            if 'name' in item: 
-                lookup_surface[item['value']] = item['name']
+# --- LIMITADOR DE TAXA (um por chave da API; o contador diário é somado ao do CLI pelo SQLite) ---
+@st.cache_resource
+def obter_limitador(chave):
+    return LimitadorTaxa(chave=chave)
 
-    surface_segments = extras['values']
-    
-    for seg in surface_segments:
-        start_idx, end_idx, surf_type = seg
-        if isinstance(surf_type, int) and surf_type in lookup_surface:
-            surf_type = lookup_surface[surf_type]
-            
-        segment_coords = [[c[1], c[0]] for c in geometry[start_idx : end_idx + 1]]
-        
-        eh_chao = surf_type in UNPAVED_TYPES
-        color = '#8B4513' if eh_chao else '#555555'
-        tipo_pt = "Chão (+9%)" if eh_chao else "Asfalto (+3%)"
-        tooltip_text = f"Superfície: {surf_type} | Status: {tipo_pt}"
-
-        folium.PolyLine(segment_coords, color=color, weight=5, opacity=0.8, tooltip=tooltip_text).add_to(m)
-
-    for i, coord in enumerate(coords_ors):
-        folium.Marker(
-            location=[coord[1], coord[0]],
-            tooltip=f"Ponto {i+1}",
-            icon=folium.Icon(color="green" if i == 0 else "red" if i == len(coords_ors)-1 else "blue", icon="info-sign")
-        ).add_to(m)
-
-    # Adiciona a zona de bloqueio do Porto da Manga no mapa apenas para visualização
-    zona_bloqueio = [[lat, lon] for lon, lat in PORTO_MANGA_POLYGON['coordinates'][0]]
-    folium.Polygon(zona_bloqueio, color='red', fill=True, fillOpacity=0.2, tooltip="Zona de Restrição: Porto da Manga").add_to(m)
-
-    bbox = route['bbox'] 
-    m.fit_bounds([[bbox[1], bbox[0]], [bbox[3], bbox[2]]])
-
-    # Plugins de utilidade para logística
-    plugins.Fullscreen(
-        position='topleft',
-        title='Tela Cheia',
-        title_cancel='Sair',
-        force_separate_button=True
-    ).add_to(m)
-    plugins.MousePosition(position='topright').add_to(m)
-    plugins.MeasureControl(position='bottomleft', primary_length_unit='kilometers').add_to(m)
-    folium.LayerControl().add_to(m)
-    
-    legend_html = '''
-     <div style="position: fixed; bottom: 50px; right: 50px; width: 130px; height: 90px; z-index:9999; font-size:14px; background-color: white; border:2px solid grey; border-radius:6px; padding: 10px; opacity: 0.9;">
-     <b>Legenda</b><br>
-     <i style="background: #555555; width: 18px; height: 18px; float: left; margin-right: 8px; opacity: 0.8;"></i> Asfalto<br>
-     <i style="background: #8B4513; width: 18px; height: 18px; float: left; margin-right: 8px; opacity: 0.8;"></i> Chão
-     </div>
-     '''
-    m.get_root().html.add_child(folium.Element(legend_html))
-    return m
-
-# --- PROCESSAMENTO INDIVIDUAL DA ROTA ---
-def processar_rota(client, dados_carga):
-    coords_raw_list = dados_carga['Coordenada'].tolist()
-    total_manual = dados_carga['KM Adicional'].fillna(0).sum()
-    
-    coords_ors = []
-    coords_gmaps_orig = []
-    
-    for c_raw in coords_raw_list:
-        lat, lon = limpar_e_converter(c_raw)
-        
-        if lat is None:
-            return None, None, None, None, None, None, None, f"Erro no formato da coordenada: {c_raw}"
-            
-        coords_ors.append([lon, lat])
-        coords_gmaps_orig.append(f"{lat},{lon}")
-
-    if len(coords_ors) < 2:
-        return None, None, None, None, None, None, None, "Erro: Mínimo 2 pontos necessários para traçar uma rota."
-
-    aviso_restricao = None
-    try:
-        # A Mágica de bloqueio acontece aqui no campo 'options'
-        route = client.directions(
-            coordinates=coords_ors,
-            profile='driving-hgv',
-            format='geojson',
-            extra_info=['surface'],
-            options={
-                "avoid_polygons": PORTO_MANGA_POLYGON,
-                "avoid_features": ["ferries"]
-            }
+# --- CLIENTE DE ROTAS (pool de conexões e retentativas compartilhados entre sessões, um por servidor e chave) ---
+@st.cache_resource
+def obter_cliente_rotas(nome_backend, chave, url):
+    backend = BACKENDS[nome_backend]
+    client = criar_cliente_backend(backend, chave, url)
+    if backend.limitar_taxa:
+        # As retentativas ficam por fora do limitador: cada repetição também espera a sua ficha
+        client = ClienteLimitado(client, obter_limitador(chave))
+    return ClienteResiliente(client)
+
+# --- CACHE PERSISTENTE DE ROTAS (sobrevive a reinícios e é compartilhado entre sessões) ---
+@st.cache_resource
+def obter_cache_rotas(precisao):
+    return CacheRotas(precisao=precisao)
+
+cache_rotas = obter_cache_rotas(precisao_cache)
+
+with st.sidebar:
+    with st.expander("🗄️ Cache de Rotas", key="exp_cache_rotas", on_change="rerun") as exp_cache_rotas:
+        if exp_cache_rotas.open:
+            st.json(cache_rotas.estatisticas())
+            if st.button("Limpar cache de rotas"):
+                cache_rotas.limpar()
+
+# --- MEMÓRIA DE ESTRATÉGIAS DO ERRO 2004 ---
+@st.cache_resource
+def obter_memoria_estrategias():
+    return MemoriaEstrategias()
+
+memoria_estrategias = obter_memoria_estrategias()
+
+with st.sidebar:
+    with st.expander("🧠 Memória de Estratégias (Erro 2004)", key="exp_estrategias", on_change="rerun") as exp_estrategias:
+        if exp_estrategias.open:
+            st.caption(f"Atalhos usados: {memoria_estrategias.atalhos} | Invalidações: {memoria_estrategias.invalidacoes}")
+            st.dataframe(memoria_estrategias.listar(), hide_index=True)
+            if st.button("Resetar memória de estratégias"):
+                memoria_estrategias.limpar()
+
+# --- ÍNDICE LOCAL DE SUPERFÍCIES POR SEGMENTO ---
+@st.cache_resource
+def obter_indice_superficies():
+    return IndiceSuperficies()
+
+indice_superficies = obter_indice_superficies()
+
+with st.sidebar:
+    with st.expander("🧭 Índice Local de Superfícies", key="exp_indice_superficies", on_change="rerun") as exp_indice_superficies:
+        modo_indice = st.radio(
+            "Uso do índice",
+            MODOS_INDICE,
+            index=MODOS_INDICE.index(MODO_APRENDER),
+            help="'aprender' grava as superfícies de cada rota; 'verificar' também sinaliza trechos em que a resposta nova diverge do que já era conhecido."
         )
-    except Exception as e:
-        # Se o erro for limite de distância (Code 2004), tenta sem o bloqueio
-        if '2004' in str(e):
-            rota_calculada = False
-            
-            # TENTATIVA 2: Forçar passagem pela Ponte BR-262
-            # Cenário A: Rota Simples (A -> B)
-            if len(coords_ors) == 2:
-                try:
-                    coords_desvio = [coords_ors[0], PONTE_BR262, coords_ors[1]]
-                    route = client.directions(
-                        coordinates=coords_desvio,
-                        profile='driving-hgv',
-                        format='geojson',
-                        extra_info=['surface']
-                    )
-                    aviso_restricao = "✅ Rota >150km. Desvio automático via Ponte BR-262 aplicado."
-                    coords_ors = coords_desvio # Atualiza para mostrar o ponto extra no mapa
-                    rota_calculada = True
-                except Exception:
-                    pass 
-            
-            # Cenário B: Rota Ida e Volta (A -> B -> A)
-            elif len(coords_ors) == 3:
-                # Verifica se o último ponto é próximo do primeiro (indica retorno)
-                start_pt = (coords_ors[0][1], coords_ors[0][0])
-                end_pt = (coords_ors[-1][1], coords_ors[-1][0])
-                if geodesic(start_pt, end_pt).km < 10: # 10km de tolerância para considerar retorno
-                    try:
-                        # Insere a ponte na ida E na volta: A -> Ponte -> B -> Ponte -> A
-                        coords_desvio = [coords_ors[0], PONTE_BR262, coords_ors[1], PONTE_BR262, coords_ors[2]]
-                        route = client.directions(
-                            coordinates=coords_desvio,
-                            profile='driving-hgv',
-                            format='geojson',
-                            extra_info=['surface']
-                        )
-                        aviso_restricao = "✅ Rota Ida/Volta >150km. Desvio Ponte BR-262 aplicado (2x)."
-                        coords_ors = coords_desvio
-                        rota_calculada = True
-                    except Exception:
-                        pass
-            
-            # TENTATIVA 3: Se o polígono falhou, tenta pelo menos evitar BALSAS (mais leve para a API)
-            if not rota_calculada:
-                try:
-                    route = client.directions(
-                        coordinates=coords_ors, 
-                        profile='driving-hgv', 
-                        format='geojson', 
-                        extra_info=['surface'],
-                        options={'avoid_features': ['ferries']}
-                    )
-                    aviso_restricao = "⚠️ Rota >150km. Polígono ignorado, mas BALSAS evitadas."
-                    rota_calculada = True
-                except Exception:
-                    pass
-
-            # TENTATIVA 4: Fallback final (libera a rota original sem bloqueios)
-            if not rota_calculada:
-                try:
-                    aviso_restricao = "⚠️ Rota >150km. Bloqueio Porto da Manga ignorado (Limite API)."
-                    route = client.directions(coordinates=coords_ors, profile='driving-hgv', format='geojson', extra_info=['surface'])
-                except Exception as e2:
-                    return None, None, None, None, None, None, None, f"Erro API (Tentativa sem bloqueio falhou): {e2}"
-        else:
-            return None, None, None, None, None, None, None, f"Erro API (O trajeto pode ser impossível sem a balsa?): {e}"
+        if exp_indice_superficies.open:
+            st.json(indice_superficies.estatisticas())
+            if st.button("Limpar índice de superfícies"):
+                indice_superficies.limpar()
 
-    extras = route['features'][0]['properties']['extras']['surface']
-    geometry = route['features'][0]['geometry']['coordinates']
-    
-    # --- AJUSTE INTELIGENTE DO LINK GOOGLE MAPS ---
-    # Verifica se a rota calculada passou pela Ponte BR-262. Se sim, força esse ponto no link.
-    coords_para_link = list(coords_ors)
-    ponte_lat_lon = (PONTE_BR262[1], PONTE_BR262[0])
-    passou_pela_ponte = False
-
-    for pt in geometry: # pt = [lon, lat]
-        # Otimização: Checagem rápida de bounding box (~5km) antes do cálculo geodésico
-        if abs(pt[1] - ponte_lat_lon[0]) < 0.05 and abs(pt[0] - ponte_lat_lon[1]) < 0.05:
-            if geodesic((pt[1], pt[0]), ponte_lat_lon).km < 2.0:
-                passou_pela_ponte = True
-                break
-    
-    if passou_pela_ponte:
-        # Se passou pela ponte mas ela não estava na lista original, adiciona para o Google Maps obedecer
-        if len(coords_ors) == 2:
-             coords_para_link = [coords_ors[0], PONTE_BR262, coords_ors[1]]
-        elif len(coords_ors) == 3:
-             # Se for ida e volta (pontas próximas), adiciona na ida e na volta
-             if geodesic((coords_ors[0][1], coords_ors[0][0]), (coords_ors[-1][1], coords_ors[-1][0])).km < 10:
-                 coords_para_link = [coords_ors[0], PONTE_BR262, coords_ors[1], PONTE_BR262, coords_ors[2]]
-
-    dist_paved = 0
-    dist_unpaved = 0
-    
-    lookup_surface = {}
-    lookup_surface.update(ORS_SURFACE_MAPPING) 
-    
-    if 'summary' in extras:
-        for item in extras['summary']:
-            if 'name' in item: 
-                lookup_surface[item['value']] = item['name']
+# --- MEMÓRIA DE RESULTADOS POR CARGA (COMPARTILHADA ENTRE SESSÕES) ---
+@st.cache_resource
+def obter_memo_rotas():
+    return MemoRotas()
 
-    debug_segments = []
-    resumo_tipos = {} 
-    
-    for seg in extras['values']:
-        start, end, surf = seg[0], seg[1], seg[2]
-        
-        if isinstance(surf, int) and surf in lookup_surface:
-            surf = lookup_surface[surf]
-            
-        seg_d = 0
-        for i in range(start, end):
-            p1, p2 = geometry[i], geometry[i+1]
-            seg_d += geodesic((p1[1], p1[0]), (p2[1], p2[0])).meters
-        
-        is_unpaved = surf in UNPAVED_TYPES
-        
-        if is_unpaved:
-            dist_unpaved += seg_d
-        else:
-            dist_paved += seg_d
-            
-        surf_key = str(surf) if surf else "Não Informado (Assumido Asfalto)"
-        if surf_key not in resumo_tipos:
-            resumo_tipos[surf_key] = 0
-        resumo_tipos[surf_key] += seg_d
-            
-        p_start = geometry[start] 
-        p_end = geometry[end]     
-
-        debug_segments.append({
-            "Tag_Original": surf,
-            "Classificacao_App": "Chão" if is_unpaved else "Asfalto",
-            "Distancia_m": round(seg_d, 1),
-            "Coord_Inicio": f"{p_start[1]:.5f}, {p_start[0]:.5f}",
-            "Coord_Fim": f"{p_end[1]:.5f}, {p_end[0]:.5f}"
-        })
-
-    # --- AJUSTE DE PRECISÃO (NORMALIZAÇÃO) ---
-    # A geometria (pontos) é uma simplificação visual. A distância do 'summary' é a real do odômetro.
-    # Ajustamos proporcionalmente os segmentos para que a soma bata com a distância oficial.
-    official_distance = route['features'][0]['properties']['summary']['distance']
-    total_calculated = dist_paved + dist_unpaved
-    
-    if total_calculated > 0:
-        factor = official_distance / total_calculated
-        dist_paved *= factor
-        dist_unpaved *= factor
-
-    km_paved = dist_paved / 1000
-    km_unpaved = dist_unpaved / 1000
-    total = (km_unpaved * 1.09) + (km_paved * 1.03) + total_manual
-
-    # Gera o link baseado nas coordenadas FINAIS (coords_ors), que podem conter o desvio da ponte
-    # Usa coords_para_link para garantir que o Google Maps siga o desvio da ponte se necessário
-    link = "https://www.google.com/maps/dir/" + "/".join([f"{c[1]},{c[0]}" for c in coords_para_link])
-    
-    detalhes = {
-        "Asfalto (KM)": round(km_paved, 2),
-        "Chão (KM)": round(km_unpaved, 2),
-        "Total KM (Asfalto + Chão)": round(km_paved + km_unpaved, 2),
-        "Adicional (KM)": round(total_manual, 2),
-        "Custo Asfalto (+3%)": round(km_paved * 1.03, 2),
-        "Custo Chão (+9%)": round(km_unpaved * 1.09, 2),
-        "Total Custo (Asfalto + Chão)": round((km_paved * 1.03) + (km_unpaved * 1.09), 2)
-    }
-    
-    if aviso_restricao:
-        detalhes["⚠️ AVISO"] = aviso_restricao
-    
-    return total, link, detalhes, route, coords_ors, debug_segments, resumo_tipos, None
+memo_rotas = obter_memo_rotas()
+
+with st.sidebar:
+    with st.expander("🧠 Resultados em Memória", key="exp_memo", on_change="rerun") as exp_memo:
+        st.caption("Cargas cujas coordenadas e opções não mudaram não são roteadas de novo; só o KM Adicional e os custos são recalculados.")
+        if exp_memo.open:
+            st.json(memo_rotas.estatisticas())
+            if st.button("Limpar resultados em memória"):
+                memo_rotas.limpar()
+
+# --- TOTAIS POR SUPERFÍCIE DE CADA LOTE (RECÁLCULO DE CUSTOS SEM O ORS) ---
+@st.cache_resource
+def obter_totais_superficies():
+    return TotaisSuperficies()
+
+totais_superficies = obter_totais_superficies()
+
+with st.sidebar:
+    with st.expander("💰 Totais por Superfície (Recálculo)", key="exp_totais", on_change="rerun") as exp_totais:
+        st.caption("Metros por tipo de superfície de cada carga roteada. Permitem recalcular o custo de lotes antigos com outro modelo, sem chamar o ORS.")
+        if exp_totais.open:
+            st.json(totais_superficies.estatisticas())
+            if st.button("Limpar totais gravados"):
+                totais_superficies.limpar()
+
+# --- HISTÓRICO DE LOTES (RESUMO POR CARGA E TOTAIS MENSAIS PARA O DASHBOARD) ---
+@st.cache_resource
+def obter_historico_lotes():
+    return HistoricoLotes()
+
+historico_lotes = obter_historico_lotes()
+
+with st.sidebar:
+    with st.expander("📅 Histórico de Lotes", key="exp_historico_lotes", on_change="rerun") as exp_historico_lotes:
+        st.caption("Resumo de cada carga calculada, com totais mensais pré-agregados para o histórico do dashboard.")
+        if exp_historico_lotes.open:
+            st.json(historico_lotes.estatisticas())
+            if st.button("Limpar histórico"):
+                historico_lotes.limpar()
+
+# --- ZONAS DE RESTRIÇÃO (lidas do GeoJSON uma vez por processo) ---
+registro_zonas = registro_padrao()
+
+with st.sidebar:
+    with st.expander("🚧 Zonas de Restrição", key="exp_zonas", on_change="rerun") as exp_zonas:
+        st.caption(f"Arquivo: {ARQUIVO_ZONAS_PADRAO} (variável ROTEIRIZADOR_ZONAS). Só as zonas no corredor de cada carga entram na requisição.")
+        if exp_zonas.open:
+            st.dataframe(registro_zonas.listar(), hide_index=True)
+            st.json(registro_zonas.estatisticas())
+
+# --- MÉTRICAS DE DESEMPENHO ---
+with st.sidebar:
+    METRICAS.habilitado = st.checkbox(
+        "⏱️ Coletar métricas de desempenho",
+        value=METRICAS.habilitado,
+        help="Mede o tempo de cada etapa (ORS, escada de fallback, classificação, mapa, KML). Desligado não custa nada."
+    )
+
+# --- HISTÓRICO ASFALTO/CHÃO POR TRECHO (ALIMENTA O MODO ESTIMATIVA) ---
+@st.cache_resource
+def obter_historico_corredores():
+    return HistoricoCorredores()
+
+historico_corredores = obter_historico_corredores()
+
+with st.sidebar:
+    with st.expander("📐 Histórico de Trechos (Estimativa)", key="exp_corredores", on_change="rerun") as exp_corredores:
+        st.caption("Proporção de chão aprendida de cada rota completa, usada pelo modo estimativa.")
+        if exp_corredores.open:
+            st.json(historico_corredores.estatisticas())
+            if st.button("Limpar histórico de trechos"):
+                historico_corredores.limpar()
+
+def montar_cliente():
+    # O cache fica na frente do cliente: respostas já conhecidas não gastam cota nem rede
+    return ClienteComCache(obter_cliente_rotas(nome_backend, api_key, url_backend).para_lote(PRAZO_LOTE_PADRAO), cache_rotas)
+
+def rotear(client, df_carga):
+    return processar_rota(
+        client, df_carga, modo_distancia, memoria_estrategias,
+        indice_superficies if modo_indice != MODO_DESLIGADO else None,
+        verificar_superficies=(modo_indice == MODO_VERIFICAR),
+        memo_rotas=memo_rotas,
+        historico_corredores=historico_corredores,
+        otimizar_sequencia=otimizar_sequencia,
+        prazo_otimizacao_s=prazo_otimizacao_s,
+        zonas=registro_zonas
+    )
+
+# --- FILA DE TAREFAS EM SEGUNDO PLANO (o lote sobrevive a reruns, refresh e reinícios do servidor) ---
+def preparar_tarefa(tarefa, carregar_grupos):
+    # Roda nas threads do executor: usa só as opções gravadas na tarefa e os recursos compartilhados
+    opcoes = tarefa.opcoes
+    # Sem prazo de lote: a tarefa pode ser cancelada e retomada
+    client = ClienteComCache(obter_cliente_rotas(opcoes["backend"], api_key, opcoes["url_backend"]),
+                             obter_cache_rotas(opcoes["precisao_cache"]))
+    if opcoes["reaproveitar_trechos"]:
+        # Só o plano de trechos precisa do lote inteiro; sem ele as cargas não são lidas da fila
+        client = ClienteTrechos(client, planejar_trechos(carregar_grupos(), opcoes["trechos_reversiveis"]), registro_zonas)
+    return lambda dados: processar_rota(
+        client, dados, opcoes["modo_distancia"], memoria_estrategias,
+        indice_superficies if opcoes["modo_indice"] != MODO_DESLIGADO else None,
+        verificar_superficies=(opcoes["modo_indice"] == MODO_VERIFICAR),
+        memo_rotas=memo_rotas,
+        historico_corredores=historico_corredores,
+        otimizar_sequencia=opcoes["otimizar_sequencia"],
+        prazo_otimizacao_s=opcoes["prazo_otimizacao_s"],
+        zonas=registro_zonas
+    )
+
+def registrar_carga_tarefa(tarefa_id, carga_id, resultado):
+    # Totais por superfície e histórico gravados carga a carga, como no CLI
+    descricao = fila_tarefas.obter(tarefa_id).descricao
+    totais_superficies.registrar_lote(tarefa_id, {carga_id: resultado}, descricao)
+    historico_lotes.registrar_lote(tarefa_id, {carga_id: resultado}, descricao)
+
+@st.cache_resource
+def obter_fila_tarefas():
+    return FilaTarefas()
+
+@st.cache_resource
+def obter_executor_tarefas():
+    # Um pool por processo; ao subir, retoma as tarefas interrompidas por um reinício
+    return ExecutorTarefas(fila_tarefas, preparar_tarefa, ao_concluir=registrar_carga_tarefa).iniciar()
+
+fila_tarefas = obter_fila_tarefas()
+executor_tarefas = obter_executor_tarefas()
+
+with st.sidebar:
+    with st.expander("🗂️ Fila de Tarefas", key="exp_fila", on_change="rerun") as exp_fila:
+        st.caption("Lotes de rota completa rodam em segundo plano e ficam gravados; recarregar a página não perde o trabalho.")
+        if exp_fila.open:
+            st.json({**fila_tarefas.estatisticas(), **executor_tarefas.estatisticas()})
+
+# --- EXPORTAÇÃO EM LOTE ---
+def zip_rotas(resultados, formatos, casas):
+    # O zip é escrito carga a carga num arquivo temporário, não em memória
+    arquivo = tempfile.TemporaryFile()
+    with METRICAS.cronometrar("exportacao"):
+        exportar_zip(arquivo, resultados, formatos, casas)
+    arquivo.seek(0)
+    return arquivo
+
+# --- ACOMPANHAMENTO DA TAREFA ABERTA NA SESSÃO ---
+def seguir_tarefa(tarefa_id):
+    tarefa = fila_tarefas.obter(tarefa_id)
+    st.session_state['tarefa_atual'] = tarefa_id
+    st.session_state['tarefa_sequencia'] = 0
+    st.session_state['resultados_tarefa'] = {}
+    st.session_state['dados_rota'] = {}
+    st.session_state['lote_atual'] = (tarefa_id, tarefa.descricao)
+    st.session_state['mapas_html'] = {}
+    # A tarefa fica na URL: recarregar a página volta para ela
+    st.query_params['tarefa'] = tarefa_id
+
+def atualizar_resultados_tarefa():
+    """Traz da fila os resultados gravados desde a última leitura; retorna quantos chegaram."""
+    tarefa_id = st.session_state['tarefa_atual']
+    if tarefa_id is None:
+        return 0
+    novos, ultima = fila_tarefas.resultados(tarefa_id, st.session_state['tarefa_sequencia'])
+    if novos:
+        por_ordem = st.session_state['resultados_tarefa']
+        for ordem, carga_id, resultado in novos:
+            por_ordem[ordem] = (carga_id, resultado)
+        # Dashboard na ordem da planilha, não na ordem de conclusão
+        st.session_state['dados_rota'] = {carga_id: resultado for _, (carga_id, resultado) in sorted(por_ordem.items())}
+        st.session_state['tarefa_sequencia'] = ultima
+    return len(novos)
 
 # --- INTERFACE ---
 if 'dados_rota' not in st.session_state:
     st.session_state['dados_rota'] = None
+if 'mapas_html' not in st.session_state:
+    # HTML do mapa de cada carga, gerado só quando a carga é aberta pela primeira vez
+    st.session_state['mapas_html'] = {}
+if 'tarefa_atual' not in st.session_state:
+    st.session_state['tarefa_atual'] = None
+    tarefa_url = st.query_params.get('tarefa')
+    if tarefa_url and fila_tarefas.obter(tarefa_url) is not None:
+        seguir_tarefa(tarefa_url)
+
+# pandas só a partir da entrada de dados: título e barra lateral aparecem antes da importação
+import pandas as pd  # noqa: E402
 
 st.subheader("1. Entrada de Dados")
 aba_upload, aba_manual = st.tabs(["📂 Upload de Planilha", "✍️ Inserção Manual"])
 
 df_para_processar = None
+planilha_valida = None
 
 with aba_upload:
     arquivo_upload = st.file_uploader("Faça upload da sua planilha (CSV ou Excel)", type=["csv", "xlsx"])
     if arquivo_upload:
         try:
-            if arquivo_upload.name.endswith('.csv'):
-                df_upload = pd.read_csv(arquivo_upload)
-                if len(df_upload.columns) == 1:
-                    arquivo_upload.seek(0)
-                    df_upload = pd.read_csv(arquivo_upload, sep=';')
-            else:
-                df_upload = pd.read_excel(arquivo_upload)
-            
-            col_coords = [col for col in df_upload.columns if 'coordenada' in col.lower()]
-            col_carga = [col for col in df_upload.columns if 'carga' in col.lower()]
+            # A cada rerun só a amostra é lida; a planilha inteira é lida em blocos ao calcular
+            arquivo_upload.seek(0)
+            df_amostra = ler_amostra(arquivo_upload, arquivo_upload.name)
             
-            if not col_coords:
-                st.error("⚠️ A planilha precisa ter uma coluna chamada 'Coordenadas'.")
+            try:
+                preparar_cargas(df_amostra)
+            except ValueError as e:
+                st.error(f"⚠️ {e}")
             else:
-                st.success(f"Planilha carregada com sucesso! ({len(df_upload)} linhas identificadas)")
+                planilha_valida = arquivo_upload
+                st.success(f"Planilha carregada com sucesso! ({arquivo_upload.size / 1024:.0f} KB)")
+                planilha_ordenada = st.checkbox(
+                    "Planilha agrupada por carga",
+                    help="Linhas de cada carga juntas: cada carga vai para a fila assim que termina de ser lida, "
+                         "sem guardar a planilha inteira na memória."
+                )
                 with st.expander("Visualizar dados importados"):
-                    st.dataframe(df_upload.head())
-                
-                df_para_processar = pd.DataFrame()
-                df_para_processar['Coordenada'] = df_upload[col_coords[0]]
-                
-                # Resgata o nome da carga ou define como única
-                if col_carga:
-                    df_para_processar['Carga'] = df_upload[col_carga[0]]
-                else:
-                    df_para_processar['Carga'] = "Única"
-                
-                if 'KM Adicional' in df_upload.columns:
-                    df_para_processar['KM Adicional'] = pd.to_numeric(df_upload['KM Adicional'], errors='coerce').fillna(0)
-                else:
-                    df_para_processar['KM Adicional'] = 0.0
-                
-                # Remove linhas vazias e preenche nomes de carga faltantes
-                df_para_processar = df_para_processar.dropna(subset=['Coordenada'])
-                df_para_processar['Carga'] = df_para_processar['Carga'].fillna("Desconhecida")
+                    st.dataframe(df_amostra)
                     
         except Exception as e:
             st.error(f"Erro ao ler o arquivo: {e}")
@@ -483,25 +397,132 @@ with aba_manual:
     st.write("Insira o identificador na coluna 'Carga' para separar os cálculos:")
     edited_df = st.data_editor(df_template, num_rows="dynamic", use_container_width=True)
     
-    if df_para_processar is None:
+    if planilha_valida is None:
         df_para_processar = edited_df
 
+def mostrar_erros_coordenadas(erros_coord):
+    erros_coord = [df for df in erros_coord if not df.empty]
+    if not erros_coord:
+        return
+    df_erros_coord = pd.concat(erros_coord, ignore_index=True)
+    st.warning(f"⚠️ {len(df_erros_coord)} coordenada(s) em formato inválido. As cargas abaixo serão marcadas com erro:")
+    st.dataframe(df_erros_coord, hide_index=True)
+
 if st.button("🚀 Calcular Rota", type="primary"):
     if not api_key:
         st.error("Insira a API Key na barra lateral.")
-    elif df_para_processar is None or df_para_processar.empty:
+    elif planilha_valida is None and (df_para_processar is None or df_para_processar.empty):
         st.warning("Insira dados válidos na tabela ou faça upload de uma planilha.")
     else:
-        with st.spinner("Processando rotas e bloqueando Porto da Manga..."):
-            client = openrouteservice.Client(key=api_key)
-            resultados_por_carga = {}
-            
+        erros_coord = []
+        if planilha_valida is not None:
+            # Planilha lida em blocos: cada carga é convertida e entregue sem montar um DataFrame do arquivo inteiro.
+            # Cópia própria do arquivo: no modo completo a leitura continua numa thread depois deste rerun
+            grupos = iterar_cargas(io.BytesIO(planilha_valida.getvalue()), planilha_valida.name,
+                                   ordenado=planilha_ordenada, ao_encontrar_erros=erros_coord.append)
+        else:
+            # Converte todas as coordenadas de uma vez e aponta todas as linhas inválidas juntas
+            df_validado, df_erros_coord = validar_coordenadas(df_para_processar)
+            erros_coord.append(df_erros_coord)
             # Agrupa os dados por carga mantendo a ordem (sort=False)
-            for carga_id, df_carga in df_para_processar.groupby('Carga', sort=False):
-                # O processar_rota agora é rodado isoladamente para CADA caminhão/carga
-                resultados_por_carga[carga_id] = processar_rota(client, df_carga)
-                
+            grupos = agrupar_cargas(df_validado)
+        
+        lote = (novo_lote(), planilha_valida.name if planilha_valida is not None else "Inserção manual")
+        
+        if modo_calculo == MODO_CALCULO_ESTIMATIVA:
+            # A matriz precisa de todas as cargas do lote ao mesmo tempo
+            try:
+                grupos = list(grupos)
+            except Exception as e:
+                st.error(f"Erro ao ler o arquivo: {e}")
+                st.stop()
+            mostrar_erros_coordenadas(erros_coord)
+            with st.spinner("Estimando distâncias pela matriz..."):
+                # Poucas chamadas à matriz para todas as cargas; a rota completa só quando a carga for aberta
+                try:
+                    resultados_por_carga, chamadas_matriz = estimar_cargas(montar_cliente(), grupos, historico_corredores)
+                except CotaDiariaEsgotada as e:
+                    st.error(f"⛔ {e} Tente novamente quando a cota renovar.")
+                    st.stop()
+            st.caption(f"Estimativa de {len(grupos)} cargas com {chamadas_matriz} chamada(s) à matriz do ORS.")
+            
+            # Os totais por superfície ficam gravados para recálculos futuros do custo
+            totais_superficies.registrar_lote(lote[0], resultados_por_carga, lote[1])
+            historico_lotes.registrar_lote(lote[0], resultados_por_carga, lote[1])
+            
+            st.session_state['tarefa_atual'] = None
+            st.query_params.pop('tarefa', None)
+            st.session_state['lote_atual'] = lote
             st.session_state['dados_rota'] = resultados_por_carga
+            st.session_state['grupos_carga'] = dict(grupos)
+            st.session_state['mapas_html'] = {}
+        else:
+            # O lote vira uma tarefa em segundo plano; o painel abaixo acompanha e o dashboard enche à medida que as cargas terminam
+            opcoes_tarefa = {
+                "backend": nome_backend,
+                "url_backend": url_backend,
+                "precisao_cache": int(precisao_cache),
+                "modo_distancia": modo_distancia,
+                "modo_indice": modo_indice,
+                "otimizar_sequencia": otimizar_sequencia,
+                "prazo_otimizacao_s": prazo_otimizacao_s,
+                "reaproveitar_trechos": reaproveitar_trechos,
+                "trechos_reversiveis": trechos_reversiveis,
+            }
+            # A planilha é lida numa thread do executor e as primeiras cargas já são roteadas durante a leitura;
+            # coordenadas inválidas aparecem como erro na própria carga. O plano de trechos precisa do lote inteiro.
+            mostrar_erros_coordenadas(erros_coord)
+            executor_tarefas.submeter(lote[0], usuario, grupos, opcoes_tarefa, lote[1], max_workers,
+                                      rotear_durante_leitura=not reaproveitar_trechos)
+            seguir_tarefa(lote[0])
+
+# --- TAREFAS EM SEGUNDO PLANO (o painel se atualiza sozinho enquanto houver tarefa ativa) ---
+atualizar_resultados_tarefa()
+tarefas_usuario = fila_tarefas.tarefas(usuario, limite=10)
+
+@st.fragment(run_every=INTERVALO_PAINEL_TAREFAS_S if any(t.estado in ESTADOS_ATIVOS for t in tarefas_usuario) else None)
+def painel_tarefas():
+    tarefas = fila_tarefas.tarefas(usuario, limite=10)
+    if not tarefas:
+        return
+    st.subheader("🗂️ Lotes em Segundo Plano")
+    for tarefa in tarefas:
+        c_desc, c_prog, c_acoes = st.columns([3, 4, 2])
+        aberta = " · **aberto no dashboard**" if tarefa.id == st.session_state['tarefa_atual'] else ""
+        c_desc.markdown(f"**{tarefa.descricao or tarefa.id}**  \n{ROTULOS_ESTADO_TAREFA[tarefa.estado]} · {tarefa.id}{aberta}")
+        if tarefa.erro:
+            c_desc.caption(f"⚠️ {tarefa.erro}")
+        if tarefa.falhas_registro:
+            c_desc.caption(f"⚠️ {tarefa.falhas_registro} carga(s) sem totais ou histórico gravados (ver o log do servidor)")
+        c_prog.progress(
+            tarefa.concluidas / tarefa.total if tarefa.total else 1.0,
+            text=f"{tarefa.concluidas} de {tarefa.total} cargas ({tarefa.falhas} com erro)"
+                 + (" · lendo a planilha..." if tarefa.lendo else "")
+        )
+        if tarefa.estado in ESTADOS_ATIVOS:
+            if c_acoes.button("⏹️ Cancelar", key=f"cancelar_{tarefa.id}"):
+                executor_tarefas.cancelar(tarefa.id)
+                st.rerun(scope="fragment")
+        elif tarefa.estado in (CANCELADA, FALHOU) and tarefa.concluidas < tarefa.total:
+            if c_acoes.button("▶️ Retomar", key=f"retomar_{tarefa.id}"):
+                executor_tarefas.retomar(tarefa.id)
+                st.rerun()
+        elif c_acoes.button("🗑️ Remover", key=f"remover_{tarefa.id}"):
+            fila_tarefas.remover(tarefa.id)
+            if tarefa.id == st.session_state['tarefa_atual']:
+                st.session_state['tarefa_atual'] = None
+                st.session_state['dados_rota'] = None
+                st.query_params.pop('tarefa', None)
+            st.rerun()
+        if tarefa.id != st.session_state['tarefa_atual'] and c_acoes.button("📂 Abrir", key=f"abrir_{tarefa.id}"):
+            seguir_tarefa(tarefa.id)
+            st.rerun()
+    
+    # Cargas novas da tarefa aberta: o app inteiro é refeito para o dashboard incluí-las
+    if atualizar_resultados_tarefa():
+        st.rerun()
+
+painel_tarefas()
 
 # Renderização dos resultados separados por Carga usando Abas (Tabs)
 if st.session_state['dados_rota']:
@@ -511,22 +532,9 @@ if st.session_state['dados_rota']:
     lista_resumo = []
     
     for carga_id, resultado in resultados.items():
-        total, link, detalhes, route_data, coords_data, debug_segments, resumo_tipos, erro = resultado
-        
-        if not erro:
-            custo_total = detalhes["Custo Asfalto (+3%)"] + detalhes["Custo Chão (+9%)"]
-            km_total_real = detalhes["Total KM (Asfalto + Chão)"]
-            perc_chao = (detalhes["Chão (KM)"] / km_total_real * 100) if km_total_real > 0 else 0
-            
-            lista_resumo.append({
-                "Carga": str(carga_id),
-                "Distância Total (km)": round(total, 2),
-                "Asfalto (km)": detalhes["Asfalto (KM)"],
-                "Chão (km)": detalhes["Chão (KM)"],
-                "% Chão": round(perc_chao, 1),
-                "Custo Estimado (pts)": round(custo_total, 2),
-                "Link Google Maps": link
-            })
+        linha = linha_resumo(carga_id, resultado)
+        if linha is not None:
+            lista_resumo.append(linha)
     
     df_dashboard = pd.DataFrame(lista_resumo)
     
@@ -555,7 +563,7 @@ if st.session_state['dados_rota']:
             st.subheader("🛣️ Perfil de Rodagem")
             # Prepara dados para o gráfico (Carga como índice)
             df_chart = df_dashboard.set_index("Carga")[["Asfalto (km)", "Chão (km)"]]
-            st.bar_chart(df_chart, color=["#555555", "#8B4513"], stack=True)
+            st.bar_chart(df_chart, color=[COR_ASFALTO, COR_CHAO], stack=True)
             
         with c_table:
             st.subheader("� Resumo Executivo")
@@ -573,56 +581,206 @@ if st.session_state['dados_rota']:
                 file_name='resumo_rotas_logistica.csv',
                 mime='text/csv',
             )
+            
+            # Todas as rotas do lote num zip, montado só quando o botão é clicado
+            with st.expander("📦 Exportar todas as rotas"):
+                formatos_zip = st.multiselect("Formatos", list(FORMATOS), default=list(FORMATOS))
+                casas_zip = st.selectbox(
+                    "Precisão das coordenadas", [None, 6, 5, 4],
+                    format_func=lambda c: "Completa" if c is None else f"{c} casas (~{10 ** (5 - c):g} m)"
+                )
+                st.download_button(
+                    label="📥 Baixar rotas (zip)",
+                    data=lambda: zip_rotas(resultados, formatos_zip, casas_zip),
+                    file_name='rotas_logistica.zip',
+                    mime='application/zip',
+                    disabled=not formatos_zip,
+                )
     else:
         st.warning("Nenhuma rota foi calculada com sucesso para gerar o dashboard.")
 
-    # --- DETALHAMENTO INDIVIDUAL (ABAS) ---
+    # --- SIMULAÇÃO DE MODELOS DE CUSTO (a partir dos totais gravados, sem chamar o ORS) ---
+    with st.expander("🧮 Simulação de Modelos de Custo", key="exp_modelos", on_change="rerun") as exp_modelos:
+        if exp_modelos.open:
+            lotes_gravados = {l["Lote"]: l for l in totais_superficies.lotes()}
+            lote_atual = st.session_state['lote_atual'][0]
+            lotes_escolhidos = st.multiselect(
+                "Lotes",
+                list(lotes_gravados),
+                default=[lote_atual] if lote_atual in lotes_gravados else [],
+                format_func=lambda l: f"{l} · {lotes_gravados[l]['Descrição']} ({lotes_gravados[l]['Cargas']} cargas)"
+            )
+            sem_compactado = sorted(MODELO_PADRAO.superficies_chao - {'compacted'})
+            df_modelos = st.data_editor(
+                pd.DataFrame({
+                    "Modelo": ["Atual", "Compactado como asfalto", "Chão +12%"],
+                    "Fator Asfalto": [MODELO_PADRAO.fator_asfalto] * 3,
+                    "Fator Chão": [MODELO_PADRAO.fator_chao, MODELO_PADRAO.fator_chao, 1.12],
+                    "Superfícies de Chão": [sorted(MODELO_PADRAO.superficies_chao), sem_compactado,
+                                            sorted(MODELO_PADRAO.superficies_chao)],
+                }),
+                column_config={
+                    "Fator Asfalto": st.column_config.NumberColumn(min_value=0.0, step=0.01, format="%.2f"),
+                    "Fator Chão": st.column_config.NumberColumn(min_value=0.0, step=0.01, format="%.2f"),
+                    "Superfícies de Chão": st.column_config.MultiselectColumn(options=superficies_conhecidas()),
+                },
+                num_rows="dynamic",
+                hide_index=True,
+                key="editor_modelos"
+            )
+            modelos = [
+                ModeloCusto(str(m["Modelo"]), float(m["Fator Asfalto"]), float(m["Fator Chão"]),
+                            frozenset(m["Superfícies de Chão"] or ()))
+                for m in df_modelos.dropna(subset=["Modelo", "Fator Asfalto", "Fator Chão"]).to_dict("records")
+            ]
+            if lotes_escolhidos and modelos:
+                custos_por_carga, resumo_modelos = comparar_modelos(*totais_superficies.carregar(lotes_escolhidos), modelos)
+                st.caption("Custos recalculados dos metros por superfície gravados; o primeiro modelo é a referência da variação.")
+                st.dataframe(resumo_modelos, hide_index=True)
+                st.bar_chart(resumo_modelos.set_index("Modelo")["Custo Total (pts)"])
+                st.dataframe(custos_por_carga, hide_index=True)
+            else:
+                st.info("Escolha ao menos um lote gravado e um modelo.")
+
+    # --- DETALHAMENTO INDIVIDUAL (CARGA SELECIONADA) ---
     st.divider()
     st.subheader("🔎 Detalhamento Técnico por Carga")
     
-    # Cria uma aba dinâmica para cada Número de Carga
-    nomes_cargas = [f"📦 {str(c)}" for c in resultados.keys()]
-    abas_cargas = st.tabs(nomes_cargas)
+    # Só a carga selecionada é montada (mapa, tabelas e downloads) a cada rerun
+    carga_id = st.selectbox(
+        "Carga",
+        list(resultados.keys()),
+        format_func=lambda c: f"📦 {c}" + ("" if resultados[c].ok else " ⚠️")
+    )
+    resultado = resultados[carga_id]
+    inicio_render = METRICAS.inicio()
     
-    for idx, (carga_id, resultado) in enumerate(resultados.items()):
-        with abas_cargas[idx]:
-            total, link, detalhes, route_data, coords_data, debug_segments, resumo_tipos, erro = resultado
-            
-            if erro:
-                st.error(f"Erro ao processar Rota da Carga {carga_id}: {erro}")
-            else:
-                c1, c2, c3 = st.columns(3)
-                c1.metric("Total Calculado (KM)", f"{total:.2f}")
-                c2.metric("Asfalto (Base)", f"{detalhes['Asfalto (KM)']} km")
-                c3.metric("Chão (Base)", f"{detalhes['Chão (KM)']} km")
-                
-                st.write("### Composição de Custo")
-                st.json(detalhes)
-                
-                st.markdown(f"**🗺️ Abrir Rota {carga_id} no Google Maps**")
-                st.link_button("🔗 Abrir no Google Maps", link)
-                
-                # Botão de Exportação KML
-                if route_data and 'features' in route_data:
-                    geo_coords = route_data['features'][0]['geometry']['coordinates']
-                    kml_str = gerar_kml(geo_coords, f"Rota {carga_id}")
-                    st.download_button(
-                        label="📥 Baixar Rota em KML",
-                        data=kml_str,
-                        file_name=f"rota_{carga_id}.kml",
-                        mime="application/vnd.google-earth.kml+xml"
-                    )
-
-                st.subheader("📍 Mapa Interativo")
-                # Gera o mapa específico desta carga
-                mapa = gerar_mapa_folium(route_data, coords_data)
-                st_folium(mapa, width=1000, height=500, key=f"mapa_{carga_id}")
-                
-                with st.expander("📊 Resumo por Tipo de Superfície (Tira-Teima)"):
-                    df_resumo = pd.DataFrame(list(resumo_tipos.items()), columns=['Tipo de Superfície', 'Metros'])
+    if not resultado.ok:
+        st.error(f"Erro ao processar Rota da Carga {carga_id}: {resultado.erro}")
+    else:
+        detalhes = resultado.detalhes
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Total Calculado (KM)", f"{resultado.total:.2f}")
+        c2.metric("Asfalto (Base)", f"{detalhes['Asfalto (KM)']} km")
+        c3.metric("Chão (Base)", f"{detalhes['Chão (KM)']} km")
+        
+        st.write("### Composição de Custo")
+        st.json(detalhes)
+        
+        st.markdown(f"**🗺️ Abrir Rota {carga_id} no Google Maps**")
+        st.link_button("🔗 Abrir no Google Maps", resultado.link)
+        
+        rota = resultado.rota
+        if rota is None:
+            # Carga calculada pelo modo estimativa: a rota completa só é buscada sob demanda
+            st.info("Esta carga foi estimada pela matriz do ORS, sem geometria. Calcule a rota completa para ver mapa, KML e superfícies.")
+            if st.button("🛰️ Calcular rota completa desta carga"):
+                with st.spinner("Calculando rota completa..."):
+                    try:
+                        resultados[carga_id] = rotear(montar_cliente(), st.session_state['grupos_carga'][carga_id])
+                    except CotaDiariaEsgotada as e:
+                        st.error(f"⛔ {e} Tente novamente quando a cota renovar.")
+                        st.stop()
+                    lote, descricao_lote = st.session_state['lote_atual']
+                    totais_superficies.registrar_lote(lote, {carga_id: resultados[carga_id]}, descricao_lote)
+                    historico_lotes.registrar_lote(lote, {carga_id: resultados[carga_id]}, descricao_lote)
+                st.rerun()
+        else:
+            # Botão de Exportação KML
+            with METRICAS.cronometrar("kml"):
+                kml_str = documento_rota(rota, resultado.paradas, f"Rota {carga_id}", FORMATO_KML)
+            st.download_button(
+                label="📥 Baixar Rota em KML",
+                data=kml_str,
+                file_name=f"rota_{carga_id}.kml",
+                mime=MIME_FORMATOS[FORMATO_KML]
+            )
+
+            st.subheader("📍 Mapa Interativo")
+            # Gera o mapa específico desta carga uma única vez; os reruns reaproveitam o HTML
+            mapas_html = st.session_state['mapas_html']
+            if carga_id not in mapas_html:
+                from roteirizador.mapas import html_mapa
+                mapas_html[carga_id] = html_mapa(rota, resultado.paradas, zonas=registro_zonas)
+            components.html(mapas_html[carga_id], width=1000, height=500)
+        
+            # As tabelas abaixo só são montadas com o expander aberto (on_change="rerun")
+            with st.expander("📊 Resumo por Tipo de Superfície (Tira-Teima)", key="exp_resumo_tipos", on_change="rerun") as exp_resumo:
+                if exp_resumo.open:
+                    df_resumo = pd.DataFrame(list(rota.resumo_tipos().items()), columns=['Tipo de Superfície', 'Metros'])
                     df_resumo['KM'] = (df_resumo['Metros'] / 1000).round(3)
                     df_resumo = df_resumo[['Tipo de Superfície', 'KM']].sort_values(by='KM', ascending=False)
                     st.dataframe(df_resumo, use_container_width=True)
-                
-                with st.expander("🔍 Detalhes Técnicos (Debug dos Segmentos)"):
-                    st.dataframe(pd.DataFrame(debug_segments), use_container_width=True)
+        
+            with st.expander("🔍 Detalhes Técnicos (Debug dos Segmentos)", key="exp_debug", on_change="rerun") as exp_debug:
+                if exp_debug.open:
+                    st.dataframe(pd.DataFrame(rota.tabela_debug()), use_container_width=True)
+        
+            if modo_indice != MODO_DESLIGADO:
+                with st.expander("🧭 Reclassificação pelo Índice Local (sem API)", key="exp_recostear", on_change="rerun") as exp_indice:
+                    if exp_indice.open:
+                        st.json(indice_superficies.recostear(rota.coordenadas, rota.distancia_oficial_m, modo_distancia))
+    
+    METRICAS.fim_etapa("render", inicio_render)
+
+# --- HISTÓRICO CONSOLIDADO (lido dos totais mensais gravados, sem os lotes em memória) ---
+st.divider()
+with st.expander("📅 Histórico Consolidado", key="exp_historico", on_change="rerun") as exp_historico:
+    if exp_historico.open:
+        hoje = pd.Timestamp.today()
+        c_inicio, c_fim = st.columns(2)
+        mes_inicio = c_inicio.date_input("De", (hoje - pd.DateOffset(months=MESES_PADRAO - 1)).replace(day=1), format="DD/MM/YYYY")
+        mes_fim = c_fim.date_input("Até", hoje, format="DD/MM/YYYY")
+        df_mensal = pd.DataFrame(historico_lotes.totais_mensais(f"{mes_inicio:%Y-%m}", f"{mes_fim:%Y-%m}"))
+        if df_mensal.empty:
+            st.info("Nenhum lote gravado no período.")
+        else:
+            km_asfalto = df_mensal["Asfalto (km)"].sum()
+            km_chao = df_mensal["Chão (km)"].sum()
+            col_h1, col_h2, col_h3, col_h4 = st.columns(4)
+            col_h1.metric("Cargas no Período", int(df_mensal["Cargas"].sum()))
+            col_h2.metric("KM Total", f"{df_mensal['Distância Total (km)'].sum():,.2f} km")
+            col_h3.metric("Custo Total (Estimado)", f"{df_mensal['Custo Estimado (pts)'].sum():,.2f}")
+            col_h4.metric("% de Chão", f"{km_chao / (km_asfalto + km_chao) * 100 if km_asfalto + km_chao > 0 else 0:.1f}%")
+            st.bar_chart(df_mensal.set_index("Mês")[["Asfalto (km)", "Chão (km)"]], color=[COR_ASFALTO, COR_CHAO], stack=True)
+            st.line_chart(df_mensal.set_index("Mês")[["Custo Estimado (pts)"]])
+            st.dataframe(df_mensal, use_container_width=True, hide_index=True)
+
+        carga_busca = st.text_input("Histórico de uma carga", placeholder="Número da carga")
+        if carga_busca:
+            df_carga_hist = pd.DataFrame(historico_lotes.historico_carga(carga_busca.strip()))
+            if df_carga_hist.empty:
+                st.info(f"Carga {carga_busca} não encontrada no histórico.")
+            else:
+                st.dataframe(df_carga_hist, use_container_width=True, hide_index=True)
+
+# --- PAINEL DE MÉTRICAS ---
+if METRICAS.habilitado:
+    st.divider()
+    with st.expander("⏱️ Métricas de Desempenho", expanded=False):
+        df_etapas = pd.DataFrame(METRICAS.resumo_etapas())
+        if df_etapas.empty:
+            st.info("Nenhuma métrica coletada ainda. Calcule as rotas com a coleta ligada.")
+        else:
+            st.write("**Tempo por etapa**")
+            st.dataframe(df_etapas, use_container_width=True, hide_index=True)
+            
+            instantaneo = METRICAS.instantaneo()
+            st.write("**Contadores**")
+            st.dataframe(
+                pd.DataFrame([
+                    {"Métrica": c["nome"], "Rótulos": ", ".join(f"{k}={v}" for k, v in c["rotulos"].items()), "Valor": c["valor"]}
+                    for c in instantaneo["contadores"]
+                ]),
+                use_container_width=True,
+                hide_index=True
+            )
+            
+            st.write("**Últimas cargas (segundos por etapa)**")
+            st.dataframe(pd.DataFrame(instantaneo["cargas_recentes"]), use_container_width=True, hide_index=True)
+            
+        c_json, c_prom, c_zerar = st.columns(3)
+        c_json.download_button("📥 Exportar JSON", METRICAS.exportar_json(), file_name="metricas_roteirizador.json", mime="application/json")
+        c_prom.download_button("📥 Exportar Prometheus", METRICAS.exportar_prometheus(), file_name="metricas_roteirizador.prom", mime="text/plain")
+        if c_zerar.button("Zerar métricas"):
+            METRICAS.zerar()
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+from roteirizador import cache_ors
+from roteirizador.cache_ors import CacheRotas, chave_requisicao
+
+
+class Relogio:
+    """Substitui ``time`` no módulo do cache; o teste avança o tempo à mão."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def time(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(cache_ors, "time", SimpleNamespace(time=relogio.time))
+    return relogio
+
+
+def resposta(n):
+    return {"features": [{"properties": {"carga": n, "segmentos": list(range(50))}}]}
+
+
+def tamanho_entrada(tmp_path):
+    cache = CacheRotas(str(tmp_path / "medida.sqlite3"))
+    cache.guardar("a", resposta(0))
+    return cache._total_bytes
+
+
+def test_chave_arredonda_as_coordenadas():
+    parametros = {"coordinates": [[-54.654912, -20.450004]], "profile": "driving-hgv"}
+
+    assert chave_requisicao(parametros) == chave_requisicao({**parametros, "coordinates": [[-54.654914, -20.45]]})
+    assert chave_requisicao(parametros) != chave_requisicao({**parametros, "coordinates": [[-54.6549, -20.45]]})
+    assert chave_requisicao(parametros) != chave_requisicao({**parametros, "profile": "driving-car"})
+
+
+def test_entrada_expira_pelo_ttl(tmp_path, relogio):
+    cache = CacheRotas(str(tmp_path / "cache.sqlite3"), ttl_segundos=60)
+    cache.guardar("a", resposta(1))
+
+    relogio.agora += 60
+    assert cache.obter("a") == resposta(1)
+    relogio.agora += 1
+    # Contado a partir da gravação, não do último acesso
+    assert cache.obter("a") is None
+    assert cache.estatisticas()["Entradas"] == 0
+    assert (cache.acertos, cache.falhas) == (1, 1)
+
+
+def test_despeja_a_menos_usada_recentemente(tmp_path, relogio):
+    cache = CacheRotas(str(tmp_path / "cache.sqlite3"), max_bytes=int(tamanho_entrada(tmp_path) * 2.5))
+    for n, chave in enumerate("abc"):
+        relogio.agora += 1
+        if chave == "c":
+            # "a" foi lida depois de "b": "b" passa a ser a menos usada
+            assert cache.obter("a") is not None
+            relogio.agora += 1
+        cache.guardar(chave, resposta(n))
+
+    assert cache.obter("b") is None
+    assert cache.obter("a") == resposta(0)
+    assert cache.obter("c") == resposta(2)
+    assert cache.despejos == 1
+    assert cache._total_bytes <= cache.max_bytes
+
+
+def test_regravar_nao_conta_o_tamanho_duas_vezes(tmp_path, relogio):
+    cache = CacheRotas(str(tmp_path / "cache.sqlite3"))
+    cache.guardar("a", resposta(1))
+    tamanho = cache._total_bytes
+
+    cache.guardar("a", resposta(1))
+
+    assert cache._total_bytes == tamanho
+    # O total é refeito do arquivo ao reabrir
+    assert CacheRotas(cache.caminho)._total_bytes == tamanho
@@ -0,0 +1,180 @@
+import pytest
+import requests
+from openrouteservice.exceptions import ApiError, HTTPError, Timeout
+
+from roteirizador.cliente_ors import (
+    ClienteResiliente, ErroAutenticacao, ErroConexao, ErroCotaExcedida, ErroLimiteDistancia, ErroRequisicao,
+    ErroRotaImpossivel, ErroServidorORS, ErroTempoEsgotado, PrazoEsgotado, classificar_erro
+)
+
+ROTA = {"features": []}
+
+
+def erro_api(status, codigo=None, mensagem="falhou"):
+    corpo = {"error": {"code": codigo, "message": mensagem}} if codigo else {"error": mensagem}
+    return ApiError(status, corpo)
+
+
+class Relogio:
+    """Relógio manual: ``dormir`` avança o tempo em vez de esperar."""
+
+    def __init__(self):
+        self.agora = 0.0
+        self.esperas = []
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.esperas.append(segundos)
+        self.agora += segundos
+
+
+class ClienteRoteiro:
+    """Levanta as exceções do roteiro, na ordem, e depois responde a rota; conta as chamadas."""
+
+    def __init__(self, *erros, relogio=None, duracao=0.0):
+        self.erros = list(erros)
+        self.chamadas = 0
+        self.inicios = []
+        self.relogio = relogio
+        self.duracao = duracao
+
+    def directions(self, **kwargs):
+        self.chamadas += 1
+        if self.relogio is not None:
+            self.inicios.append(self.relogio.agora)
+            self.relogio.agora += self.duracao
+        if self.erros:
+            raise self.erros.pop(0)
+        return ROTA
+
+
+def resiliente(client, relogio, **parametros):
+    return ClienteResiliente(client, relogio=relogio, dormir=relogio.dormir, semente=1, **parametros)
+
+
+# --- CLASSIFICAÇÃO ---
+
+
+@pytest.mark.parametrize("excecao, tipo", [
+    (erro_api(400, 2004), ErroLimiteDistancia),
+    (erro_api(404, 2009), ErroRotaImpossivel),
+    (erro_api(404, 2010), ErroRotaImpossivel),
+    (erro_api(429), ErroCotaExcedida),
+    (erro_api(503), ErroServidorORS),
+    (erro_api(403), ErroAutenticacao),
+    (erro_api(400, 2003), ErroRequisicao),
+    (HTTPError(502), ErroServidorORS),
+    (Timeout(), ErroTempoEsgotado),
+    (requests.exceptions.ReadTimeout(), ErroTempoEsgotado),
+    (requests.exceptions.ConnectionError("recusada"), ErroConexao),
+    # Clientes que só levantam Exception com o texto da resposta
+    (Exception('400 ({"error": {"code": 2004, "message": "limite"}})'), ErroLimiteDistancia),
+    (Exception("502 Bad Gateway"), ErroServidorORS),
+])
+def test_classificar_erro(excecao, tipo):
+    erro = classificar_erro(excecao)
+
+    assert type(erro) is tipo
+    assert erro.retentavel == (tipo in (ErroCotaExcedida, ErroServidorORS, ErroTempoEsgotado, ErroConexao))
+
+
+def test_classificar_erro_guarda_status_e_codigo():
+    erro = classificar_erro(erro_api(400, 2004, "Request exceeds the server configuration limits"))
+
+    assert (erro.status, erro.codigo) == (400, 2004)
+    assert str(erro) == "400 2004 (Request exceeds the server configuration limits)"
+
+
+def test_classificar_erro_ignora_o_que_nao_veio_do_ors():
+    assert classificar_erro(KeyError("features")) is None
+    erro = ErroRotaImpossivel("sem rota")
+    assert classificar_erro(erro) is erro
+
+
+# --- RETENTATIVAS ---
+
+
+def test_repete_429_e_5xx_ate_responder():
+    relogio = Relogio()
+    client = ClienteRoteiro(erro_api(429), erro_api(503), erro_api(502))
+
+    assert resiliente(client, relogio).directions(coordinates=[]) is ROTA
+    assert client.chamadas == 4
+    assert len(relogio.esperas) == 3
+
+
+def test_2004_nao_e_repetido():
+    relogio = Relogio()
+    client = ClienteRoteiro(erro_api(400, 2004))
+
+    with pytest.raises(ErroLimiteDistancia):
+        resiliente(client, relogio).directions(coordinates=[])
+    assert client.chamadas == 1
+    assert relogio.esperas == []
+
+
+def test_desiste_apos_o_maximo_de_tentativas():
+    relogio = Relogio()
+    client = ClienteRoteiro(*[erro_api(503)] * 10)
+
+    with pytest.raises(ErroServidorORS) as excinfo:
+        resiliente(client, relogio, max_tentativas=3).directions(coordinates=[])
+    assert client.chamadas == 3
+    assert isinstance(excinfo.value.__cause__, ApiError)
+
+
+def test_espera_com_jitter_completo_e_teto_exponencial():
+    cliente = ClienteResiliente(None, espera_base_s=0.5, espera_maxima_s=4.0, semente=7)
+
+    for tentativa in range(1, 8):
+        teto = min(4.0, 0.5 * 2 ** (tentativa - 1))
+        esperas = [cliente.espera(tentativa) for _ in range(200)]
+        assert all(0 <= espera <= teto for espera in esperas)
+        # Sorteio uniforme em [0, teto]: nem fixo no teto nem concentrado no zero
+        assert min(esperas) < 0.2 * teto
+        assert max(esperas) > 0.8 * teto
+
+
+def test_mesma_semente_repete_as_esperas():
+    esperas = [[ClienteResiliente(None, semente=3).espera(t) for t in range(1, 6)] for _ in range(2)]
+
+    assert esperas[0] == esperas[1]
+
+
+# --- PRAZOS ---
+
+
+def test_prazo_da_chamada_interrompe_as_retentativas():
+    relogio = Relogio()
+    client = ClienteRoteiro(*[erro_api(503)] * 10, relogio=relogio, duracao=4.0)
+
+    with pytest.raises(ErroServidorORS):
+        resiliente(client, relogio, max_tentativas=10, prazo_chamada_s=10).directions(coordinates=[])
+    # Nenhuma tentativa começa depois do prazo: a última falha sobe em vez de dormir além dele
+    assert all(inicio < 10 for inicio in client.inicios)
+    assert client.chamadas < 10
+
+
+def test_prazo_do_lote_vale_para_todas_as_chamadas():
+    relogio = Relogio()
+    client = ClienteRoteiro(relogio=relogio, duracao=3.0)
+    lote = resiliente(client, relogio, prazo_chamada_s=60).para_lote(prazo_s=5)
+
+    assert lote.directions(coordinates=[]) is ROTA
+    assert lote.directions(coordinates=[]) is ROTA
+    with pytest.raises(PrazoEsgotado):
+        lote.directions(coordinates=[])
+    assert client.chamadas == 2
+
+
+def test_prazo_do_lote_limita_as_retentativas():
+    relogio = Relogio()
+    client = ClienteRoteiro(*[erro_api(429)] * 10, relogio=relogio, duracao=1.0)
+    lote = resiliente(client, relogio, max_tentativas=10, espera_base_s=2.0, prazo_chamada_s=60).para_lote(prazo_s=3)
+
+    with pytest.raises(ErroCotaExcedida):
+        lote.directions(coordinates=[])
+    assert all(inicio < 3 for inicio in client.inicios)
+    assert client.chamadas < 10
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from roteirizador.coordenadas import converter_coluna, limpar_e_converter
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("-20.45, -54.65", (-20.45, -54.65)),
+    ("-20,45; -54,65", (-20.45, -54.65)),
+    ("20°27'00\"S 54°39'00\"W", (-20.45, -54.65)),
+    ("20°27'00\"S 54°39'00\"O", (-20.45, -54.65)),
+    ("95.0, -54.65", (None, None)),  # latitude fora da faixa
+    ("-20.45", (None, None)),
+    ("1.2.3°4'5\"S 54°39'00\"W", (None, None)),  # parte DMS malformada
+    ("sem coordenada", (None, None)),
+])
+def test_limpar_e_converter(texto, esperado):
+    lat, lon = limpar_e_converter(texto)
+
+    if esperado[0] is None:
+        assert (lat, lon) == esperado
+    else:
+        assert (lat, lon) == pytest.approx(esperado)
+
+
+def test_converter_coluna_marca_todas_as_linhas_invalidas():
+    valores = ["-20.45, -54.65", None, "texto", "-20.45, -54.65", np.nan, "95.0, -54.65", "-20,5; -54,7", ""]
+
+    lat, lon, erros = converter_coluna(valores)
+
+    assert erros.tolist() == [False, True, True, False, True, True, False, True]
+    assert lat[~erros].tolist() == pytest.approx([-20.45, -20.45, -20.5])
+    assert lon[~erros].tolist() == pytest.approx([-54.65, -54.65, -54.7])
+    assert np.isnan(lat[erros]).all() and np.isnan(lon[erros]).all()
+
+
+def test_converter_coluna_equivale_a_converter_celula_por_celula():
+    valores = ["-20.45, -54.65", "20°27'00\"S 54°39'00\"W", "x", "-21.1, -55.2"] * 50
+
+    lat, lon, erros = converter_coluna(valores)
+
+    for i, texto in enumerate(valores):
+        esperado = limpar_e_converter(texto)
+        if esperado[0] is None:
+            assert erros[i]
+        else:
+            assert (lat[i], lon[i]) == pytest.approx(esperado)
+
+
+def test_converter_coluna_vazia():
+    lat, lon, erros = converter_coluna([])
+
+    assert len(lat) == len(lon) == len(erros) == 0
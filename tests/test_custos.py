@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+from roteirizador.custos import LOTE_CONSULTA, TotaisSuperficies
+
+
+def resultado(tipos):
+    rota = SimpleNamespace(resumo_tipos=lambda: dict(tipos), distancia_oficial_m=float(sum(tipos.values())))
+    return SimpleNamespace(rota=rota, detalhes={"Adicional (KM)": 0.0})
+
+
+def test_regravar_carga_substitui_as_superficies(tmp_path):
+    totais = TotaisSuperficies(str(tmp_path / "totais.sqlite3"))
+    totais.registrar_lote("L1", {"C1": resultado({"asphalt": 800.0, "dirt": 200.0}), "C2": resultado({"asphalt": 50.0})})
+    totais.registrar_lote("L1", {"C1": resultado({"asphalt": 900.0})})
+
+    df_totais, df_cargas = totais.carregar(["L1"])
+    assert sorted(df_totais[df_totais['Carga'] == "C1"][['Superficie', 'Metros']].itertuples(index=False, name=None)) == [
+        ("asphalt", 900.0)
+    ]
+    assert len(df_totais[df_totais['Carga'] == "C2"]) == 1
+    assert sorted(df_cargas['Carga']) == ["C1", "C2"]
+
+
+def test_regravar_lote_maior_que_um_bloco_de_consulta(tmp_path):
+    totais = TotaisSuperficies(str(tmp_path / "totais.sqlite3"))
+    n = 2 * LOTE_CONSULTA + 10
+    totais.registrar_lote("L1", {f"C{i}": resultado({"asphalt": 1.0, "dirt": 1.0}) for i in range(n)})
+    assert totais.registrar_lote("L1", {f"C{i}": resultado({"gravel": 2.0}) for i in range(n)}) == n
+
+    df_totais, _ = totais.carregar(["L1"])
+    assert len(df_totais) == n
+    assert set(df_totais['Superficie']) == {"gravel"}
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from roteirizador.cliente_ors import ErroORS
+from roteirizador.despacho import ClienteLimitado, CotaDiariaEsgotada, LimitadorTaxa, processar_cargas
+from roteirizador.rotas import processar_rota, rotear_com_fallback
+
+PARADAS = [[-54.6549, -20.5085], [-54.6680, -20.5515]]
+
+
+class ClienteSemChamadas:
+    def directions(self, **kwargs):
+        raise AssertionError("o limitador deveria ter barrado a chamada")
+
+    def distance_matrix(self, **kwargs):
+        raise AssertionError("o limitador deveria ter barrado a chamada")
+
+
+def test_cota_esgotada_e_erro_ors_nao_retentavel():
+    assert issubclass(CotaDiariaEsgotada, ErroORS)
+    assert not CotaDiariaEsgotada.retentavel
+
+
+def test_cota_esgotada_nao_vira_erro_da_carga():
+    client = ClienteLimitado(ClienteSemChamadas(), LimitadorTaxa(por_dia=0))
+
+    with pytest.raises(CotaDiariaEsgotada):
+        rotear_com_fallback(client, PARADAS)
+    with pytest.raises(CotaDiariaEsgotada):
+        processar_rota(client, {"Coordenada": ["-20.5085, -54.6549", "-20.5515, -54.6680"]})
+
+
+def test_processar_cargas_para_de_despachar_quando_a_cota_acaba():
+    chamadas = []
+    lock = threading.Lock()
+
+    def funcao(dados):
+        with lock:
+            chamadas.append(dados)
+        if dados >= 3:
+            raise CotaDiariaEsgotada("Cota diária do ORS esgotada (3 chamadas).")
+        return dados
+
+    grupos = ((f"C{i}", i) for i in range(1000))
+    with pytest.raises(CotaDiariaEsgotada):
+        processar_cargas(grupos, funcao, max_workers=1)
+    # Com um trabalhador e fila de 4, no máximo a fila já submetida roda depois da falha
+    assert len(chamadas) < 10
+
+
+def test_contador_diario_compartilhado_entre_limitadores(tmp_path):
+    caminho = str(tmp_path / "cota.sqlite3")
+    app = LimitadorTaxa(por_minuto=1000, por_dia=3, chave="chave-ors", caminho=caminho)
+    cli = LimitadorTaxa(por_minuto=1000, por_dia=3, chave="chave-ors", caminho=caminho)
+    outra_chave = LimitadorTaxa(por_minuto=1000, por_dia=3, chave="outra", caminho=caminho)
+
+    app.adquirir()
+    app.adquirir()
+    cli.adquirir()
+    assert app.restantes_hoje == 0
+    with pytest.raises(CotaDiariaEsgotada):
+        cli.adquirir()
+    outra_chave.adquirir()
+    assert outra_chave.restantes_hoje == 2
+
+
+def test_contador_diario_vira_no_dia_utc(tmp_path, monkeypatch):
+    import roteirizador.despacho as despacho
+
+    monkeypatch.setattr(despacho, "dia_utc", lambda: "2026-01-01")
+    limitador = LimitadorTaxa(por_minuto=1000, por_dia=1, chave="chave-ors", caminho=str(tmp_path / "cota.sqlite3"))
+    limitador.adquirir()
+    with pytest.raises(CotaDiariaEsgotada):
+        limitador.adquirir()
+
+    monkeypatch.setattr(despacho, "dia_utc", lambda: "2026-01-02")
+    limitador.adquirir()
+    assert limitador.restantes_hoje == 0
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+
+from roteirizador.distancias import (
+    MODO_ELIPSOIDE, MODO_HAVERSINE, distancias_acumuladas, distancias_segmentos, haversine_m, vincenty_m
+)
+
+# Vincenty e o geodesic (Karney) concordam bem abaixo do milímetro; haversine erra até ~0,5%
+TOLERANCIA_ELIPSOIDE_M = 1e-3
+TOLERANCIA_HAVERSINE_REL = 5e-3
+# No total as diferenças de micrômetros por segmento somam: 0,1 ppm (4 cm em 400 km)
+TOLERANCIA_ELIPSOIDE_TOTAL_REL = 1e-7
+
+
+def geodesic_segmentos(coords):
+    return np.array([geodesic((p1[1], p1[0]), (p2[1], p2[0])).meters for p1, p2 in zip(coords[:-1], coords[1:])])
+
+
+def rota_pantanal(n=2000, semente=42):
+    # Corumbá -> Campo Grande (~420 km) com ruído de GPS nos vértices
+    rng = np.random.default_rng(semente)
+    lons = np.linspace(-57.65, -54.65, n) + rng.normal(0, 1e-4, n)
+    lats = np.linspace(-19.0, -20.5, n) + rng.normal(0, 1e-4, n)
+    return np.column_stack([lons, lats])
+
+
+PARADAS_MS = np.array([
+    [-57.6523, -19.0069],  # Corumbá
+    [-57.2334, -19.2597],  # Porto da Manga
+    [-56.3781, -20.2406],  # Miranda
+    [-54.6549, -20.5085],  # Campo Grande
+    [-55.7900, -22.2200],  # Ponta Porã
+    [-57.0289, -19.5724],
+])
+
+
+@pytest.mark.parametrize("coords", [rota_pantanal(), PARADAS_MS], ids=["rota_densa", "paradas_longas"])
+def test_elipsoide_tem_paridade_com_geodesic(coords):
+    referencia = geodesic_segmentos(coords)
+    motor = distancias_segmentos(coords, MODO_ELIPSOIDE)
+
+    np.testing.assert_allclose(motor, referencia, rtol=0, atol=TOLERANCIA_ELIPSOIDE_M)
+    assert distancias_acumuladas(coords, MODO_ELIPSOIDE)[-1] == pytest.approx(referencia.sum(),
+                                                                       rel=TOLERANCIA_ELIPSOIDE_TOTAL_REL)
+
+
+@pytest.mark.parametrize("coords", [rota_pantanal(), PARADAS_MS], ids=["rota_densa", "paradas_longas"])
+def test_haversine_fica_perto_do_geodesic(coords):
+    referencia = geodesic_segmentos(coords)
+    motor = distancias_segmentos(coords, MODO_HAVERSINE)
+
+    np.testing.assert_allclose(motor, referencia, rtol=TOLERANCIA_HAVERSINE_REL)
+    assert motor.sum() == pytest.approx(referencia.sum(), rel=TOLERANCIA_HAVERSINE_REL)
+
+
+def test_pontos_repetidos_tem_distancia_zero():
+    coords = [[-54.6549, -20.5085], [-54.6549, -20.5085], [-54.6680, -20.5515], [-54.6680, -20.5515]]
+    motor = distancias_segmentos(coords, MODO_ELIPSOIDE)
+
+    assert motor[0] == 0.0
+    assert motor[2] == 0.0
+    assert motor[1] == pytest.approx(geodesic((-20.5085, -54.6549), (-20.5515, -54.6680)).meters,
+                                      abs=TOLERANCIA_ELIPSOIDE_M)
+
+
+@pytest.mark.parametrize("p1, p2", [
+    ((0.0, 0.0), (10.0, 0.0)),     # equador
+    ((-54.0, -20.0), (-54.0, -21.0)),  # meridiano
+    ((-57.6, 0.0), (-57.6, 0.0)),  # mesmo ponto no equador
+])
+def test_casos_degenerados_convergem(p1, p2):
+    motor = float(vincenty_m(p1[0], p1[1], p2[0], p2[1]))
+    referencia = geodesic((p1[1], p1[0]), (p2[1], p2[0])).meters
+    assert motor == pytest.approx(referencia, abs=TOLERANCIA_ELIPSOIDE_M)
+
+
+@pytest.mark.parametrize("p1, p2", [
+    ((0.0, 0.0), (180.0, 0.0)),
+    ((0.0, 0.5), (179.7, -0.5)),
+    ((-57.6, -19.0), (122.4, 19.0)),  # antípoda do Pantanal
+])
+def test_antipodas_caem_para_haversine(p1, p2):
+    motor = float(vincenty_m(p1[0], p1[1], p2[0], p2[1]))
+    assert np.isfinite(motor)
+    assert motor == float(haversine_m(p1[0], p1[1], p2[0], p2[1]))
+    assert motor == pytest.approx(geodesic((p1[1], p1[0]), (p2[1], p2[0])).meters, rel=TOLERANCIA_HAVERSINE_REL)
+
+
+def test_geometria_vazia_ou_de_um_ponto():
+    assert len(distancias_segmentos([], MODO_ELIPSOIDE)) == 0
+    assert len(distancias_segmentos([[-54.6, -20.5]], MODO_ELIPSOIDE)) == 0
+    assert list(distancias_acumuladas([[-54.6, -20.5]], MODO_ELIPSOIDE)) == [0.0]
+
+
+def test_modo_desconhecido():
+    with pytest.raises(ValueError):
+        distancias_segmentos(PARADAS_MS, "plano")
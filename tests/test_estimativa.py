@@ -0,0 +1,103 @@
+import pytest
+
+from roteirizador.estimativa import HistoricoCorredores, _lotes_trechos, distancias_matriz
+from roteirizador.ors_simulado import ServidorORSSimulado
+
+DEPOSITO = (-54.6549, -20.4500)
+FAZENDA = (-54.7680, -20.5500)
+# Mesma região (~11 km) da fazenda, mas outro trecho exato (~1 km)
+VIZINHA = (-54.7750, -20.5750)
+LONGE = (-56.3781, -20.2406)
+
+
+# --- LOTES DA MATRIZ ---
+
+
+def pontos(n, lon=-54.0):
+    return [(round(lon - i * 0.01, 4), -20.0) for i in range(n)]
+
+
+def test_lotes_respeitam_os_limites_e_cobrem_todos_os_pares():
+    origens, destinos = pontos(30), pontos(30, lon=-55.0)
+    pares = [(o, d) for o in origens for d in destinos]
+
+    lotes = list(_lotes_trechos(pares, max_locais=20, max_elementos=60))
+
+    assert [par for lote, _, _ in lotes for par in lote] == pares
+    for lote, origens_lote, destinos_lote in lotes:
+        assert len(set(origens_lote) | set(destinos_lote)) <= 20
+        assert len(origens_lote) * len(destinos_lote) <= 60
+        assert all(o in origens_lote and d in destinos_lote for o, d in lote)
+
+
+def test_lote_unico_quando_cabe_no_limite():
+    pares = [(DEPOSITO, FAZENDA), (FAZENDA, LONGE), (LONGE, DEPOSITO)]
+
+    lotes = list(_lotes_trechos(pares))
+
+    assert len(lotes) == 1
+    assert lotes[0][1] == [DEPOSITO, FAZENDA, LONGE]
+
+
+def test_lotes_sem_pares():
+    assert list(_lotes_trechos([])) == []
+
+
+def test_distancias_matriz_em_varios_lotes_no_ors_simulado():
+    import openrouteservice
+
+    # Mais locais que MAX_LOCAIS_MATRIZ: a matriz é pedida em mais de um lote
+    paradas = pontos(60)
+    pares = list(zip(paradas[:-1], paradas[1:])) + [(paradas[0], paradas[1])]
+
+    with ServidorORSSimulado(semente=1) as servidor:
+        client = openrouteservice.Client(key='simulado', base_url=servidor.url)
+        distancias, chamadas = distancias_matriz(client, pares)
+        um_a_um = {par: distancias_matriz(client, [par])[0][par] for par in dict.fromkeys(pares)}
+
+    assert chamadas > 1
+    assert distancias == pytest.approx(um_a_um)
+
+
+# --- PROPORÇÃO DE CHÃO ---
+
+
+@pytest.fixture
+def historico(tmp_path):
+    return HistoricoCorredores(str(tmp_path / "corredores.sqlite3"))
+
+
+def test_proporcao_sem_historico(historico):
+    assert historico.proporcao_chao(DEPOSITO, FAZENDA) == (0.0, "sem histórico")
+
+
+def test_proporcao_cai_do_trecho_para_a_regiao_e_para_a_media(historico):
+    historico.registrar([DEPOSITO, FAZENDA], [(40.0, 10.0)])
+    historico.registrar([LONGE, DEPOSITO], [(60.0, 30.0)])
+
+    assert historico.proporcao_chao(DEPOSITO, FAZENDA) == (0.25, "trecho")
+    assert historico.proporcao_chao(DEPOSITO, VIZINHA) == (0.25, "região")
+    # Sentido contrário é outro trecho: sem histórico nele nem na região, vale a média geral
+    assert historico.proporcao_chao(FAZENDA, DEPOSITO) == (pytest.approx(40.0 / 100.0), "média geral")
+
+
+def test_proporcao_soma_as_rotas_do_mesmo_trecho(historico):
+    historico.registrar([DEPOSITO, FAZENDA], [(40.0, 10.0)])
+    historico.registrar([DEPOSITO, FAZENDA], [(60.0, 40.0)])
+
+    assert historico.proporcao_chao(DEPOSITO, FAZENDA) == (0.5, "trecho")
+
+
+def test_trecho_sem_km_nao_entra_no_historico(historico):
+    historico.registrar([DEPOSITO, FAZENDA, LONGE], [(0.0, 0.0), (50.0, 5.0)])
+
+    assert historico.proporcao_chao(DEPOSITO, FAZENDA) == (pytest.approx(0.1), "média geral")
+    assert historico.estatisticas()["Trechos Conhecidos"] == 1
+
+
+def test_proporcoes_em_lote_iguais_as_individuais(historico, monkeypatch):
+    monkeypatch.setattr("roteirizador.estimativa.LOTE_CONSULTA", 3)
+    historico.registrar([DEPOSITO, FAZENDA, LONGE], [(40.0, 10.0), (80.0, 8.0)])
+    pares = [(DEPOSITO, FAZENDA), (DEPOSITO, VIZINHA), (FAZENDA, LONGE), (LONGE, FAZENDA), (FAZENDA, DEPOSITO)]
+
+    assert historico.proporcoes_chao(pares) == [historico.proporcao_chao(*par) for par in pares]
@@ -0,0 +1,32 @@
+import zipfile
+
+import openrouteservice
+import pytest
+
+from roteirizador.exportacao import FORMATOS, exportar_zip
+from roteirizador.ors_simulado import ServidorORSSimulado
+from roteirizador.rotas import processar_rota
+
+
+@pytest.fixture(scope="module")
+def resultado():
+    with ServidorORSSimulado(semente=1) as servidor:
+        client = openrouteservice.Client(key='simulado', base_url=servidor.url)
+        resultado = processar_rota(client, {"Coordenada": ["-20.5085, -54.6549", "-20.5515, -54.6680"]})
+    assert resultado.ok
+    return resultado
+
+
+def test_ids_que_viram_o_mesmo_nome_nao_se_sobrepoem(tmp_path, resultado):
+    caminho = tmp_path / "rotas.zip"
+    resultados = {"A/1": resultado, "A 1": resultado, "a_1": resultado, "B": resultado}
+
+    exportadas, ignoradas = exportar_zip(str(caminho), resultados)
+
+    assert (exportadas, ignoradas) == (4, 0)
+    with zipfile.ZipFile(caminho) as arquivo:
+        nomes = arquivo.namelist()
+    assert len(nomes) == len(set(nomes)) == 4 * len(FORMATOS)
+    assert {n for n in nomes if n.startswith("kml/")} == {
+        "kml/rota_A_1.kml", "kml/rota_A_1_2.kml", "kml/rota_a_1_3.kml", "kml/rota_B.kml"
+    }
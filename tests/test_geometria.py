@@ -0,0 +1,91 @@
+import math
+
+import numpy as np
+import pytest
+
+from roteirizador.geometria import douglas_peucker, tolerancia_para_zoom, trechos_simplificados, zoom_para_bbox
+
+
+def distancia_ao_segmento(p, a, b):
+    p, a, b = (np.asarray(x, dtype=np.float64) for x in (p, a, b))
+    ab = b - a
+    t = np.clip(np.dot(p - a, ab) / np.dot(ab, ab), 0, 1) if np.dot(ab, ab) else 0.0
+    return float(np.hypot(*(p - (a + t * ab))))
+
+
+# --- DOUGLAS–PEUCKER ---
+
+
+def test_remove_vertices_colineares():
+    linha = [[x, 2 * x] for x in np.linspace(0, 1, 11)]
+
+    assert douglas_peucker(linha, 1e-6).tolist() == [True] + [False] * 9 + [True]
+
+
+def test_mantem_o_vertice_alem_da_tolerancia():
+    coords = [[0, 0], [1, 0.3], [2, 0.5], [3, 0.3], [4, 0]]
+
+    assert douglas_peucker(coords, 0.1).tolist() == [True, False, True, False, True]
+    assert douglas_peucker(coords, 0.6).tolist() == [True, False, False, False, True]
+
+
+def test_erro_da_linha_simplificada_fica_abaixo_da_tolerancia():
+    rng = np.random.default_rng(5)
+    coords = np.cumsum(rng.normal(size=(500, 2)), axis=0)
+    tolerancia = 2.0
+
+    manter = douglas_peucker(coords, tolerancia)
+    indices = np.flatnonzero(manter)
+
+    assert manter[0] and manter[-1]
+    assert len(indices) < len(coords)
+    # Cada vértice removido está a no máximo ``tolerancia`` do segmento simplificado que o cobre
+    for inicio, fim in zip(indices[:-1], indices[1:]):
+        for i in range(inicio + 1, fim):
+            assert distancia_ao_segmento(coords[i], coords[inicio], coords[fim]) <= tolerancia + 1e-9
+
+
+def test_laco_fechado_nao_some():
+    # Ida e volta ao mesmo ponto: as pontas coincidem e a distância vira a distância ao ponto
+    coords = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+
+    assert douglas_peucker(coords, 0.5).sum() >= 3
+
+
+@pytest.mark.parametrize("coords, tolerancia", [
+    ([], 0.1),
+    ([[0, 0]], 0.1),
+    ([[0, 0], [1, 1]], 0.1),
+    ([[0, 0], [1, 0], [2, 0]], 0),
+])
+def test_casos_triviais_mantem_tudo(coords, tolerancia):
+    assert douglas_peucker(coords, tolerancia).tolist() == [True] * len(coords)
+
+
+# --- TRECHOS POR SUPERFÍCIE ---
+
+
+def test_trechos_preservam_as_fronteiras_entre_superficies():
+    geometry = [[x, 0.0] for x in range(9)]
+    valores = [[0, 3, 1], [3, 5, 1], [5, 8, 10]]
+
+    trechos = trechos_simplificados(geometry, valores, {1: "paved", 10: "dirt"}, tolerancia=0.1)
+
+    # Os dois trechos de asfalto viram um só; a fronteira (vértice 5) continua nos dois lados
+    assert trechos == [("paved", [[0.0, 0.0], [5.0, 0.0]]), ("dirt", [[5.0, 0.0], [8.0, 0.0]])]
+
+
+# --- ZOOM E TOLERÂNCIA ---
+
+
+def test_tolerancia_cai_pela_metade_a_cada_nivel_de_zoom():
+    assert tolerancia_para_zoom(11, -20.0) == pytest.approx(tolerancia_para_zoom(10, -20.0) / 2)
+    assert tolerancia_para_zoom(10, -60.0) == pytest.approx(tolerancia_para_zoom(10, 0.0) * math.cos(math.radians(60)))
+
+
+def test_zoom_para_bbox_cabe_na_tela():
+    pequeno = zoom_para_bbox([-54.70, -20.50, -54.60, -20.40])
+    grande = zoom_para_bbox([-58.0, -22.0, -53.0, -18.0])
+
+    assert pequeno > grande
+    assert zoom_para_bbox([-54.65, -20.45, -54.65, -20.45]) == 18
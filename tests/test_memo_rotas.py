@@ -0,0 +1,96 @@
+import pytest
+
+from roteirizador.memo_rotas import MemoRotas, RotaBase, chave_carga
+from roteirizador.ors_simulado import rota_sintetica
+from roteirizador.rotas import processar_rota
+
+PARADAS = [[-54.6549, -20.4500], [-54.7680, -20.5500]]
+OPCOES = {"modo_distancia": "elipsoide", "indice_superficies": False}
+
+
+class ClienteSintetico:
+    """Responde cada ``directions`` com a rota sintética do ORS simulado e conta as chamadas."""
+
+    def __init__(self):
+        self.chamadas = 0
+
+    def directions(self, coordinates, **kwargs):
+        self.chamadas += 1
+        return rota_sintetica(coordinates)
+
+
+def base(n):
+    return RotaBase(n, 0.0, f"link-{n}", {}, None, PARADAS)
+
+
+def carga(km_adicional):
+    return {"Coordenada": ["-20.4500, -54.6549", "-20.5500, -54.7680"], "KM Adicional": [km_adicional, 0]}
+
+
+# --- CHAVE ---
+
+
+def test_chave_ignora_ruido_abaixo_da_precisao():
+    ruido = [[lon + 1e-8, lat - 1e-8] for lon, lat in PARADAS]
+
+    assert chave_carga(ruido, OPCOES) == chave_carga(PARADAS, OPCOES)
+    # Tuplas e números como texto dão a mesma chave
+    assert chave_carga([(str(lon), str(lat)) for lon, lat in PARADAS], OPCOES) == chave_carga(PARADAS, OPCOES)
+
+
+def test_chave_muda_com_paradas_ordem_e_opcoes():
+    chave = chave_carga(PARADAS, OPCOES)
+
+    assert chave_carga([[PARADAS[0][0] + 1e-5, PARADAS[0][1]], PARADAS[1]], OPCOES) != chave
+    assert chave_carga(PARADAS[::-1], OPCOES) != chave
+    assert chave_carga(PARADAS, {**OPCOES, "indice_superficies": True}) != chave
+    # A ordem das opções no dict não importa
+    assert chave_carga(PARADAS, dict(reversed(list(OPCOES.items())))) == chave
+
+
+# --- LRU ---
+
+
+def test_despeja_a_menos_usada_recentemente():
+    memo = MemoRotas(max_itens=2)
+    memo.guardar("a", base(1))
+    memo.guardar("b", base(2))
+    assert memo.obter("a") == base(1)
+
+    memo.guardar("c", base(3))
+
+    assert memo.obter("b") is None
+    assert memo.obter("a") == base(1)
+    assert memo.obter("c") == base(3)
+    estatisticas = memo.estatisticas()
+    assert (estatisticas["Cargas em Memória"], estatisticas["Despejos (LRU)"]) == (2, 1)
+    assert (estatisticas["Acertos"], estatisticas["Falhas"]) == (3, 1)
+
+
+def test_regravar_a_mesma_chave_nao_despeja():
+    memo = MemoRotas(max_itens=2)
+    memo.guardar("a", base(1))
+    memo.guardar("b", base(2))
+
+    memo.guardar("a", base(3))
+
+    assert memo.obter("a") == base(3)
+    assert memo.obter("b") == base(2)
+    assert memo.despejos == 0
+
+
+# --- USO EM processar_rota ---
+
+
+def test_km_adicional_nao_refaz_a_rota():
+    memo = MemoRotas()
+    client = ClienteSintetico()
+
+    primeiro = processar_rota(client, carga(0), memo_rotas=memo)
+    segundo = processar_rota(client, carga(12.5), memo_rotas=memo)
+
+    assert primeiro.ok and segundo.ok
+    assert client.chamadas == 1
+    assert segundo.total == pytest.approx(primeiro.total + 12.5)
+    assert segundo.detalhes["Adicional (KM)"] == 12.5
+    assert segundo.detalhes["Asfalto (KM)"] == primeiro.detalhes["Asfalto (KM)"]
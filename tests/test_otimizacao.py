@@ -0,0 +1,30 @@
+import numpy as np
+
+from roteirizador.estimativa import HistoricoCorredores
+from roteirizador.otimizacao import FATOR_ASFALTO, FATOR_CHAO, matriz_custos
+
+PARADAS = [(-54.6549, -20.4500), (-54.6680, -20.5500), (-54.7000, -20.6000), (-55.1000, -21.0000)]
+
+
+def test_matriz_custos_usa_a_proporcao_de_chao_de_cada_par(tmp_path):
+    historico = HistoricoCorredores(str(tmp_path / "corredores.sqlite3"))
+    historico.registrar(PARADAS[:3], [(10.0, 5.0), (10.0, 0.0)])
+    distancias = np.full((4, 4), 2000.0)
+    distancias[2, 3] = np.nan
+
+    custos = matriz_custos(distancias, PARADAS, historico)
+
+    esperado = np.full((4, 4), 2.0 * FATOR_ASFALTO)
+    for i in range(4):
+        for j in range(4):
+            if i != j:
+                fracao, _ = historico.proporcao_chao(PARADAS[i], PARADAS[j])
+                esperado[i, j] = 2.0 * (FATOR_ASFALTO * (1 - fracao) + FATOR_CHAO * fracao)
+    esperado[2, 3] = np.inf
+    np.testing.assert_allclose(custos, esperado)
+    assert custos[0, 1] == 2.0 * (FATOR_ASFALTO + FATOR_CHAO) / 2
+
+
+def test_matriz_custos_sem_historico_usa_so_o_fator_de_asfalto():
+    custos = matriz_custos(np.full((3, 3), 1000.0), PARADAS[:3])
+    np.testing.assert_allclose(custos, FATOR_ASFALTO)
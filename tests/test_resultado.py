@@ -0,0 +1,41 @@
+import pytest
+
+from roteirizador.ors_simulado import rota_sintetica
+from roteirizador.resultado import NAO_INFORMADO, RotaCompacta
+
+PARADAS = [[-54.6549, -20.4500], [-54.7680, -20.5500], [-54.9100, -20.6200]]
+TABELA = {1: "paved", 10: "dirt"}
+
+
+def compacta(valores, distancias_m):
+    return RotaCompacta.de_resposta(rota_sintetica(PARADAS), valores, TABELA, distancias_m)
+
+
+def test_resumo_soma_os_metros_por_superficie():
+    rota = compacta([[0, 2, 1], [2, 3, 10], [3, 5, 1], [5, 6, 10]], [100.0, 40.0, 250.0, 10.5])
+
+    assert rota.superficies == ("paved", "dirt")
+    assert rota.resumo_tipos() == {"paved": pytest.approx(350.0), "dirt": pytest.approx(50.5)}
+
+
+def test_resumo_agrupa_superficie_ausente_como_nao_informado():
+    rota = compacta([[0, 1, None], [1, 2, 1], [2, 3, ""]], [10.0, 20.0, 5.0])
+
+    assert rota.resumo_tipos() == {NAO_INFORMADO: pytest.approx(15.0), "paved": pytest.approx(20.0)}
+
+
+def test_resumo_mantem_codigo_sem_nome_como_texto():
+    rota = compacta([[0, 1, 99], [1, 2, 99]], [7.0, 3.0])
+
+    assert rota.resumo_tipos() == {"99": pytest.approx(10.0)}
+
+
+def test_resumo_de_rota_sem_trechos():
+    assert compacta([], []).resumo_tipos() == {}
+
+
+def test_valores_devolve_os_nomes_no_lugar_dos_codigos():
+    rota = compacta([[0, 2, 1], [2, 3, 10]], [1.0, 2.0])
+
+    assert rota.valores() == [[0, 2, "paved"], [2, 3, "dirt"]]
+    assert rota.trechos.dtype.itemsize == 4
@@ -0,0 +1,88 @@
+from openrouteservice.exceptions import ApiError
+
+from roteirizador.estrategias import DEGRAU_LIVRE, DEGRAU_POLIGONO, DEGRAU_PONTE, MemoriaEstrategias, chave_corredor
+from roteirizador.rotas import rotear_carga, rotear_com_fallback, tentativas_rota
+
+# Corumbá -> Miranda, passando pelo Porto da Manga: a escada tem todos os degraus
+PARADAS = [[-57.6523, -19.0069], [-56.3781, -20.2406]]
+# Dentro de Campo Grande, longe de qualquer zona de restrição
+PARADAS_SEM_ZONA = [[-54.6549, -20.4500], [-54.6680, -20.5500]]
+
+
+class ClienteFalhando:
+    """Levanta a mesma exceção em toda chamada e conta as chamadas."""
+
+    def __init__(self, erro):
+        self.erro = erro
+        self.chamadas = 0
+
+    def directions(self, **kwargs):
+        self.chamadas += 1
+        raise self.erro
+
+
+def erro_2004():
+    return ApiError(400, {"error": {"code": 2004, "message": "Request exceeds the server configuration limits"}})
+
+
+def test_degrau_livre_memorizado_que_falha_devolve_erro(tmp_path):
+    memoria = MemoriaEstrategias(caminho=str(tmp_path / "estrategias.sqlite3"))
+    corredor = chave_corredor(PARADAS)
+    memoria.registrar(corredor, DEGRAU_LIVRE)
+    client = ClienteFalhando(erro_2004())
+
+    route, coords, aviso, erro = rotear_com_fallback(client, PARADAS, memoria)
+
+    assert route is None
+    assert coords == PARADAS
+    assert erro
+    assert memoria.consultar(corredor) is None
+    # O atalho e a escada completa, com o último degrau repetido
+    assert client.chamadas >= 2
+
+
+def test_rotear_carga_nao_quebra_com_degrau_livre_memorizado(tmp_path):
+    memoria = MemoriaEstrategias(caminho=str(tmp_path / "estrategias.sqlite3"))
+    memoria.registrar(chave_corredor(PARADAS), DEGRAU_LIVRE)
+
+    base, erro = rotear_carga(ClienteFalhando(erro_2004()), PARADAS, memoria_estrategias=memoria)
+
+    assert base is None
+    assert erro
+
+
+def test_falha_transitoria_no_degrau_memorizado_nao_roda_a_escada(tmp_path):
+    memoria = MemoriaEstrategias(caminho=str(tmp_path / "estrategias.sqlite3"))
+    corredor = chave_corredor(PARADAS)
+    memoria.registrar(corredor, DEGRAU_PONTE)
+    client = ClienteFalhando(ApiError(503, {"error": {"message": "Service unavailable"}}))
+
+    route, _, _, erro = rotear_com_fallback(client, PARADAS, memoria)
+
+    assert route is None
+    assert "indisponível" in erro
+    assert client.chamadas == 1
+    assert memoria.consultar(corredor) == DEGRAU_PONTE
+
+
+def test_sem_zona_no_corredor_a_escada_tem_so_o_primeiro_degrau():
+    tentativas = list(tentativas_rota(PARADAS_SEM_ZONA))
+
+    assert [degrau for degrau, _, _, _ in tentativas] == [DEGRAU_POLIGONO]
+    assert tentativas[0][2] == {"avoid_features": ["ferries"]}
+
+
+def test_2004_sem_zona_no_corredor_devolve_o_erro_sem_liberar_balsas(tmp_path):
+    memoria = MemoriaEstrategias(caminho=str(tmp_path / "estrategias.sqlite3"))
+    corredor = chave_corredor(PARADAS_SEM_ZONA)
+    # Estratégia gravada antes da correção: a escada deste corredor não tem mais esse degrau
+    memoria.registrar(corredor, DEGRAU_LIVRE)
+    client = ClienteFalhando(erro_2004())
+
+    route, coords, aviso, erro = rotear_com_fallback(client, PARADAS_SEM_ZONA, memoria)
+
+    assert route is None
+    assert aviso is None
+    assert "2004" in erro
+    assert client.chamadas == 1
+    assert memoria.consultar(corredor) is None
@@ -0,0 +1,72 @@
+import pytest
+
+from roteirizador.superficies import IndiceSuperficies, chaves_segmentos, trechos_de_superficies
+
+# Quatro segmentos: dois de asfalto e dois de chão
+GEOMETRIA = [[-54.6549, -20.4500], [-54.6600, -20.4550], [-54.6650, -20.4600], [-54.6700, -20.4650], [-54.6750, -20.4700]]
+VALORES = [[0, 2, 1], [2, 4, 10]]  # códigos do ORS: 1 = paved, 10 = dirt
+TABELA = {1: "paved", 10: "dirt"}
+
+
+@pytest.fixture
+def indice(tmp_path):
+    return IndiceSuperficies(str(tmp_path / "superficies.sqlite3"))
+
+
+def test_chave_do_segmento_independe_do_sentido():
+    ida, _ = chaves_segmentos(GEOMETRIA)
+    volta, _ = chaves_segmentos(GEOMETRIA[::-1])
+
+    assert ida == volta[::-1]
+    # Vértices a menos de ~11 m caem na mesma chave
+    quase, _ = chaves_segmentos([[x + 0.00001, y - 0.00001] for x, y in GEOMETRIA])
+    assert quase == ida
+
+
+def test_trechos_juntam_segmentos_iguais():
+    assert trechos_de_superficies(["paved", "paved", "dirt", "paved"]) == [
+        [0, 2, "paved"], [2, 3, "dirt"], [3, 4, "paved"]
+    ]
+    assert trechos_de_superficies([]) == []
+
+
+def test_classificar_geometria_aprendida(indice):
+    indice.aprender(GEOMETRIA, VALORES, TABELA)
+
+    superficies, cobertura = indice.classificar(GEOMETRIA)
+
+    assert superficies == ["paved", "paved", "dirt", "dirt"]
+    assert cobertura == 1.0
+    # O mesmo trecho no sentido contrário já é conhecido
+    assert indice.classificar(GEOMETRIA[::-1])[0] == ["dirt", "dirt", "paved", "paved"]
+
+
+def test_classificar_com_segmentos_desconhecidos(indice):
+    indice.aprender(GEOMETRIA[:3], [[0, 2, 1]], TABELA)
+
+    superficies, cobertura = indice.classificar(GEOMETRIA)
+
+    assert superficies == ["paved", "paved", None, None]
+    assert cobertura == 0.5
+
+
+def test_reclassificar_respeita_a_cobertura_minima(indice):
+    indice.aprender(GEOMETRIA[:4], [[0, 2, 1], [2, 3, 10]], TABELA)
+
+    assert indice.reclassificar(GEOMETRIA) is None
+    assert indice.reclassificar(GEOMETRIA, cobertura_minima=0.75) == [[0, 2, "paved"], [2, 3, "dirt"], [3, 4, "unknown"]]
+
+
+def test_reclassificar_reproduz_os_trechos_do_ors(indice):
+    indice.aprender(GEOMETRIA, VALORES, TABELA)
+
+    assert indice.reclassificar(GEOMETRIA) == [[0, 2, "paved"], [2, 4, "dirt"]]
+
+
+def test_aprender_de_novo_substitui_a_superficie(indice):
+    indice.aprender(GEOMETRIA, VALORES, TABELA)
+    indice.aprender(GEOMETRIA, [[0, 4, 1]], TABELA)
+
+    assert indice.reclassificar(GEOMETRIA) == [[0, 4, "paved"]]
+    _, divergentes = indice.divergencias(GEOMETRIA, VALORES, TABELA)
+    assert [(d["Inicio"], d["Superficie_Cache"], d["Superficie_Nova"]) for d in divergentes] == [(2, "paved", "dirt")]
@@ -0,0 +1,217 @@
+import threading
+import time
+
+import openrouteservice
+import pytest
+
+from roteirizador.despacho import ClienteLimitado, LimitadorTaxa
+from roteirizador.ors_simulado import ServidorORSSimulado
+from roteirizador.rotas import processar_rota
+from roteirizador.planilha import iterar_cargas
+from roteirizador.resultado import ResultadoRota
+from roteirizador.tarefas import CONCLUIDA, ESTADOS_ATIVOS, FALHOU, PENDENTE, ExecutorTarefas, FilaTarefas
+
+CARGAS = 6
+
+
+def grupos():
+    # Cargas curtas em Campo Grande, longe das zonas: uma chamada ao ORS por carga
+    return [
+        (f"C{i}", {"Coordenada": [f"-20.{4500 + i}, -54.6549", f"-20.{5500 + i}, -54.6680"], "KM Adicional": [0.0, 0.0]})
+        for i in range(CARGAS)
+    ]
+
+
+def esperar_fim(fila, tarefa_id, limite_s=20):
+    fim = time.monotonic() + limite_s
+    while time.monotonic() < fim:
+        tarefa = fila.obter(tarefa_id)
+        if tarefa.estado not in ESTADOS_ATIVOS:
+            return tarefa
+        time.sleep(0.05)
+    raise AssertionError(f"tarefa {tarefa_id} não terminou em {limite_s}s")
+
+
+@pytest.fixture
+def servidor():
+    with ServidorORSSimulado(semente=1) as servidor:
+        yield servidor
+
+
+def test_cota_esgotada_interrompe_a_tarefa_e_retomar_continua(tmp_path, servidor):
+    limitador = LimitadorTaxa(por_minuto=10000, por_dia=3)
+
+    def preparar(tarefa, carregar_grupos):
+        client = ClienteLimitado(openrouteservice.Client(key='simulado', base_url=servidor.url), limitador)
+        return lambda dados: processar_rota(client, dados)
+
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    executor = ExecutorTarefas(fila, preparar, trabalhadores=1).iniciar()
+    try:
+        fila.submeter("t1", "ana", grupos(), {}, max_paralelo=1)
+        executor.notificar()
+
+        tarefa = esperar_fim(fila, "t1")
+        assert tarefa.estado == FALHOU
+        assert "CotaDiariaEsgotada" in tarefa.erro
+        assert tarefa.concluidas == 3
+        assert tarefa.falhas == 0
+
+        # Cota renovada: a tarefa continua das cargas que faltavam
+        limitador.por_dia = None
+        assert executor.retomar("t1")
+        tarefa = esperar_fim(fila, "t1")
+        assert tarefa.estado == CONCLUIDA
+        assert tarefa.concluidas == CARGAS
+        resultados, _ = fila.resultados("t1")
+        assert sorted(ordem for ordem, _, _ in resultados) == list(range(CARGAS))
+        assert all(resultado.ok for _, _, resultado in resultados)
+    finally:
+        executor.parar(timeout=5)
+
+
+def test_submeter_grava_gerador_da_planilha_em_blocos(tmp_path, monkeypatch):
+    monkeypatch.setattr("roteirizador.tarefas.BLOCO_SUBMISSAO", 2)
+    planilha = tmp_path / "cargas.csv"
+    linhas = ["Número Carga;Coordenadas"]
+    for i in range(5):
+        linhas += [f"C{i};-20.{4500 + i}, -54.6549", f"C{i};-20.{5500 + i}, -54.6680"]
+    planilha.write_text("\n".join(linhas) + "\n", encoding="utf-8")
+
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    fila.submeter("t1", "ana", iterar_cargas(str(planilha), str(planilha), tamanho_bloco=3, ordenado=True), {})
+
+    tarefa = fila.obter("t1")
+    assert tarefa.estado == PENDENTE
+    assert tarefa.total == 5
+    assert [carga_id for carga_id, _ in fila.grupos("t1")] == [f"C{i}" for i in range(5)]
+
+
+def test_falha_na_leitura_para_a_tarefa_com_as_cargas_ja_lidas(tmp_path, monkeypatch):
+    monkeypatch.setattr("roteirizador.tarefas.BLOCO_SUBMISSAO", 2)
+
+    def grupos_com_falha():
+        yield from grupos()[:3]
+        raise ValueError("Planilha não está ordenada por Carga")
+
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    with pytest.raises(ValueError):
+        fila.submeter("t1", "ana", grupos_com_falha(), {})
+
+    tarefa = fila.obter("t1")
+    assert tarefa.estado == FALHOU
+    assert not tarefa.lendo
+    assert "Planilha não está ordenada" in tarefa.erro
+    assert tarefa.total == 3
+
+
+def test_cargas_sao_roteadas_antes_do_fim_da_leitura(tmp_path, monkeypatch):
+    monkeypatch.setattr("roteirizador.tarefas.BLOCO_SUBMISSAO", 2)
+    primeira_roteada = threading.Event()
+
+    def preparar(tarefa, carregar_grupos):
+        def rotear(dados):
+            primeira_roteada.set()
+            return ResultadoRota.falha("simulada")
+        return rotear
+
+    def planilha_lenta():
+        yield from grupos()[:2]
+        # A leitura só termina depois que um trabalhador já pegou uma carga
+        assert primeira_roteada.wait(10)
+        yield from grupos()[2:]
+
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    executor = ExecutorTarefas(fila, preparar, trabalhadores=1).iniciar()
+    try:
+        executor.submeter("t1", "ana", planilha_lenta(), {})
+        tarefa = esperar_fim(fila, "t1")
+        assert tarefa.estado == CONCLUIDA
+        assert (tarefa.total, tarefa.concluidas, tarefa.lendo) == (CARGAS, CARGAS, 0)
+    finally:
+        executor.parar(timeout=5)
+
+
+def test_sem_rotear_durante_leitura_a_tarefa_espera_o_fim_do_arquivo(tmp_path, monkeypatch):
+    monkeypatch.setattr("roteirizador.tarefas.BLOCO_SUBMISSAO", 2)
+    gravou, liberar = threading.Event(), threading.Event()
+
+    def planilha_lenta():
+        yield from grupos()[:2]
+        assert liberar.wait(10)
+        yield from grupos()[2:]
+
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    fila.criar("t1", "ana", {}, rotear_durante_leitura=False)
+    leitura = threading.Thread(target=fila.acrescentar, args=("t1", planilha_lenta(), gravou.set))
+    leitura.start()
+    try:
+        assert gravou.wait(10)
+        assert fila.obter("t1").total == 2
+        assert fila.reservar() is None
+    finally:
+        liberar.set()
+        leitura.join(10)
+
+    assert fila.obter("t1").total == CARGAS
+    assert fila.reservar()[:3] == ("t1", 0, "C0")
+
+
+def test_erro_inesperado_de_uma_carga_vira_falha_e_o_lote_termina(tmp_path):
+    def preparar(tarefa, carregar_grupos):
+        def rotear(dados):
+            if dados["Coordenada"][0].startswith("-20.4502"):
+                raise KeyError("Coordenada")
+            return ResultadoRota.falha("simulada")
+        return rotear
+
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    executor = ExecutorTarefas(fila, preparar, trabalhadores=2).iniciar()
+    try:
+        executor.submeter("t1", "ana", grupos(), {})
+        tarefa = esperar_fim(fila, "t1")
+        assert tarefa.estado == CONCLUIDA
+        assert (tarefa.concluidas, tarefa.erro) == (CARGAS, None)
+        erros = {carga_id: resultado.erro for _, carga_id, resultado in fila.resultados("t1")[0]}
+        assert erros["C2"].startswith("Erro inesperado: KeyError")
+    finally:
+        executor.parar(timeout=5)
+
+
+def test_contexto_so_carrega_o_lote_quando_pedido(tmp_path, monkeypatch):
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    monkeypatch.setattr(fila, "grupos", lambda tarefa_id: pytest.fail("o lote inteiro foi lido da fila"))
+    executor = ExecutorTarefas(fila, lambda tarefa, carregar_grupos: lambda dados: ResultadoRota.falha("simulada"),
+                               trabalhadores=1).iniciar()
+    try:
+        executor.submeter("t1", "ana", grupos(), {})
+        assert esperar_fim(fila, "t1").estado == CONCLUIDA
+    finally:
+        executor.parar(timeout=5)
+
+
+def test_falha_ao_registrar_a_carga_fica_contada_na_tarefa(tmp_path):
+    def registrar(tarefa_id, carga_id, resultado):
+        if carga_id == "C1":
+            raise OSError("disco cheio")
+
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    executor = ExecutorTarefas(fila, lambda tarefa, carregar_grupos: lambda dados: ResultadoRota.falha("simulada"),
+                               trabalhadores=1, ao_concluir=registrar).iniciar()
+    try:
+        executor.submeter("t1", "ana", grupos(), {})
+        tarefa = esperar_fim(fila, "t1")
+        assert (tarefa.estado, tarefa.concluidas, tarefa.falhas_registro) == (CONCLUIDA, CARGAS, 1)
+    finally:
+        executor.parar(timeout=5)
+
+
+def test_ocupacao_conta_cargas_em_andamento_de_tarefas_sem_pendentes(tmp_path):
+    fila = FilaTarefas(str(tmp_path / "tarefas.sqlite3"))
+    fila.submeter("a1", "ana", grupos()[:2], {}, max_paralelo=2)
+    fila.submeter("b1", "bia", grupos()[2:], {}, max_paralelo=2)
+    assert [fila.reservar()[0] for _ in range(3)] == ["a1", "b1", "a1"]
+
+    # Ana tem duas cargas em andamento (a1 não tem mais pendentes) e Bia uma: a vez é da Bia
+    fila.submeter("a2", "ana", grupos()[:2], {})
+    assert fila.reservar()[0] == "b1"
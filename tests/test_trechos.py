@@ -0,0 +1,139 @@
+import pytest
+
+from roteirizador.ors_simulado import rota_sintetica
+from roteirizador.trechos import ClienteTrechos, PlanoTrechos, inverter_resposta, juntar_respostas
+
+DEPOSITO = [-54.6549, -20.4500]
+FAZENDA_1 = [-54.7680, -20.5500]
+FAZENDA_2 = [-54.9100, -20.6200]
+FAZENDA_3 = [-54.5200, -20.7100]
+
+
+class ClienteSintetico:
+    """Responde cada ``directions`` com a rota sintética do ORS simulado e conta as chamadas."""
+
+    def __init__(self):
+        self.chamadas = 0
+
+    def directions(self, coordinates, **kwargs):
+        self.chamadas += 1
+        return rota_sintetica(coordinates)
+
+
+def superficie_por_segmento(resposta):
+    propriedades = resposta['features'][0]['properties']
+    segmentos = []
+    for inicio, fim, valor in propriedades['extras']['surface']['values']:
+        assert inicio == len(segmentos), "trechos de superfície com buraco ou sobreposição"
+        segmentos.extend([valor] * (fim - inicio))
+    return segmentos
+
+
+def geometria(resposta):
+    return resposta['features'][0]['geometry']['coordinates']
+
+
+def propriedades(resposta):
+    return resposta['features'][0]['properties']
+
+
+# --- MONTAGEM ---
+
+
+def test_juntar_respostas_equivale_a_rota_com_varias_paradas():
+    paradas = [DEPOSITO, FAZENDA_1, FAZENDA_2, FAZENDA_3]
+    inteira = rota_sintetica(paradas)
+    partes = [rota_sintetica(paradas[:2]), rota_sintetica(paradas[1:3]), rota_sintetica(paradas[2:])]
+
+    juntada = juntar_respostas(partes)
+
+    assert geometria(juntada) == geometria(inteira)
+    assert propriedades(juntada)['way_points'] == propriedades(inteira)['way_points']
+    assert propriedades(juntada)['summary']['distance'] == pytest.approx(
+        propriedades(inteira)['summary']['distance'], abs=1.0
+    )
+    assert juntada['bbox'] == pytest.approx(inteira['bbox'])
+    # As superfícies de cada parte, deslocadas para os índices da geometria juntada
+    esperado = [valor for parte in partes for valor in superficie_por_segmento(parte)]
+    assert superficie_por_segmento(juntada) == esperado
+    assert len(esperado) == len(geometria(juntada)) - 1
+
+
+def test_juntar_respostas_funde_superficies_iguais_na_juncao():
+    ida = rota_sintetica([DEPOSITO, FAZENDA_1])
+    valores = propriedades(juntar_respostas([ida, inverter_resposta(ida)]))['extras']['surface']['values']
+
+    # A última superfície da ida é a primeira da volta: um trecho só, sem corte na parada
+    assert all(a[2] != b[2] for a, b in zip(valores[:-1], valores[1:]))
+
+
+def test_inverter_resposta_equivale_a_rota_de_volta():
+    ida = rota_sintetica([DEPOSITO, FAZENDA_1])
+    volta = rota_sintetica([FAZENDA_1, DEPOSITO])
+
+    invertida = inverter_resposta(ida)
+
+    assert len(geometria(invertida)) == len(geometria(volta))
+    for ponto, esperado in zip(geometria(invertida), geometria(volta)):
+        assert ponto == pytest.approx(esperado)
+    assert propriedades(invertida)['way_points'] == propriedades(volta)['way_points']
+    assert superficie_por_segmento(invertida) == superficie_por_segmento(ida)[::-1]
+    # A resposta original não é alterada e inverter duas vezes a devolve
+    assert geometria(ida)[0] == DEPOSITO
+    assert inverter_resposta(invertida) == ida
+
+
+# --- PLANO E CHAMADAS ---
+
+
+def test_plano_separa_trecho_repetido_so_quando_poupa_chamadas():
+    cargas = [[DEPOSITO, FAZENDA_1], [DEPOSITO, FAZENDA_1], [DEPOSITO, FAZENDA_1, FAZENDA_2]]
+
+    plano = PlanoTrechos(cargas)
+
+    assert plano.separado(DEPOSITO, FAZENDA_1)
+    assert not plano.separado(FAZENDA_1, FAZENDA_2)
+    # Um trecho separado para as três cargas e uma chamada para o resto da terceira
+    assert plano.chamadas_planejadas == 2
+
+
+def test_plano_nao_separa_trecho_no_meio_das_cargas():
+    # Separar o trecho do meio partiria cada carga em três chamadas
+    cargas = [[FAZENDA_3, DEPOSITO, FAZENDA_1, FAZENDA_2], [FAZENDA_2, DEPOSITO, FAZENDA_1, FAZENDA_3]]
+
+    plano = PlanoTrechos(cargas)
+
+    assert not plano.separado(DEPOSITO, FAZENDA_1)
+    assert plano.chamadas_planejadas == len(cargas)
+
+
+def test_plano_reversivel_junta_ida_e_volta():
+    cargas = [[DEPOSITO, FAZENDA_1], [FAZENDA_1, DEPOSITO]]
+
+    assert PlanoTrechos(cargas).chamadas_planejadas == 2
+    assert PlanoTrechos(cargas, reversiveis=True).chamadas_planejadas == 1
+
+
+@pytest.mark.parametrize("reversiveis", [False, True])
+def test_cliente_faz_as_chamadas_planejadas(reversiveis):
+    cargas = [
+        [DEPOSITO, FAZENDA_1],
+        [DEPOSITO, FAZENDA_1, FAZENDA_2],
+        [FAZENDA_1, DEPOSITO],
+        [DEPOSITO, FAZENDA_1, FAZENDA_3],
+        [FAZENDA_2, FAZENDA_3],
+    ]
+    plano = PlanoTrechos(cargas, reversiveis)
+    client = ClienteSintetico()
+    trechos = ClienteTrechos(client, plano)
+
+    for paradas in cargas:
+        resposta = trechos.directions(coordinates=paradas, profile='driving-hgv', format='geojson')
+        inteira = rota_sintetica(paradas)
+        assert propriedades(resposta)['way_points'] == propriedades(inteira)['way_points']
+        for ponto, esperado in zip(geometria(resposta), geometria(inteira)):
+            assert ponto == pytest.approx(esperado)
+
+    # Sem inversão o trecho depósito -> fazenda 1 não compensa (só uma carga é ele inteiro); com ela, sim
+    assert plano.chamadas_planejadas == (4 if reversiveis else len(cargas))
+    assert client.chamadas == plano.chamadas_planejadas
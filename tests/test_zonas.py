@@ -0,0 +1,99 @@
+import pytest
+
+from roteirizador.distancias import haversine_m
+from roteirizador.zonas import FATOR_ESTRADA, RegistroZonas, _margem_graus, _recortar_anel
+
+QUADRADO = [(0.0, 0.0), (2.0, 0.0), (2.0, 2.0), (0.0, 2.0), (0.0, 0.0)]
+
+CAMPO_GRANDE = [-54.6200, -20.4700]
+FAZENDA = [-54.7680, -20.5500]
+CORUMBA = [-57.6530, -19.0090]
+
+MANGA = {
+    "type": "FeatureCollection",
+    "features": [{
+        "type": "Feature",
+        "properties": {"tipo": "zona", "nome": "Porto da Manga", "margem_km": 20},
+        "geometry": {"type": "Polygon", "coordinates": [[
+            [-57.2634, -19.2897], [-57.2034, -19.2897], [-57.2034, -19.2297], [-57.2634, -19.2297], [-57.2634, -19.2897]
+        ]]},
+    }],
+}
+
+
+def vertices(anel):
+    """Vértices do anel fechado, sem a repetição do primeiro e sem depender de onde começa."""
+    assert anel[0] == anel[-1], "anel não fechado"
+    return sorted((round(p[0], 9), round(p[1], 9)) for p in anel[:-1])
+
+
+# --- RECORTE (SUTHERLAND–HODGMAN) ---
+
+
+def test_recorte_mantem_anel_dentro_da_janela():
+    assert vertices(_recortar_anel(QUADRADO, -1, -1, 3, 3)) == vertices(QUADRADO)
+
+
+def test_recorte_corta_nas_bordas_da_janela():
+    recortado = _recortar_anel(QUADRADO, 1, -1, 3, 1)
+
+    assert vertices(recortado) == [(1, 0), (1, 1), (2, 0), (2, 1)]
+
+
+def test_recorte_de_triangulo_gera_pontos_nas_bordas():
+    triangulo = [(0.0, 0.0), (4.0, 0.0), (0.0, 4.0)]
+
+    recortado = _recortar_anel(triangulo, 1, 1, 5, 5)
+
+    # Só o canto (1, 1)-(3, 1)-(1, 3) do triângulo fica dentro da janela
+    assert vertices(recortado) == [(1, 1), (1, 3), (3, 1)]
+
+
+def test_recorte_aceita_anel_aberto():
+    assert vertices(_recortar_anel(QUADRADO[:-1], -1, -1, 3, 3)) == vertices(QUADRADO)
+
+
+def test_recorte_fora_da_janela_devolve_none():
+    assert _recortar_anel(QUADRADO, 5, 5, 6, 6) is None
+    assert _recortar_anel(QUADRADO, -3, 0.5, -1, 1.5) is None
+
+
+# --- LIMITE DE AVOID_POLYGONS ---
+
+
+def test_longa_para_poligonos_pela_linha_reta_com_fator_de_estrada():
+    assert not RegistroZonas.longa_para_poligonos([CAMPO_GRANDE, FAZENDA])
+    assert RegistroZonas.longa_para_poligonos([CORUMBA, CAMPO_GRANDE])
+
+
+def test_longa_para_poligonos_soma_os_trechos_e_respeita_o_limite():
+    paradas = [CAMPO_GRANDE, FAZENDA, CAMPO_GRANDE]
+    estimada = float(haversine_m(CAMPO_GRANDE[0], CAMPO_GRANDE[1], FAZENDA[0], FAZENDA[1])) * 2 * FATOR_ESTRADA
+
+    assert RegistroZonas.longa_para_poligonos(paradas, limite_m=estimada - 100)
+    assert not RegistroZonas.longa_para_poligonos(paradas, limite_m=estimada + 100)
+
+
+# --- POLÍGONOS ENVIADOS ---
+
+
+def test_poligonos_evitar_recorta_a_zona_ao_corredor():
+    registro = RegistroZonas.de_geojson(MANGA)
+    paradas = [[-57.05, -19.30], [-57.00, -19.20]]
+    margem_lon, _ = _margem_graus(20, -19.25)
+
+    zonas = registro.zonas_no_corredor(paradas)
+    poligonos = registro.poligonos_evitar(zonas, paradas)
+
+    assert [z.nome for z in zonas] == ["Porto da Manga"]
+    anel = poligonos["coordinates"][0][0]
+    assert anel[0] == anel[-1]
+    # O lado oeste da zona fica fora da janela (corredor + 20 km) e é cortado na borda dela
+    assert min(p[0] for p in anel) == pytest.approx(-57.05 - margem_lon)
+    assert max(p[0] for p in anel) == pytest.approx(-57.2034)
+
+
+def test_poligonos_evitar_sem_zona_na_janela():
+    registro = RegistroZonas.de_geojson(MANGA)
+
+    assert registro.poligonos_evitar(registro.zonas, [CAMPO_GRANDE, FAZENDA]) is None